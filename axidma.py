@@ -32,10 +32,19 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from pynq.lib.dma import DMA
-from pynq import allocate
 import numpy as np
 
+# The receive ring only needs a channel and a buffer factory, so let it import without pynq
+#  (e.g. to exercise it against a stand-in channel on a host PC)
+try :
+    from pynq.lib.dma import DMA
+    from pynq import allocate
+except ImportError :
+    allocate = None
+    class DMA :
+        def __init__(self, description) :
+            raise RuntimeError('SimpleDmaDriver requires pynq')
+
 class CmaBufferFactory():
     def __init__(self):
         pass
@@ -47,6 +56,58 @@ class CmaBufferFactory():
     def del_cma_buf(self, cma_buf):
         cma_buf.close()
 
+"""
+Round robin set of CMA receive buffers for streaming a long transfer in packets.
+As soon as packet N lands the transfer of packet N+1 is armed into the next buffer, the caller
+then copies packet N out while the PL keeps streaming.  A simple mode AXI DMA channel only runs
+one transfer at a time, so two buffers are enough to hide the copy, more only add slack.
+channel needs transfer(buf) and wait(), buf_factory needs make_cma_buf/del_cma_buf
+"""
+class DmaRxRing():
+    def __init__(self, channel, buf_factory, n_bufs=2):
+        assert n_bufs >= 2, RuntimeError
+        self._channel = channel
+        self._factory = buf_factory
+        self._n_bufs = n_bufs
+        self._shape = None
+        self._dtype = None
+        self.bufs = []
+
+    def resize(self, shape, dtype, n_bufs=None):
+        n_bufs = self._n_bufs if n_bufs == None else n_bufs
+        assert n_bufs >= 2, RuntimeError
+        # CMA allocation is slow, only redo it when the geometry changes
+        if self.bufs != [] and self._shape == tuple(shape) and self._dtype == np.dtype(dtype) and self._n_bufs == n_bufs :
+            return
+        self.free()
+        self._n_bufs = n_bufs
+        self._shape = tuple(shape)
+        self._dtype = np.dtype(dtype)
+        for i in range(n_bufs) :
+            self.bufs.append(self._factory.make_cma_buf(shape, dtype))
+
+    def free(self):
+        for buf in self.bufs :
+            self._factory.del_cma_buf(buf)
+        self.bufs = []
+
+    def stream(self, n_pkts, pkt_size, last_pkt_size=0):
+        """
+        Generator, yields each received packet in order as a view of a ring buffer.  The view is
+        only valid until the next packet is requested, copy it out before iterating again
+        """
+        assert self.bufs != [], RuntimeError
+        n_total = n_pkts + (1 if last_pkt_size > 0 else 0)
+        if n_total == 0 :
+            return
+        self._channel.transfer(self.bufs[0])
+        for i in range(n_total) :
+            self._channel.wait()
+            buf = self.bufs[i % self._n_bufs]
+            if i + 1 < n_total :
+                self._channel.transfer(self.bufs[(i + 1) % self._n_bufs])
+            yield buf[0:pkt_size] if i < n_pkts else buf[0:last_pkt_size]
+
 """
 This class hides the details of the CMA buffers and DMA itself.
 This class can be used with any compatible IP block connected to the DMA.
@@ -58,6 +119,7 @@ class SimpleDmaDriver(DMA, CmaBufferFactory):
         CmaBufferFactory.__init__(self)
         self.txbuf = []
         self.rxbuf = []
+        self.rxring = None
         
     bindto = ['xilinx.com:ip:axi_dma:7.1']
     
@@ -65,14 +127,25 @@ class SimpleDmaDriver(DMA, CmaBufferFactory):
         assert which == 'rx' or which == 'tx' or which == 'both', RuntimeError
         assert shape != [], RuntimeError
         if which == 'tx' or which == 'both' :
-            if self.txbuf != [] :
+            if len(self.txbuf) > 0 :
                 self.del_cma_buf(self.txbuf)
             self.txbuf = self.make_cma_buf(shape, dtype)
         if which == 'rx' or which == 'both' :
-            if self.rxbuf != [] :
+            if len(self.rxbuf) > 0 :
                 self.del_cma_buf(self.rxbuf)
             self.rxbuf = self.make_cma_buf(shape, dtype)
 
+    def resize_rx_ring(self, shape, dtype, n_bufs=2):
+        if self.rxring == None :
+            self.rxring = DmaRxRing(self.recvchannel, self, n_bufs)
+        self.rxring.resize(shape, dtype, n_bufs)
+
+    def rcv_stream(self, n_pkts, pkt_size, last_pkt_size=0):
+        """
+        Receive n_pkts packets plus an optional short one, double buffered, see DmaRxRing.stream
+        """
+        return self.rxring.stream(n_pkts, pkt_size, last_pkt_size)
+
     def send_dma(self, wait=True):
         self.send_cma_buf(self.txbuf, wait)
         
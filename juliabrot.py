@@ -33,12 +33,25 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import os, copy, struct
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from fractions import Fraction
+from decimal import Decimal, localcontext
+import juliabrot_cfg
+import juliabrot_trace as jtrace
 #from fxpmath import Fxp
-from IPython.display import clear_output
 from datetime import datetime
 import zlib
 import json
+import hashlib
+
+# Progress bars are drawn in a notebook, allow import on headless hosts without IPython
+try :
+    from IPython.display import clear_output
+except ImportError :
+    clear_output = None
 
 # This can be used to determine if this module is not being run on a PYNQ host
 #  Nothing is currently implemented to do that though!
@@ -55,10 +68,143 @@ try :
 except :
     pass
 
+def update_progress(progress) :
+    # Thank you Bartosz
+    bar_length = 20
+    if isinstance(progress, int) :
+        progress = float(progress)
+    if not isinstance(progress, float) :
+        progress = 0
+    if progress < 0 :
+        progress = 0
+    if progress >= 1 :
+        progress = 1
+    block = int(round(bar_length * progress))
+    if clear_output != None :
+        clear_output(wait = True)
+    text = "Progress: [{0}] {1:.1f}%".format( "#" * block + "-" * (bar_length - block), progress * 100)
+    print(text)
+
+def to_exact(x) :
+    '''
+    Exact rational value of a coordinate: np.longdouble, float and int convert without rounding,
+    strings are read as exact decimals ("-1.75874698818") or ratios ("3/7")
+    '''
+    if isinstance(x, Fraction) :
+        return x
+    if isinstance(x, (int, np.integer)) :
+        return Fraction(int(x))
+    if isinstance(x, str) :
+        return Fraction(x)
+    return Fraction(*np.longdouble(x).as_integer_ratio())
+
+def to_longdouble(x) :
+    '''
+    Rounds a coordinate to the nearest np.longdouble, Fractions are not sent through a double
+    '''
+    if not isinstance(x, Fraction) :
+        return np.longdouble(x)
+    n = x.numerator
+    d = x.denominator
+    if n == 0 :
+        return np.longdouble(0)
+    sign = -1 if n < 0 else 1
+    n = abs(n)
+    bits = np.finfo(np.longdouble).nmant + 1
+    s = bits - (n.bit_length() - d.bit_length())
+    q = ((n << s) * 2 + d) // (2 * d) if s >= 0 else ((n * 2) + (d << -s)) // (2 * d << -s)
+    if q.bit_length() > bits :
+        s -= 1
+        q = ((n << s) * 2 + d) // (2 * d) if s >= 0 else ((n * 2) + (d << -s)) // (2 * d << -s)
+    # q now fits the mantissa, so assembling it 32 bits at a time is exact
+    r = np.longdouble(0)
+    shift = 0
+    while q > 0 :
+        r += np.ldexp(np.longdouble(q & 0xffffffff), shift)
+        q >>= 32
+        shift += 32
+    return sign * np.ldexp(r, -s)
+
+def aligned_tile(engine, in_tile) :
+    '''
+    The tile to hand to engine for in_tile.  The PL pads a tile to its column multiple by
+    widening the grid, which changes the pixel step, so a tile that needs padding comes back
+    as a tile over a copy of the settings widened with the same step.  The copy is exact so
+    the widened lrX does not round the step of a longdouble grid.  Crop its iterations to
+    in_tile's columns afterwards
+    '''
+    a = int(engine._read_N()) if hasattr(engine, '_read_N') else 1
+    limits = [int(l) for l in in_tile.limits]
+    pad = -(limits[2] - limits[0] + 1) % a
+    if pad == 0 :
+        return in_tile
+    settings = copy.copy(in_tile.grid)
+    if limits[2] + pad + 1 > int(settings.sizeX) :
+        settings.set_precision('exact')
+        h = settings.h_step()
+        settings.sizeX = limits[2] + pad + 1
+        settings.lrX = settings.coord(settings.ulX + h * settings.sizeX)
+    grid = JuliabrotGrid(settings)
+    grid.tile_list = []
+    return JuliabrotTile(grid, (limits[0], limits[1], limits[2] + pad, limits[3]))
+
+def compute_aligned(engine, in_tile, in_progress_report=False) :
+    '''
+    engine.compute(in_tile) through aligned_tile: in_tile keeps its limits (and its grid its
+    size) and gets iterations of its own size
+    '''
+    work = aligned_tile(engine, in_tile)
+    engine.compute(work, in_progress_report)
+    return crop_aligned(in_tile, work)
+
+def crop_aligned(in_tile, work) :
+    '''
+    Gives in_tile the iterations of work, its computed aligned_tile, cropped to in_tile's size
+    '''
+    if work is not in_tile :
+        data = JuliabrotData()
+        it = np.asarray(work.data.iterations).reshape(int(in_tile.sizeY), -1)
+        data.iterations = np.ascontiguousarray(it[:, :int(in_tile.sizeX)])
+        work.free_data()
+        in_tile.free_data()
+        in_tile.data = data
+    return in_tile
+
 class JuliabrotData :
     def __init__(self) :
         self.iterations = None
         self.z = None
+        # Set when iterations is a view of a CMA (DMA) buffer owned by this object
+        self._cma_buf = None
+        self._cma_factory = None
+        # Set when iterations is a view of a shared-memory segment owned by this object
+        self._shm = None
+
+    def set_cma_buf(self, cma_buf, factory) :
+        self._cma_buf = cma_buf
+        self._cma_factory = factory
+
+    def set_shared_mem(self, shm) :
+        self._shm = shm
+
+    def free(self) :
+        # Contiguous memory is scarce, give DMA buffers back right away instead of waiting on GC
+        self.iterations = None
+        self.z = None
+        if self._cma_buf is not None :
+            self._cma_factory.del_cma_buf(self._cma_buf)
+            self._cma_buf = None
+            self._cma_factory = None
+        if self._shm is not None :
+            self._shm.close()
+            self._shm = None
+
+    def __deepcopy__(self, memo) :
+        # Copies never own the DMA buffer or the shared memory, they get plain arrays
+        data = JuliabrotData()
+        data.iterations = None if self.iterations is None else np.array(self.iterations)
+        data.z = copy.deepcopy(self.z, memo)
+        return data
 
 class JuliabrotGrid :
     def __init__(self, grid_settings, json_name=None) :
@@ -74,7 +220,6 @@ class JuliabrotGrid :
         # Proportionally change all tiles attached and scrub data
         for tile in self.tile_list :
             tile.scale(X, Y)
-            tile.data = None
 
 class JuliabrotGridSettings :
     def __init__(self) :
@@ -95,9 +240,48 @@ class JuliabrotGridSettings :
         self.sat = 1.0
         self.modulo = 255
         self.m_color = "#000000"
+        # 'longdouble' or 'exact', exact keeps the corners and Julia point as Fractions so zooms
+        #  can go past 80 bits (the config packet carries 253 fractional bits)
+        self.precision = 'longdouble'
         self._pre_json_save = None
         self._post_json_load = None
 
+    def set_precision(self, precision) :
+        assert precision == 'longdouble' or precision == 'exact', 'precision must be longdouble or exact'
+        self.precision = precision
+        for name in ('ulX', 'ulY', 'lrX', 'lrY', 'cX', 'cY') :
+            if getattr(self, name) is not None :
+                setattr(self, name, self.coord(getattr(self, name)))
+
+    def coord(self, x) :
+        '''
+        Converts a number to this grid's coordinate type
+        '''
+        if self.precision == 'exact' :
+            return to_exact(x)
+        return to_longdouble(x)
+
+    def h_step(self) :
+        # Square pixels, the vertical step is the same
+        if self.precision == 'exact' :
+            return (to_exact(self.lrX) - to_exact(self.ulX)) / int(self.sizeX)
+        return (self.lrX - self.ulX) / self.sizeX
+
+    def coord_str(self, x) :
+        '''
+        Readable decimal for display, exact coordinates get enough digits to resolve a pixel
+        '''
+        if self.precision != 'exact' :
+            return str(x)
+        x = to_exact(x)
+        h = abs(self.h_step())
+        digits = 20
+        if h != 0 :
+            digits = max(digits, len(str(h.denominator // max(h.numerator, 1))) + 6)
+        with localcontext() as ctx :
+            ctx.prec = digits
+            return str(Decimal(x.numerator) / Decimal(x.denominator))
+
     def save_json(self, path, color_mode, desc, hue, val, sat, modulo, m_color):
         self._to_json(0, 0, color_mode, desc, hue, val, sat, modulo, m_color)
         now = datetime.now()
@@ -112,6 +296,16 @@ class JuliabrotGridSettings :
                 + str(self.ulY) + str(self.lrX) + str(self.lrY) + str(self.cX) + str(self.cY) + str(self.mandelbrot_mode)
         return hex(zlib.crc32(s.encode()))
 
+    def _gen_hash(self) :
+        '''
+        sha256 of everything that decides the iteration counts, coordinates go in as exact
+        ratios so a longdouble and an exact grid at the same spot hash the same
+        '''
+        s = [int(self.sizeX), int(self.sizeY), int(self.max_iterations), bool(self.mandelbrot_mode)]
+        for x in (self.ulX, self.ulY, self.lrX, self.lrY, self.cX, self.cY) :
+            s.append(str(to_exact(x)))
+        return hashlib.sha256(repr(s).encode()).hexdigest()
+
     def _to_json(self, n_word, n_frac, color_mode, desc, hue, val, sat, modulo, m_color) :
         comments = "color desc: " + str(desc)
         
@@ -119,7 +313,7 @@ class JuliabrotGridSettings :
             "sizeX" : self.sizeX,
             "sizeY" : self.sizeY,
             "max_iterations" : self.max_iterations,
-            "precision:" : "longdouble",
+            "precision:" : self.precision,
             "ulX" : str(self.ulX),
             "ulY" : str(self.ulY),
             "lrX" : str(self.lrX),
@@ -148,12 +342,16 @@ class JuliabrotGridSettings :
         self.sizeX = s["sizeX"]
         self.sizeY = s["sizeY"]
         self.max_iterations = s["max_iterations"]
-        self.ulX = np.longdouble(s["ulX"])
-        self.ulY = np.longdouble(s["ulY"])
-        self.lrX = np.longdouble(s["lrX"])
-        self.lrY = np.longdouble(s["lrY"])
-        self.cX  = np.longdouble(s["cX"])
-        self.cY  = np.longdouble(s["cY"])
+        # Exact files store "p/q" ratios, read the decimal strings of older files as longdouble
+        self.precision = s.get("precision:", "longdouble")
+        if self.precision != 'exact' :
+            self.precision = 'longdouble'
+        self.ulX = self.coord(s["ulX"])
+        self.ulY = self.coord(s["ulY"])
+        self.lrX = self.coord(s["lrX"])
+        self.lrY = self.coord(s["lrY"])
+        self.cX  = self.coord(s["cX"])
+        self.cY  = self.coord(s["cY"])
         self.mandelbrot_mode = s["mandelbrot_mode"]
         self.kernel_mode = s["kernel_mode"]
         self.color_mode = s["color"]["mode"]
@@ -170,11 +368,14 @@ class JuliabrotTile :
         self.grid = grid.settings
         self.sizeX = None  # set_size will set both X and Y
         self.sizeY = None
+        self.data = None
         self.set_size(limits)
         # Add self to grid tile list
         grid.tile_list.append(self)
         
     def free_data(self) :
+        if self.data != None :
+            self.data.free()
         self.data = None
 
     def set_size(self, limits) :
@@ -255,28 +456,34 @@ class JuliabrotTile :
             print("Warn: edge ul Y of tile off grid!")
         assert self.sizeX > 0 and self.sizeY > 0, 'Cannot shrink tiles!'
 
-# Depends on pynq, must only be used locally on a PYNQ board/system
+# Depends on pynq, must only be used locally on a PYNQ board/system (or with juliabrot_emu.EmuOverlay)
 class Juliabrot :
     
-    def __init__(self, deepMode) :
+    def __init__(self, deepMode, n_rx_bufs=2, zero_copy=False, max_in_flight=4, overlay=None) :
     #  64 - 6x kernels @ 64bits, 95 - 4x kernels @ 95 bits, 160 - 1x kernels @ 160bits (@ 300MHz)
     #  64 is the fastest, 160 the highest precision
     # PYNQ Z1-Z2 boards have 1 overlay for 3x kernels @ 64 bits @ 125MHz
-        if os.environ['BOARD'] == 'Ultra96' :
-            if deepMode == 64 :
-                overlay_name = './overlays/juliabrot96b.bit'
-            elif deepMode == 95 :
-                overlay_name = './overlays/juliabrot96b_mid.bit'
-            elif deepMode == 160 :
-                overlay_name = './overlays/juliabrot96b_deep.bit'
+    # zero_copy: DMA each tile straight into one CMA buffer that becomes tile.data.iterations,
+    #  release it with tile.free_data() (contiguous memory is limited, a 16K x 16K tile needs 1GiB)
+    # max_in_flight: number of submit()'ed configs allowed to queue in the PL ahead of their fetch
+    # overlay: an already loaded overlay to use instead of the board's bitstream, e.g. the
+    #  juliabrot_emu.EmuOverlay software stand-in (deepMode is then not used)
+        if overlay == None :
+            if os.environ['BOARD'] == 'Ultra96' :
+                if deepMode == 64 :
+                    overlay_name = './overlays/juliabrot96b.bit'
+                elif deepMode == 95 :
+                    overlay_name = './overlays/juliabrot96b_mid.bit'
+                elif deepMode == 160 :
+                    overlay_name = './overlays/juliabrot96b_deep.bit'
+                else :
+                    overlay_name = './overlays/juliabrot96b_mid.bit'
+            elif os.environ['BOARD'] == 'ZUBoard_1CG' :
+                overlay_name = './overlays/juliabrotzu1.bit'
             else :
-                overlay_name = './overlays/juliabrot96b_mid.bit'
-        elif os.environ['BOARD'] == 'ZUBoard_1CG' :
-            overlay_name = './overlays/juliabrotzu1.bit'
-        else :
-            # Should work for Z1 and Z2 (doesn't use any external I/O)
-            overlay_name = './overlays/juliabrotz1.bit'
-        overlay = Overlay(overlay_name)
+                # Should work for Z1 and Z2 (doesn't use any external I/O)
+                overlay_name = './overlays/juliabrotz1.bit'
+            overlay = Overlay(overlay_name)
         self._X = []
         self._Y = []
         self._tile = []
@@ -287,6 +494,15 @@ class Juliabrot :
         self._pktSize = []
         self._lastPktSize = []
         self._n_configs = 0
+        # Guards the config queue, configs and fetches may run on different threads (see submit)
+        self._queue_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._max_in_flight = max_in_flight
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._fetcher = None
+        self._pending = []
+        self._n_rx_bufs = n_rx_bufs
+        self._zero_copy = zero_copy
         self._colorize = overlay.juliabrot_colorize
         # Turn on iter stream output and set modes, this will go away in the future (if I have the time),
         #  these settings will then come from the streaming config instead 1 per requested grid
@@ -300,62 +516,102 @@ class Juliabrot :
         Configs will queue up to the size of the input fifo (about 1K words) until fifo full then this
         method will block until there is room for another config
         '''
-        assert in_tile.sizeX > 0 and in_tile.sizeY > 0
-        # Going to get new data, free up memory now since it will be stale anyways
-        in_tile.data = None
-        cfg, n_pkts, pkt_size, last_pkt_size = self._create_cfg_words(in_tile, pktSize)
-        #print("npkts: " + str(n_pkts) + " pkt size: " + str(pkt_size) + " last pkt: " + str(last_pkt_size))
-        self._config_dma.resize_bufs(shape=(len(cfg),), which='tx', dtype=np.uint32)
-        self._iter_dma.resize_bufs(shape=(pkt_size,), which='rx', dtype=np.uint32)
-        self._config_dma.txbuf[:] = cfg
-        self._config_dma.send_dma()  # This starts the PL to generate the fractal data
-        self._n_configs += 1
-        # Create a queue of settings for fetch to use
-        self._X.append(in_tile.sizeX)
-        self._Y.append(in_tile.sizeY)
-        self._pktSize.append(pkt_size)
-        self._lastPktSize.append(last_pkt_size)
-        self._nPkts.append(n_pkts)
-        self._tile.append(in_tile)
-        
+        self._config_batch([in_tile], pktSize)
+
+    def _config_batch(self, in_tiles, pktSize=-1) :
+        '''
+        Same as _config for several tiles, all of their config packets go out in one TX transfer
+        '''
+        for in_tile in in_tiles :
+            assert in_tile.sizeX > 0 and in_tile.sizeY > 0
+            # Going to get new data, free up memory now since it will be stale anyways
+            in_tile.free_data()
+        with jtrace.span('config', tiles=len(in_tiles)) :
+            cfg, pkts = self._create_cfg_batch(in_tiles, pktSize)
+            # Only reallocate the CMA buffer when the batch size changes
+            if len(self._config_dma.txbuf) != len(cfg) :
+                self._config_dma.resize_bufs(shape=(len(cfg),), which='tx', dtype=np.uint32)
+            self._config_dma.txbuf[:] = cfg
+            with jtrace.span('send_dma') :
+                self._config_dma.send_dma()  # This starts the PL to generate the fractal data
+        jtrace.count('configs', len(in_tiles))
+        # Create a queue of settings for fetch to use, the PL answers configs in order (FIFO)
+        with self._queue_lock :
+            for in_tile, (n_pkts, pkt_size, last_pkt_size) in zip(in_tiles, pkts) :
+                self._n_configs += 1
+                self._X.append(in_tile.sizeX)
+                self._Y.append(in_tile.sizeY)
+                self._pktSize.append(pkt_size)
+                self._lastPktSize.append(last_pkt_size)
+                self._nPkts.append(n_pkts)
+                self._tile.append(in_tile)
+
+    @jtrace.traced('fetch')
     def _fetch_iter(self, progress_report = False) :
         '''
         Retrieves the data generated from a configuration request.  This method will block until the entire
         set is complete.  A numpy array size from the xSetMax,ySetMax config settings will be created.
         If you would like to see a text output progress report, set progress_report True
         '''
-        assert self._n_configs > 0    # IF fires, the PL has not been configured
         data = JuliabrotData()
-        # Acquire the tile and update its attributes
-        tile = self._tile.pop()
+        # Acquire the oldest queued tile and update its attributes
+        with self._queue_lock :
+            assert self._n_configs > 0    # IF fires, the PL has not been configured
+            tile = self._tile.pop(0)
+            xMax = int(self._X.pop(0))
+            yMax = int(self._Y.pop(0))
+            pkt_size = self._pktSize.pop(0)
+            last_pkt_size = self._lastPktSize.pop(0)
+            n_pkts = self._nPkts.pop(0)
         if tile.data != None :
             print("Info: tile already had data: discarding old!")
+            tile.free_data()
         tile.data = data
-        xMax = int(self._X.pop())
-        yMax = int(self._Y.pop())
-        pkt_size = self._pktSize.pop()
-        last_pkt_size = self._lastPktSize.pop()
-        n_pkts = self._nPkts.pop()
-        data.iterations = np.empty((xMax*yMax,), dtype=np.uint32)
+        if self._zero_copy == True :
+            self._fetch_iter_in_place(data, xMax*yMax, n_pkts, pkt_size, last_pkt_size, progress_report)
+        else :
+            data.iterations = np.empty((xMax*yMax,), dtype=np.uint32)
+            # Double buffered: the next packet is already streaming in while this one is copied out
+            self._iter_dma.resize_rx_ring(shape=(pkt_size,), dtype=np.uint32, n_bufs=self._n_rx_bufs)
+            offset = 0
+            # The wait for a packet (PL compute and DMA) and its copy out are traced apart
+            t = jtrace.now()
+            for i, pkt in enumerate(self._iter_dma.rcv_stream(n_pkts, pkt_size, last_pkt_size)) :
+                jtrace.complete('rcv_dma', t)
+                with jtrace.span('copy') :
+                    data.iterations[offset:offset+len(pkt)] = pkt
+                offset += len(pkt)
+                if progress_report == True :
+                    self._update_progress(i / n_pkts)
+                t = jtrace.now()
+            jtrace.count('dma_bytes', offset * 4)
+            if progress_report == True :
+                self._update_progress(1)
+        data.iterations = np.reshape(data.iterations, (yMax, xMax))
+        with self._queue_lock :
+            self._n_configs -= 1
+        return tile
+    
+    def _fetch_iter_in_place(self, data, n_pix, n_pkts, pkt_size, last_pkt_size, progress_report) :
+        '''
+        Zero copy receive, every packet is DMA'd to its offset in a tile sized CMA buffer
+        '''
+        buf = self._iter_dma.make_cma_buf((n_pix,), np.uint32)
+        data.set_cma_buf(buf, self._iter_dma)
         for i in range(n_pkts) :
-            #print("pkt" + str(i))
-            #print(self._read_ncol())
-            #print(self._read_nrow())
-            self._iter_dma.rcv_dma()
-            data.iterations[i*pkt_size:i*pkt_size+pkt_size] = self._iter_dma.rxbuf
+            with jtrace.span('rcv_dma') :
+                self._iter_dma.rcv_cma_buf(buf[i*pkt_size:i*pkt_size+pkt_size])
             if progress_report == True :
                 self._update_progress(i / n_pkts)
         if last_pkt_size > 0 :
-            #print("last small pkt")
-            self._iter_dma.rcv_dma()
-            data.iterations[n_pkts*pkt_size:n_pkts*pkt_size+last_pkt_size] = self._iter_dma.rxbuf[0:last_pkt_size]
+            with jtrace.span('rcv_dma') :
+                self._iter_dma.rcv_cma_buf(buf[n_pkts*pkt_size:n_pkts*pkt_size+last_pkt_size])
+        jtrace.count('dma_bytes', n_pix * 4)
         if progress_report == True :
             self._update_progress(1)
-        data.iterations = np.reshape(data.iterations, (yMax, xMax))
-        self._n_configs -= 1
-        return tile
-    
-    def compute(self, in_tile, in_progress_report=False) :
+        data.iterations = buf
+
+    def _pad_tile(self, in_tile) :
         NK = self._read_N()
         pad = NK - (in_tile.sizeX % NK)
         if pad != NK :
@@ -372,9 +628,91 @@ class Juliabrot :
         #print("tile yul: " + str(in_tile.limits[1]))
         #print("tile xlr: " + str(in_tile.limits[2]))
         #print("tile xlr: " + str(in_tile.limits[3]))
-        self._config(in_tile)
-        tile = self._fetch_iter(in_progress_report)
-        return tile
+
+    def compute(self, in_tile, in_progress_report=False) :
+        # Through the submit queue, so the tile is fetched after anything submit()'ed before it
+        # and no other thread can config or fetch in between
+        return self._submit(in_tile, in_progress_report).result()
+
+    def submit(self, in_tile) :
+        '''
+        Queue a tile and return a concurrent.futures.Future that resolves to the computed tile.
+        Up to max_in_flight configs are sent to the PL ahead of time, results come back in the
+        order the tiles were submitted.  Blocks while max_in_flight tiles are outstanding
+        '''
+        return self._submit(in_tile)
+
+    def _submit(self, in_tile, progress_report=False) :
+        self._in_flight.acquire()
+        try :
+            with self._submit_lock :
+                if self._fetcher == None :
+                    # One fetch thread keeps fetches in config order
+                    self._fetcher = ThreadPoolExecutor(max_workers=1)
+                self._pad_tile(in_tile)
+                self._config(in_tile)
+                future = self._fetcher.submit(self._fetch_submitted, progress_report)
+                self._pending = [f for f in self._pending if not f.done()]
+                self._pending.append(future)
+        except :
+            self._in_flight.release()
+            raise
+        return future
+
+    def submit_batch(self, in_tiles) :
+        '''
+        submit() for many tiles, configs are encoded and sent max_in_flight at a time in one
+        TX transfer each.  Returns a list of futures in the same order as in_tiles
+        '''
+        futures = []
+        for i in range(0, len(in_tiles), self._max_in_flight) :
+            group = in_tiles[i:i+self._max_in_flight]
+            for in_tile in group :
+                self._in_flight.acquire()
+            try :
+                with self._submit_lock :
+                    if self._fetcher == None :
+                        self._fetcher = ThreadPoolExecutor(max_workers=1)
+                    for in_tile in group :
+                        self._pad_tile(in_tile)
+                    self._config_batch(group)
+                    self._pending = [f for f in self._pending if not f.done()]
+                    for in_tile in group :
+                        future = self._fetcher.submit(self._fetch_submitted)
+                        self._pending.append(future)
+                        futures.append(future)
+            except :
+                for in_tile in group :
+                    self._in_flight.release()
+                raise
+        return futures
+
+    def _fetch_submitted(self, progress_report=False) :
+        try :
+            return self._fetch_iter(progress_report)
+        finally :
+            self._in_flight.release()
+
+    async def compute_async(self, in_tile) :
+        '''
+        asyncio flavour of submit, awaits the computed tile
+        '''
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, self.submit, in_tile)
+        return await asyncio.wrap_future(future)
+
+    def wait_all(self) :
+        with self._submit_lock :
+            pending = self._pending
+            self._pending = []
+        for future in pending :
+            future.exception()
+
+    def close(self) :
+        self.wait_all()
+        if self._fetcher != None :
+            self._fetcher.shutdown()
+            self._fetcher = None
 
     def still_computing(self) :
         return self._read_nrow() > 0 and self._read_ncol() > 0
@@ -398,39 +736,6 @@ class Juliabrot :
     def _read_N(self) :
         return self._jb.read(self._jb.register_map.nkOut.address)
     
-    def _longdouble_to_int32_quad(self, x) :
-        b = np.longdouble(x).tobytes()
-        w1 = int.from_bytes(b[0:4], "little")
-        w2 = int.from_bytes(b[4:8], "little")
-        w3 = int.from_bytes(b[8:12], "little")
-        w4 = int.from_bytes(b[12:16], "little")
-        return w1, w2, w3, w4
-    
-    def _to_fixed256(self, x) :
-        i = int(x)
-        f = x - i
-        if i > 3 :
-            i = 3
-        elif i < -3 :
-            i = -3
-        x = i + f
-        # Just truncate and convert to a Q 3.253
-        fxp = int(np.longdouble(x) * (2.0 ** 253))
-        #fxp = Fxp(x, True, 256, 256-3)
-        return fxp
-    
-    def _fixed256_to_int32_oct(self, x) :
-        h = int(x).to_bytes(32, byteorder='big', signed=True).hex()
-        w8 = int(h[0 :  8], base=16)
-        w7 = int(h[8 : 16], base=16)
-        w6 = int(h[16: 24], base=16)
-        w5 = int(h[24: 32], base=16)
-        w4 = int(h[32: 40], base=16)
-        w3 = int(h[40: 48], base=16)
-        w2 = int(h[48: 56], base=16)
-        w1 = int(h[56: 64], base=16)
-        return w1, w2, w3, w4, w5, w6, w7, w8
-    
     def _double_to_int_pair(self, x) :
         b = struct.pack('<%sd' % 1, x)
         l = int.from_bytes(b[0:4], "little")
@@ -438,132 +743,27 @@ class Juliabrot :
         return l, u
     
     def _update_progress(self, progress) :
-        # Thank you Bartosz
-        bar_length = 20
-        if isinstance(progress, int) :
-            progress = float(progress)
-        if not isinstance(progress, float) :
-            progress = 0
-        if progress < 0 :
-            progress = 0
-        if progress >= 1 :
-            progress = 1
-        block = int(round(bar_length * progress))
-        clear_output(wait = True)
-        text = "Progress: [{0}] {1:.1f}%".format( "#" * block + "-" * (bar_length - block), progress * 100)
-        print(text)
+        update_progress(progress)
 
     def _create_cfg_words(self, in_tile, pktSize=-1) :
         """
-        Returns a 32-bit unsigned array of config words.
-
-        The 32-bit config words look like the following:
-
-            [0]     mandelbrotMode - int    (1 - 32-bit word) 0x1, Mandelbrot, 0x0, Julia
-            [1]     xSetMax        - int    (1 - 32-bit word)
-            [2]     ySetMax        - int    (1 - 32-bit word)
-            [ 3 - 10]  ulXIn       - ap_fixed<256, 3> (8 - 32-bit words)
-            [11 - 18]  ulYIn       - ap_fixed<256, 3> (8 - 32-bit words)
-            [19 - 26]  h_stepIn    - ap_fixed<256, 3> (8 - 32-bit words)
-            [27 - 34]  v_stepIn    - ap_fixed<256, 3> (8 - 32-bit words)
-            [35 - 42]  cXIn        - ap_fixed<256, 3> (8 - 32-bit words)
-            [43 - 50]  cYIn        - ap_fixed<256, 3> (8 - 32-bit words)
-            [51]  maxIterIn        - int    (1 - 32-bit word)
-            [52]  pktSize          - int    (1 - 32-bit word)
-
-        Multi-int values must be packed little endian
+        Returns a 32-bit unsigned array of config words (see juliabrot_cfg for the layout),
+        plus the number of packets, packet size and size of the last short packet
         """
         assert in_tile.sizeX <= self._read_xMax()
         assert in_tile.sizeY <= self._read_yMax()
-        cfg = [0] * 53
-        if (in_tile.grid.mandelbrot_mode == True) :
-            cfg[0] = 0x1
-        cfg[1] = int(in_tile.sizeX)
-        cfg[2] = int(in_tile.sizeY)
-        h_step = (in_tile.grid.lrX - in_tile.grid.ulX) * (1 / in_tile.grid.sizeX)
-        w1,w2,w3,w4,w5,w6,w7,w8 = self._fixed256_to_int32_oct(self._to_fixed256(in_tile.grid.ulX + h_step * in_tile.limits[0]))
-        cfg[3] = w1
-        cfg[4] = w2
-        cfg[5] = w3
-        cfg[6] = w4
-        cfg[7] = w5
-        cfg[8] = w6
-        cfg[9] = w7
-        cfg[10] = w8
-        #l,u = self._double_to_int_pair(in_tile.grid.ulX + h_step * in_tile.limits[0])
-        #cfg[3] = l
-        #cfg[4] = u
-        w1,w2,w3,w4,w5,w6,w7,w8 = self._fixed256_to_int32_oct(self._to_fixed256(in_tile.grid.ulY + h_step * in_tile.limits[1]))
-        cfg[11] = w1
-        cfg[12] = w2
-        cfg[13] = w3
-        cfg[14] = w4
-        cfg[15] = w5
-        cfg[16] = w6
-        cfg[17] = w7
-        cfg[18] = w8
-        #l,u = self._double_to_int_pair(in_tile.grid.ulY + h_step * in_tile.limits[1])
-        #cfg[5] = l
-        #cfg[6] = u
-        w1,w2,w3,w4,w5,w6,w7,w8 = self._fixed256_to_int32_oct(self._to_fixed256(h_step))
-        cfg[19] = w1
-        cfg[20] = w2
-        cfg[21] = w3
-        cfg[22] = w4
-        cfg[23] = w5
-        cfg[24] = w6
-        cfg[25] = w7
-        cfg[26] = w8
-#        l,u = self._double_to_int_pair(h_step)
-#        cfg[7] = l
-#        cfg[8] = u
-        w1,w2,w3,w4,w5,w6,w7,w8 = self._fixed256_to_int32_oct(self._to_fixed256(h_step))
-        cfg[27] = w1
-        cfg[28] = w2
-        cfg[29] = w3
-        cfg[30] = w4
-        cfg[31] = w5
-        cfg[32] = w6
-        cfg[33] = w7
-        cfg[34] = w8
-#        l,u = self._double_to_int_pair(h_step)  # Square pixel grid so just re-use h for v_step
-#        cfg[9] = l
-#        cfg[10] = u
-        w1,w2,w3,w4,w5,w6,w7,w8 = self._fixed256_to_int32_oct(self._to_fixed256(in_tile.grid.cX))
-        cfg[35] = w1
-        cfg[36] = w2
-        cfg[37] = w3
-        cfg[38] = w4
-        cfg[39] = w5
-        cfg[40] = w6
-        cfg[41] = w7
-        cfg[42] = w8
-#        l,u = self._double_to_int_pair(in_tile.grid.cX)
-#        cfg[11] = l
-#        cfg[12] = u
-        w1,w2,w3,w4,w5,w6,w7,w8 = self._fixed256_to_int32_oct(self._to_fixed256(in_tile.grid.cY))
-        cfg[43] = w1
-        cfg[44] = w2
-        cfg[45] = w3
-        cfg[46] = w4
-        cfg[47] = w5
-        cfg[48] = w6
-        cfg[49] = w7
-        cfg[50] = w8
-#        l,u = self._double_to_int_pair(in_tile.grid.cY)
-#        cfg[13] = l
-#        cfg[14] = u      
-        cfg[51] = int(in_tile.grid.max_iterations)
-        totalPix = int(in_tile.sizeX*in_tile.sizeY)
-        if pktSize == -1 :
-            if totalPix < 64*1024 :
-                pktSize = int(totalPix)
-            else :
-                pktSize = int(24 * 1024)
-        else :
-            if totalPix < pktSize :
-                pktSize = int(totalPix)
-        nPkts = int(float(totalPix) / pktSize)
-        lastPktSize = int(totalPix - (nPkts * pktSize))
-        cfg[52] = pktSize
-        return cfg, nPkts, pktSize, lastPktSize
+        with jtrace.span('cfg_encode') :
+            cfg, pkts = juliabrot_cfg.create_cfg_words([in_tile], pktSize)
+        nPkts, pktSize, lastPktSize = pkts[0]
+        return cfg[0], nPkts, pktSize, lastPktSize
+
+    def _create_cfg_batch(self, in_tiles, pktSize=-1) :
+        """
+        Config words for several tiles in one contiguous array, one 53 word packet after another
+        """
+        for in_tile in in_tiles :
+            assert in_tile.sizeX <= self._read_xMax()
+            assert in_tile.sizeY <= self._read_yMax()
+        with jtrace.span('cfg_encode', tiles=len(in_tiles)) :
+            cfg, pkts = juliabrot_cfg.create_cfg_words(in_tiles, pktSize)
+        return cfg.reshape(-1), pkts
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import numpy as np
+from juliabrot import JuliabrotData, JuliabrotGrid, JuliabrotTile, update_progress
+from juliabrot_cpu import tile_axes
+
+class JuliabrotMarianiSilver :
+    '''
+    Adaptive renderer (Mariani-Silver subdivision) on top of any compute engine, Juliabrot
+    (PL) or JuliabrotCpu/JuliabrotPerturb.  Only the border of a rectangle is computed, if
+    every border pixel has the same count the inside is filled with it, otherwise the
+    rectangle is split in two and each half is checked the same way.  Rectangles at or below
+    min_size are computed whole.
+    The border pixels of every open rectangle are computed as one round: one compute_points()
+    call for JuliabrotCpu, one compute_pixels() call for JuliabrotPerturb (which keeps the
+    tile's reference orbit across rounds), or sub-tiles for an engine with submit() (the PL),
+    which then get queued all at once.  For the PL, strip columns are nkOut wide and aligned,
+    strips are cut down to their pixels not yet known, and a round that would cost as much as
+    everything still unknown computes that instead.  A tile that is not aligned to nkOut is
+    computed in one go.
+    interior_only=True only fills borders at max_iterations, which is the safe choice for
+    Julia sets that are not connected.  After compute, stats holds the skipped pixel count
+    '''
+    def __init__(self, engine, min_size=8, interior_only=False) :
+        self.engine = engine
+        self.min_size = min_size
+        self.interior_only = interior_only
+        self.stats = {}
+
+    def _align(self) :
+        if hasattr(self.engine, '_read_N') :
+            return int(self.engine._read_N())
+        return 1
+
+    def compute(self, in_tile, in_progress_report=False) :
+        a = self._align()
+        sizeX = int(in_tile.sizeX)
+        sizeY = int(in_tile.sizeY)
+        if (int(in_tile.limits[0]) % a) != 0 or (sizeX % a) != 0 :
+            print("Warn: tile not aligned to x" + str(a) + " columns, computing it whole")
+            self.stats = {'computed' : sizeX * sizeY, 'skipped' : 0, 'skipped_fraction' : 0.0, 'rounds' : 1}
+            return self.engine.compute(in_tile, in_progress_report)
+        in_tile.free_data()
+        max_iter = int(in_tile.grid.max_iterations)
+        out = np.zeros((sizeY, sizeX), dtype=np.uint32)
+        known = np.zeros((sizeY, sizeX), dtype=bool)
+        if hasattr(self.engine, 'compute_points') :
+            xs, ys = tile_axes(in_tile.grid, in_tile.limits, sizeX, sizeY, self.engine.dtype)
+        elif not hasattr(self.engine, 'compute_pixels') :
+            scratch = JuliabrotGrid(in_tile.grid)
+        ox = int(in_tile.limits[0])
+        oy = int(in_tile.limits[1])
+        n_computed = 0
+        n_skipped = 0
+        n_rounds = 0
+        rects = [(0, 0, sizeX - 1, sizeY - 1)]
+        while len(rects) > 0 :
+            n_rounds += 1
+            # Rectangles too small to split are computed whole, the rest need their border
+            strips = []
+            for x0, y0, x1, y1 in rects :
+                if self._is_small(x0, y0, x1, y1, a) :
+                    strips.append((x0, y0, x1, y1))
+                else :
+                    strips += [(x0, y0, x1, y0), (x0, y1, x1, y1),
+                               (x0, y0 + 1, x0 + a - 1, y1 - 1), (x1 - a + 1, y0 + 1, x1, y1 - 1)]
+            if hasattr(self.engine, 'compute_points') or hasattr(self.engine, 'compute_pixels') :
+                need = np.zeros_like(known)
+                for x0, y0, x1, y1 in strips :
+                    need[y0:y1+1, x0:x1+1] = True
+                need &= ~known
+                rows, cols = np.nonzero(need)
+                vals = np.empty(rows.size, dtype=np.uint32)
+                if hasattr(self.engine, 'compute_points') :
+                    self.engine.compute_points(in_tile.grid, xs[cols], ys[rows], vals)
+                else :
+                    self.engine.compute_pixels(in_tile.grid, in_tile.limits, (sizeX, sizeY), rows, cols, vals)
+                out[rows, cols] = vals
+                known |= need
+                n_computed += rows.size
+            else :
+                n_computed += self._compute_strips(scratch, ox, oy, self._trim(strips, known, a), out, known)
+            next_rects = []
+            for x0, y0, x1, y1 in rects :
+                if self._is_small(x0, y0, x1, y1, a) :
+                    continue
+                v = out[y0, x0]
+                border_same = ((out[y0, x0:x1+1] == v).all() and (out[y1, x0:x1+1] == v).all()
+                               and (out[y0:y1+1, x0] == v).all() and (out[y0:y1+1, x1] == v).all())
+                if border_same == True and (self.interior_only == False or v == max_iter) :
+                    inner = ~known[y0+1:y1, x0+1:x1]
+                    n_skipped += int(np.count_nonzero(inner))
+                    out[y0+1:y1, x0+1:x1][inner] = v
+                    known[y0+1:y1, x0+1:x1] = True
+                elif (x1 - x0) >= (y1 - y0) :
+                    mid = x0 + ((x1 - x0 + 1) // (2 * a)) * a
+                    next_rects += [(x0, y0, mid - 1, y1), (mid, y0, x1, y1)]
+                else :
+                    mid = y0 + (y1 - y0 + 1) // 2
+                    next_rects += [(x0, y0, x1, mid - 1), (x0, mid, x1, y1)]
+            rects = next_rects
+            if in_progress_report == True :
+                update_progress(np.count_nonzero(known) / known.size)
+        data = JuliabrotData()
+        data.iterations = out
+        in_tile.data = data
+        total = sizeX * sizeY
+        self.stats = {'computed' : n_computed, 'skipped' : n_skipped, 'skipped_fraction' : n_skipped / total, 'rounds' : n_rounds}
+        return in_tile
+
+    def _is_small(self, x0, y0, x1, y1, a) :
+        return (x1 - x0 + 1) < max(self.min_size, 4 * a) or (y1 - y0 + 1) < max(self.min_size, 4)
+
+    def _trim(self, strips, known, a) :
+        '''
+        Cuts the strips of a round down to the bounding box of their pixels not yet known (or
+        sent by an earlier strip), widened to whole x a column groups.  When that is no less
+        work than the bounding box of everything still unknown, that box is sent instead
+        '''
+        pending = known.copy()
+        trimmed = []
+        n = 0
+        for x0, y0, x1, y1 in dict.fromkeys(strips) :
+            rows, cols = np.nonzero(~pending[y0:y1+1, x0:x1+1])
+            if rows.size == 0 :
+                continue
+            x1 = -(-(x0 + int(cols.max()) + 1) // a) * a - 1
+            x0 = ((x0 + int(cols.min())) // a) * a
+            y1 = y0 + int(rows.max())
+            y0 = y0 + int(rows.min())
+            pending[y0:y1+1, x0:x1+1] = True
+            trimmed.append((x0, y0, x1, y1))
+            n += (x1 - x0 + 1) * (y1 - y0 + 1)
+        rows, cols = np.nonzero(~known)
+        if rows.size == 0 :
+            return []
+        x0 = (int(cols.min()) // a) * a
+        x1 = -(-(int(cols.max()) + 1) // a) * a - 1
+        if n >= (x1 - x0 + 1) * (int(rows.max()) - int(rows.min()) + 1) :
+            return [(x0, int(rows.min()), x1, int(rows.max()))]
+        return trimmed
+
+    def _compute_strips(self, scratch, ox, oy, strips, out, known) :
+        '''
+        Compute tile local rectangles (x0, y0, x1, y1) into out and mark them known,
+        returns the number of pixels computed
+        '''
+        tiles = [JuliabrotTile(scratch, (ox + x0, oy + y0, ox + x1, oy + y1)) for x0, y0, x1, y1 in strips]
+        if hasattr(self.engine, 'submit') :
+            results = [f.result() for f in [self.engine.submit(t) for t in tiles]]
+        else :
+            results = [self.engine.compute(t) for t in tiles]
+        n = 0
+        for (x0, y0, x1, y1), tile in zip(strips, results) :
+            out[y0:y1+1, x0:x1+1] = np.asarray(tile.data.iterations).reshape(y1 - y0 + 1, x1 - x0 + 1)
+            known[y0:y1+1, x0:x1+1] = True
+            n += (x1 - x0 + 1) * (y1 - y0 + 1)
+            tile.free_data()
+        scratch.tile_list = []
+        return n
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import copy
+import math
+import time
+import queue
+import threading
+import numpy as np
+from fractions import Fraction
+from juliabrot import JuliabrotGrid, update_progress, to_exact, aligned_tile, crop_aligned
+import juliabrot_coloring as jcolor
+from juliabrot_export import PngStreamWriter
+
+def _lerp(a, b, t, exact) :
+    if exact == True :
+        return to_exact(a) + (to_exact(b) - to_exact(a)) * t
+    return a + (b - a) * (np.longdouble(t.numerator) / t.denominator)
+
+def interpolate_settings(a, b, t) :
+    '''
+    Grid settings a fraction t (a Fraction from 0 to 1) of the way from keyframe a to keyframe b.
+    The view width goes geometrically (log scale), the center moves in step with the width so
+    a zoom stays fixed on one point of the plane, cX/cY and max_iterations go linearly.
+    Image size, precision and colors come from a
+    '''
+    exact = a.precision == 'exact'
+    s = copy.copy(a)
+    wa = a.lrX - a.ulX
+    wb = b.lrX - b.ulX
+    if exact == True :
+        wa = to_exact(wa)
+        wb = to_exact(wb)
+    if wa != wb :
+        if exact == True :
+            r = wb / wa
+            L = math.log(r.numerator) - math.log(r.denominator)
+            w = wa * to_exact(np.exp(np.longdouble(float(t) * L)))
+        else :
+            w = wa * np.exp(np.longdouble(t.numerator) / t.denominator * np.log(wb / wa))
+        u = (wa - w) / (wa - wb)
+        if exact == False :
+            u = Fraction(*np.longdouble(u).as_integer_ratio())
+    else :
+        w = wa
+        u = t
+    cx = _lerp((a.ulX + a.lrX) / 2, (b.ulX + b.lrX) / 2, u, exact)
+    cy = _lerp((a.ulY + a.lrY) / 2, (b.ulY + b.lrY) / 2, u, exact)
+    h = w / int(a.sizeX)
+    s.ulX = s.coord(cx - w / 2)
+    s.lrX = s.coord(cx + w / 2)
+    s.ulY = s.coord(cy + h * int(a.sizeY) / 2)
+    s.lrY = s.coord(cy - h * int(a.sizeY) / 2)
+    s.cX = s.coord(_lerp(a.cX, b.cX, t, exact))
+    s.cY = s.coord(_lerp(a.cY, b.cY, t, exact))
+    s.max_iterations = int(round(a.max_iterations + (b.max_iterations - a.max_iterations) * float(t)))
+    return s
+
+class JuliabrotAnimation :
+    '''
+    Zoom/morph sequence defined by keyframes, a list of (frame number, JuliabrotGridSettings)
+    in frame order starting at frame 0.  Frames in between are interpolated (see
+    interpolate_settings).  render() runs the stages of every frame on their own threads so they
+    overlap: settings and config (submit() to the PL, or compute on a software engine), coloring,
+    and writing either a PNG per frame or one raw rgb24 video file, which ffmpeg reads with
+    -f rawvideo -pix_fmt rgb24 -s <sizeX>x<sizeY>.
+    Rendering again to the same path resumes after the last finished frame (PNGs are renamed
+    into place when complete, a raw file is cut back to whole frames).  After render, stats holds
+    the frame counts and frames per second
+    Frames are computed in order, so engine can be a JuliabrotFrameReuse
+    '''
+    def __init__(self, keyframes) :
+        assert len(keyframes) > 0 and keyframes[0][0] == 0, 'Keyframes must start at frame 0'
+        for i in range(1, len(keyframes)) :
+            assert keyframes[i][0] > keyframes[i-1][0], 'Keyframes must be in frame order'
+        self.keyframes = keyframes
+        self.n_frames = keyframes[-1][0] + 1
+        self.stats = {}
+
+    def settings(self, n) :
+        '''
+        Grid settings of frame n
+        '''
+        assert 0 <= n < self.n_frames, 'Frame out of range'
+        for i in range(len(self.keyframes) - 1) :
+            fa, a = self.keyframes[i]
+            fb, b = self.keyframes[i+1]
+            if n < fb :
+                return interpolate_settings(a, b, Fraction(n - fa, fb - fa))
+        return copy.copy(self.keyframes[-1][1])
+
+    def frame_name(self, path, n) :
+        return os.path.join(path, 'frame_%05d.png' % n)
+
+    def _frame_tile(self, engine, n) :
+        # The frame's tile and what to compute for it, padding would stretch the frame's step
+        tile = JuliabrotGrid(self.settings(n)).tile_list[0]
+        return tile, aligned_tile(engine, tile)
+
+    def render(self, engine, path, color_func=jcolor.color_rainbow, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None, fmt='png', queue_depth=4, in_progress_report=False) :
+        '''
+        Renders every frame with engine (Juliabrot or a software engine) to path, a directory of
+        frame_NNNNN.png files for fmt='png' or a single file for fmt='raw'.  queue_depth frames
+        may wait between two stages
+        '''
+        assert fmt == 'png' or fmt == 'raw', 'fmt must be png or raw'
+        first = self.keyframes[0][1]
+        frame_bytes = int(first.sizeX) * int(first.sizeY) * 3
+        if fmt == 'png' :
+            os.makedirs(path, exist_ok=True)
+            todo = [n for n in range(self.n_frames) if not os.path.exists(self.frame_name(path, n))]
+            raw = None
+        else :
+            done = os.path.getsize(path) // frame_bytes if os.path.exists(path) else 0
+            done = min(done, self.n_frames)
+            raw = open(path, 'r+b' if os.path.exists(path) else 'wb')
+            raw.truncate(done * frame_bytes)
+            raw.seek(done * frame_bytes)
+            todo = list(range(done, self.n_frames))
+        skipped = self.n_frames - len(todo)
+        computed = queue.Queue(queue_depth)
+        colored = queue.Queue(queue_depth)
+        stop = threading.Event()
+        workers = [threading.Thread(target=self._compute_stage, args=(engine, todo, computed, stop)),
+                   threading.Thread(target=self._color_stage, args=(len(todo), computed, colored, stop, color_func, h, s, v, modulo, in_colors))]
+        for w in workers :
+            w.start()
+        start = time.perf_counter()
+        rendered = 0
+        try :
+            for i in range(len(todo)) :
+                n, rgb = colored.get()
+                if isinstance(rgb, BaseException) :
+                    raise rgb
+                if raw != None :
+                    raw.write(np.ascontiguousarray(rgb).tobytes())
+                    raw.flush()
+                else :
+                    tmp = self.frame_name(path, n) + '.part'
+                    with PngStreamWriter(tmp, rgb.shape[1], rgb.shape[0]) as png :
+                        png.write_rows(rgb)
+                    os.replace(tmp, self.frame_name(path, n))
+                rendered += 1
+                if in_progress_report == True :
+                    fps = rendered / (time.perf_counter() - start)
+                    update_progress((skipped + rendered) / self.n_frames)
+                    print("Frame " + str(n + 1) + "/" + str(self.n_frames) + ", {0:.2f} fps".format(fps))
+        finally :
+            stop.set()
+            for w in workers :
+                w.join()
+            if raw != None :
+                raw.close()
+        seconds = time.perf_counter() - start
+        self.stats = {'frames' : self.n_frames, 'rendered' : rendered, 'skipped' : skipped,
+                      'seconds' : seconds, 'fps' : rendered / seconds if seconds > 0 else 0.0}
+        return self.stats
+
+    def _put(self, q, item, stop) :
+        # Blocks while the next stage is behind, gives up once the render stopped
+        while stop.is_set() == False :
+            try :
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full :
+                pass
+        return False
+
+    def _get(self, q, stop) :
+        while stop.is_set() == False :
+            try :
+                return q.get(timeout=0.1)
+            except queue.Empty :
+                pass
+        return None
+
+    def _compute_stage(self, engine, todo, out, stop) :
+        for n in todo :
+            try :
+                tile, work = self._frame_tile(engine, n)
+                if hasattr(engine, 'submit') :
+                    # The PL computes ahead (max_in_flight) while earlier frames are fetched
+                    item = engine.submit(work)
+                else :
+                    item = engine.compute(work)
+            except BaseException as e :
+                self._put(out, (n, e, None), stop)
+                return
+            if self._put(out, (n, item, tile), stop) == False :
+                return
+
+    def _color_stage(self, count, in_q, out, stop, color_func, h, s, v, modulo, in_colors) :
+        for i in range(count) :
+            got = self._get(in_q, stop)
+            if got == None :
+                return
+            n, item, tile = got
+            try :
+                if isinstance(item, BaseException) :
+                    raise item
+                crop_aligned(tile, item.result() if hasattr(item, 'result') else item)
+                rgb = jcolor.color_bands(tile, color_func, h, s, v, modulo, in_colors)
+                tile.free_data()
+            except BaseException as e :
+                self._put(out, (n, e), stop)
+                return
+            if self._put(out, (n, rgb), stop) == False :
+                return
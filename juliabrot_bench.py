@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import sys
+import glob
+import copy
+import json
+import time
+import platform
+import argparse
+import resource
+import numpy as np
+import juliabrot
+from juliabrot import JuliabrotGrid, JuliabrotGridSettings
+import juliabrot_coloring as jcolor
+import juliabrot_trace as jtrace
+
+# Catalog color modes with a color function here, the others are benchmarked with rainbow
+_COLOR_FUNCS = {1 : jcolor.color_rainbow, 2 : jcolor.color_classic, 3 : jcolor.color_log, 5 : jcolor.color_rainbow2}
+
+# Higher is better for rates, lower for times and memory
+_RATES = ('pixels_per_s', 'effective_iterations_per_s')
+_COSTS = ('encode_s', 'fetch_s', 'dma_s', 'copy_s', 'color_s')
+
+def available_engines(deep_mode=64) :
+    '''
+    Name -> factory of every engine that can run on this host, the PL only on a PYNQ board.
+    emu is Juliabrot on the emulated overlay (float64 kernel), it times the host side of the PL path.
+    cpu_brute is JuliabrotCpu without the cardioid/bulb and periodicity shortcuts, next to cpu it
+    shows what they save at each iteration limit
+    '''
+    from juliabrot_cpu import JuliabrotCpu
+    from juliabrot_parallel import JuliabrotParallel
+    from juliabrot_perturb import JuliabrotPerturb
+    from juliabrot_emu import EmuOverlay
+    engines = {}
+    if juliabrot.Overlay != None and 'BOARD' in os.environ :
+        engines['pl'] = lambda : juliabrot.Juliabrot(deep_mode)
+    engines['emu'] = lambda : juliabrot.Juliabrot(deep_mode, overlay=EmuOverlay(kernel='float64'))
+    engines['cpu'] = JuliabrotCpu
+    engines['cpu_brute'] = lambda : JuliabrotCpu(interior_check=False, periodicity_tol=-1)
+    engines['parallel'] = JuliabrotParallel
+    engines['perturb'] = JuliabrotPerturb
+    return engines
+
+def load_scenes(path='./catalog') :
+    '''
+    (name, settings) of every catalog preset, in name order
+    '''
+    scenes = []
+    for name in sorted(glob.glob(os.path.join(path, '*.json'))) :
+        settings = JuliabrotGridSettings()
+        settings.load_json(name)
+        scenes.append((os.path.splitext(os.path.basename(name))[0], settings))
+    return scenes
+
+def scene_settings(settings, width=None, max_iter=None) :
+    '''
+    Copy of a preset width pixels wide (same view and aspect) and with max_iter iterations,
+    None keeps the preset's own
+    '''
+    s = copy.copy(settings)
+    if width != None :
+        aspect = float(settings.sizeY) / float(settings.sizeX)
+        s.sizeX = int(width)
+        s.sizeY = max(1, int(round(width * aspect)))
+        s.lrY = s.coord(s.ulY - s.h_step() * s.sizeY)
+    else :
+        s.sizeX = int(s.sizeX)
+        s.sizeY = int(s.sizeY)
+    if max_iter != None :
+        s.max_iterations = int(max_iter)
+    return s
+
+def _peak_rss() :
+    # ru_maxrss is in KiB on Linux (bytes on macOS), pool workers count as children.  It is
+    #  the high-water mark of the whole process, so it is only reported once per run
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+
+def _stage_totals(names) :
+    h = jtrace.histograms()
+    return [h[name]['total_s'] if name in h else 0.0 for name in names]
+
+def _timed_fetch(engine) :
+    '''
+    engine._fetch_iter() and its time split from the trace spans: the waits for DMA packets (PL
+    compute and transfer) and their copy out.  Tracing is turned on for the fetch if it is off
+    '''
+    was_enabled = jtrace.enabled
+    if was_enabled == False :
+        # Only the per stage totals are needed, not the events
+        jtrace.enable(max_events=0)
+    try :
+        dma_0, copy_0 = _stage_totals(('rcv_dma', 'copy'))
+        t0 = time.perf_counter()
+        tile = engine._fetch_iter()
+        fetch_s = time.perf_counter() - t0
+        dma_1, copy_1 = _stage_totals(('rcv_dma', 'copy'))
+    finally :
+        if was_enabled == False :
+            jtrace.disable()
+    return tile, fetch_s, dma_1 - dma_0, copy_1 - copy_0
+
+def bench_scene(engine, settings, repeat=1) :
+    '''
+    Times one compute and colorize of a whole grid, best of repeat.  For the PL the config
+    encode, the whole fetch and, within it, the DMA waits (PL compute and transfer) and the
+    copy out of the packets are timed apart, software engines have None.
+    effective_iterations counts max_iterations for every point that did not escape, including
+    the ones an engine settles without iterating (interior shortcuts, periodicity), so it is the
+    work a brute force loop would do rather than the work done
+    '''
+    best = None
+    for i in range(repeat) :
+        grid = JuliabrotGrid(copy.copy(settings))
+        tile = grid.tile_list[0]
+        encode_s = None
+        fetch_s = None
+        dma_s = None
+        copy_s = None
+        if hasattr(engine, '_config') :
+            # Juliabrot.compute() step by step
+            engine.wait_all()
+            engine._pad_tile(tile)
+            t0 = time.perf_counter()
+            engine._create_cfg_words(tile)
+            encode_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            engine._config(tile)
+            tile, fetch_s, dma_s, copy_s = _timed_fetch(engine)
+            compute_s = time.perf_counter() - t0
+        else :
+            t0 = time.perf_counter()
+            tile = engine.compute(tile)
+            compute_s = time.perf_counter() - t0
+        color_func = _COLOR_FUNCS.get(settings.color_mode, jcolor.color_rainbow)
+        t0 = time.perf_counter()
+        jcolor.color_bands(tile, color_func, settings.hue, settings.sat, settings.val, settings.modulo, [settings.m_color])
+        color_s = time.perf_counter() - t0
+        it = np.asarray(tile.data.iterations)
+        n_pix = it.size
+        # Escaped points did their count of iterations, the rest count as max_iterations
+        n_iter = int(np.minimum(it, int(settings.max_iterations)).sum(dtype=np.int64))
+        tile.free_data()
+        if best == None or compute_s < best['compute_s'] :
+            best = {'compute_s' : compute_s, 'encode_s' : encode_s, 'fetch_s' : fetch_s, 'dma_s' : dma_s, 'copy_s' : copy_s,
+                    'pixels_per_s' : n_pix / compute_s, 'effective_iterations_per_s' : n_iter / compute_s,
+                    'effective_iterations' : n_iter}
+        best['color_s'] = color_s if 'color_s' not in best else min(best['color_s'], color_s)
+    return best
+
+def run(engines=None, widths=(128, 256), iter_limits=(1000, 10000), catalog='./catalog', repeat=1, scenes=None, verbose=True) :
+    '''
+    Benchmarks every catalog scene at every width and iteration limit (None for the preset's) on
+    every engine named in engines (all available by default), returns the results as a dict
+    '''
+    factories = available_engines()
+    if engines == None :
+        engines = list(factories.keys())
+    if scenes == None :
+        scenes = load_scenes(catalog)
+    results = []
+    for name in engines :
+        assert name in factories, 'Engine ' + name + ' not available here'
+        engine = factories[name]()
+        try :
+            for scene, preset in scenes :
+                for width in widths :
+                    for max_iter in iter_limits :
+                        s = scene_settings(preset, width, max_iter)
+                        r = {'scene' : scene, 'engine' : name, 'sizeX' : int(s.sizeX), 'sizeY' : int(s.sizeY),
+                             'max_iterations' : int(s.max_iterations)}
+                        r.update(bench_scene(engine, s, repeat))
+                        results.append(r)
+                        if verbose == True :
+                            print("{0:10s} {1:44s} {2:5d}x{3:<5d} {4:8d} it  {5:10.0f} pix/s  {6:12.0f} eff it/s".format(
+                                  name, scene, r['sizeX'], r['sizeY'], r['max_iterations'], r['pixels_per_s'], r['effective_iterations_per_s']))
+        finally :
+            if hasattr(engine, 'close') :
+                engine.close()
+    return {'host' : {'platform' : platform.platform(), 'machine' : platform.machine(), 'python' : platform.python_version(),
+                      'numpy' : np.__version__, 'cpu_count' : os.cpu_count(), 'board' : os.environ.get('BOARD')},
+            'time' : time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat' : repeat, 'peak_rss' : _peak_rss(), 'results' : results}
+
+def _key(r) :
+    return (r['scene'], r['engine'], r['sizeX'], r['sizeY'], r['max_iterations'])
+
+def compare(results, baseline, tolerance=0.1, min_seconds=0.01) :
+    '''
+    Regressions of results against a baseline (both as returned by run), a rate that fell or a
+    time that grew by more than tolerance (a fraction), or a run peak RSS that grew by as much.
+    Times under min_seconds in the baseline are timer noise and not compared.  Returns a list
+    of messages
+    '''
+    base = {_key(r) : r for r in baseline['results']}
+    regressions = []
+    for r in results['results'] :
+        b = base.get(_key(r))
+        if b == None :
+            continue
+        for m in _RATES :
+            if r.get(m) != None and b.get(m) != None and r[m] < b[m] * (1 - tolerance) :
+                regressions.append("{0} {1}: {2} {3:.4g} < baseline {4:.4g}".format(r['engine'], _key(r)[0], m, r[m], b[m]))
+        for m in _COSTS :
+            if m.endswith('_s') and b.get(m) != None and b[m] < min_seconds :
+                continue
+            if r.get(m) != None and b.get(m) != None and r[m] > b[m] * (1 + tolerance) :
+                regressions.append("{0} {1}: {2} {3:.4g} > baseline {4:.4g}".format(r['engine'], _key(r)[0], m, r[m], b[m]))
+    if results.get('peak_rss') != None and baseline.get('peak_rss') != None and results['peak_rss'] > baseline['peak_rss'] * (1 + tolerance) :
+        regressions.append("run: peak_rss {0:.4g} > baseline {1:.4g}".format(results['peak_rss'], baseline['peak_rss']))
+    return regressions
+
+def _int_list(s) :
+    # "1000,0" -> [1000, None], 0 stands for the preset's own value
+    return [int(x) if int(x) != 0 else None for x in s.split(',')]
+
+def main(argv=None) :
+    parser = argparse.ArgumentParser(description='Benchmark the Juliabrot engines on the ./catalog scenes')
+    parser.add_argument('--engines', default=None, help='comma separated: pl,emu,cpu,cpu_brute,parallel,perturb (default all available)')
+    parser.add_argument('--sizes', default='128,256', help='image widths, 0 for the preset size')
+    parser.add_argument('--iters', default='1000,10000', help='max iterations, 0 for the preset value')
+    parser.add_argument('--catalog', default='./catalog')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per scene, the best is kept')
+    parser.add_argument('--out', default='bench.json', help='results JSON file')
+    parser.add_argument('--baseline', default=None, help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown as a fraction')
+    args = parser.parse_args(argv)
+    engines = args.engines.split(',') if args.engines != None else None
+    results = run(engines, _int_list(args.sizes), _int_list(args.iters), args.catalog, args.repeat)
+    with open(args.out, 'w') as write_file :
+        json.dump(results, write_file, indent=1)
+    if args.baseline != None :
+        with open(args.baseline, 'r') as read_file :
+            baseline = json.load(read_file)
+        regressions = compare(results, baseline, args.tolerance)
+        for r in regressions :
+            print("Regression: " + r)
+        if len(regressions) > 0 :
+            return 1
+        print("No regressions against " + args.baseline)
+    return 0
+
+if __name__ == '__main__' :
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from juliabrot import JuliabrotData, aligned_tile
+
+class RenderCache :
+    '''
+    LRU cache of computed tiles keyed by content: the grid settings hash (_gen_hash), the tile
+    limits and kernel_mode.  Iterations are kept zlib compressed and the least recently used
+    are evicted once the compressed total passes max_bytes.  With disk_path set, tiles are also
+    written there (evicted oldest first past disk_max_bytes) and found again after a restart
+    '''
+    def __init__(self, max_bytes=64 << 20, disk_path=None, disk_max_bytes=1 << 30, level=1) :
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self.level = level
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_path != None :
+            os.makedirs(disk_path, exist_ok=True)
+
+    def key(self, in_tile) :
+        s = in_tile.grid._gen_hash() + str([int(l) for l in in_tile.limits]) + str(in_tile.grid.kernel_mode)
+        return hashlib.sha256(s.encode()).hexdigest()
+
+    def get(self, in_tile, key=None) :
+        '''
+        Fills in_tile.data from the cache, returns False on a miss
+        '''
+        if key == None :
+            key = self.key(in_tile)
+        with self._lock :
+            entry = self._entries.get(key)
+            if entry != None :
+                self._entries.move_to_end(key)
+        if entry == None :
+            entry = self._disk_get(key)
+            if entry != None :
+                self._insert(key, entry)
+        if entry == None :
+            self.misses += 1
+            return False
+        shape, limits, blob = entry
+        if [int(l) for l in in_tile.limits] != limits :
+            # Not this tile's own limits (an entry stored padded by the PL), compute it again
+            self.misses += 1
+            return False
+        self.hits += 1
+        in_tile.free_data()
+        data = JuliabrotData()
+        data.iterations = np.frombuffer(bytearray(zlib.decompress(blob)), dtype=np.uint32).reshape(shape)
+        in_tile.data = data
+        return True
+
+    def put(self, in_tile, key=None, iterations=None) :
+        '''
+        Caches in_tile under its own limits, iterations (default the tile's) past its columns
+        are cut off
+        '''
+        if key == None :
+            key = self.key(in_tile)
+        limits = [int(l) for l in in_tile.limits]
+        if iterations is None :
+            iterations = in_tile.data.iterations
+        it = np.asarray(iterations, dtype=np.uint32).reshape(limits[3] - limits[1] + 1, -1)
+        it = np.ascontiguousarray(it[:, :limits[2] - limits[0] + 1])
+        entry = (list(it.shape), limits, zlib.compress(it.tobytes(), self.level))
+        self._insert(key, entry)
+        self._disk_put(key, entry)
+
+    def _insert(self, key, entry) :
+        with self._lock :
+            if key in self._entries :
+                self.n_bytes -= len(self._entries.pop(key)[2])
+            self._entries[key] = entry
+            self.n_bytes += len(entry[2])
+            while self.n_bytes > self.max_bytes and len(self._entries) > 1 :
+                self.n_bytes -= len(self._entries.popitem(last=False)[1][2])
+
+    def compute(self, engine, in_tile, in_progress_report=False) :
+        '''
+        in_tile from the cache, or computed with engine and cached
+        '''
+        key = self.key(in_tile)
+        if self.get(in_tile, key) == False :
+            # Computed without letting the PL pad in_tile, so it keeps the limits it is keyed by
+            work = aligned_tile(engine, in_tile)
+            engine.compute(work, in_progress_report)
+            self.put(in_tile, key, work.data.iterations)
+            if work is not in_tile :
+                cols = int(in_tile.limits[2]) - int(in_tile.limits[0]) + 1
+                data = JuliabrotData()
+                data.iterations = np.ascontiguousarray(work.data.iterations.reshape(int(in_tile.sizeY), -1)[:, :cols])
+                work.free_data()
+                in_tile.free_data()
+                in_tile.data = data
+        return in_tile
+
+    def clear(self) :
+        with self._lock :
+            self._entries.clear()
+            self.n_bytes = 0
+
+    def _disk_file(self, key) :
+        return os.path.join(self.disk_path, key + '.jbc')
+
+    def _disk_get(self, key) :
+        if self.disk_path == None or not os.path.exists(self._disk_file(key)) :
+            return None
+        with open(self._disk_file(key), 'rb') as f :
+            header = json.loads(f.readline())
+            blob = f.read()
+        # Keep the file young for the disk LRU
+        os.utime(self._disk_file(key))
+        return (header["shape"], header["limits"], blob)
+
+    def _disk_put(self, key, entry) :
+        if self.disk_path == None :
+            return
+        tmp = self._disk_file(key) + '.tmp'
+        with open(tmp, 'wb') as f :
+            f.write(json.dumps({"shape" : entry[0], "limits" : entry[1]}).encode() + b'\n')
+            f.write(entry[2])
+        os.replace(tmp, self._disk_file(key))
+        files = [os.path.join(self.disk_path, n) for n in os.listdir(self.disk_path) if n.endswith('.jbc')]
+        total = sum(os.path.getsize(n) for n in files)
+        for n in sorted(files, key=os.path.getmtime) :
+            if total <= self.disk_max_bytes :
+                break
+            total -= os.path.getsize(n)
+            os.remove(n)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import math
+import numpy as np
+from fractions import Fraction
+
+"""
+Encoder for the PL config packet, one packet per requested tile:
+
+    [0]     mandelbrotMode - int    (1 - 32-bit word) 0x1, Mandelbrot, 0x0, Julia
+    [1]     xSetMax        - int    (1 - 32-bit word)
+    [2]     ySetMax        - int    (1 - 32-bit word)
+    [ 3 - 10]  ulXIn       - ap_fixed<256, 3> (8 - 32-bit words)
+    [11 - 18]  ulYIn       - ap_fixed<256, 3> (8 - 32-bit words)
+    [19 - 26]  h_stepIn    - ap_fixed<256, 3> (8 - 32-bit words)
+    [27 - 34]  v_stepIn    - ap_fixed<256, 3> (8 - 32-bit words)
+    [35 - 42]  cXIn        - ap_fixed<256, 3> (8 - 32-bit words)
+    [43 - 50]  cYIn        - ap_fixed<256, 3> (8 - 32-bit words)
+    [51]  maxIterIn        - int    (1 - 32-bit word)
+    [52]  pktSize          - int    (1 - 32-bit word)
+
+Multi-int values are packed little endian.  Everything is built straight into uint32 arrays,
+the fixed point conversion of cX/cY works on all values at once with NumPy.  The step and
+tile origins are exact integer arithmetic on the grid corners.
+"""
+
+CFG_N_WORDS = 53
+FIXED_FRAC_BITS = 253
+_WORD_MASK = np.uint64(0xffffffff)
+_MASK256 = (1 << 256) - 1
+_SCALE = np.longdouble(2.0 ** FIXED_FRAC_BITS)
+# Below this many values the NumPy setup costs more than converting one by one
+_N_VECTOR_MIN = 64
+# Mantissa bits of np.longdouble (64 on x86, 113 on aarch64, 53 where it is a double) in 32-bit chunks
+_N_CHUNKS = (np.finfo(np.longdouble).nmant + 32) // 32
+
+def pkt_sizes(total_pix, pktSize=-1) :
+    '''
+    Returns pktSize, nPkts, lastPktSize for a tile of total_pix pixels
+    '''
+    total_pix = int(total_pix)
+    if pktSize == -1 :
+        if total_pix < 64*1024 :
+            pktSize = int(total_pix)
+        else :
+            pktSize = int(24 * 1024)
+    else :
+        if total_pix < pktSize :
+            pktSize = int(total_pix)
+    nPkts = int(float(total_pix) / pktSize)
+    lastPktSize = int(total_pix - (nPkts * pktSize))
+    return pktSize, nPkts, lastPktSize
+
+def _common_ratio(*values) :
+    '''
+    Exact values as integer numerators over one common denominator, np.longdouble and float
+    convert without rounding.  Returns (*numerators, denominator)
+    '''
+    ratios = [(x.numerator, x.denominator) if isinstance(x, Fraction) else np.longdouble(x).as_integer_ratio() for x in values]
+    den = 1
+    for _, d in ratios :
+        den = den * d // math.gcd(den, d)
+    return tuple(n * (den // d) for n, d in ratios) + (den,)
+
+def _ratio_to_fixed256(num, den) :
+    '''
+    Q3.253 of num/den, same rules as fraction_to_fixed256 without building the Fraction
+    '''
+    if abs(num) >= 3 * den :
+        return fraction_to_fixed256(Fraction(num, den))
+    q = (abs(num) << FIXED_FRAC_BITS) // den
+    return -q if num < 0 else q
+
+def fraction_to_fixed256(x) :
+    '''
+    Exact Q3.253 of a Fraction: truncated, integer part clamped to +/-3 (same rules as longdouble)
+    '''
+    i = int(x)
+    f = x - i
+    i = max(-3, min(3, i))
+    return int((i + f) * (1 << FIXED_FRAC_BITS))
+
+def fixed256_words(values) :
+    '''
+    Converts values to Q3.253 (ap_fixed<256,3>), truncated, integer part clamped to +/-3.
+    Returns a (N, 8) uint32 array, least significant word first.  Fractions (exact precision
+    grids) keep all 253 fractional bits, everything else is converted through np.longdouble
+    '''
+    if any(isinstance(v, Fraction) for v in values) :
+        fxp = [fraction_to_fixed256(v if isinstance(v, Fraction) else Fraction(*np.longdouble(v).as_integer_ratio())) for v in values]
+        b = b''.join([(f & _MASK256).to_bytes(32, 'little') for f in fxp])
+        return np.frombuffer(b, dtype='<u4').reshape(len(values), 8).astype(np.uint32)
+    x = np.asarray(values, dtype=np.longdouble).reshape(-1)
+    # Clamp the integer part, the fraction is kept
+    i = np.trunc(x)
+    x = np.clip(i, -3, 3) + (x - i)
+    if len(x) < _N_VECTOR_MIN :
+        # Two's complement bytes of the truncated fixed point value are the words, little endian
+        b = b''.join([(int(v * _SCALE) & _MASK256).to_bytes(32, 'little') for v in x])
+        return np.frombuffer(b, dtype='<u4').reshape(len(x), 8).astype(np.uint32)
+    neg = x < 0
+    mant, exp = np.frexp(np.abs(x))
+    words = np.zeros((len(x), 8), dtype=np.uint64)
+    k32 = np.arange(8, dtype=np.int64) * 32
+    for j in range(_N_CHUNKS) :
+        # Peel 32 mantissa bits at a time, every step is exact in longdouble
+        mant = mant * np.longdouble(2.0 ** 32)
+        chunk = np.floor(mant)
+        mant = mant - chunk
+        chunk = chunk.astype(np.uint64)[:, None]
+        # Bit position of the chunk's lsb in the 256-bit result, bits below 0 are truncated
+        o = (exp.astype(np.int64) + FIXED_FRAC_BITS - 32 * (j + 1))[:, None] - k32[None, :]
+        left = np.where((o >= 0) & (o < 32), (chunk << np.clip(o, 0, 31).astype(np.uint64)) & _WORD_MASK, np.uint64(0))
+        right = np.where((o < 0) & (o > -32), chunk >> np.clip(-o, 0, 31).astype(np.uint64), np.uint64(0))
+        words |= left | right
+    if neg.any() :
+        # Two's complement: invert then add 1, rippling the carry up through the words
+        w = (~words[neg]) & _WORD_MASK
+        carry = np.ones(len(w), dtype=np.uint64)
+        for k in range(8) :
+            w[:, k] += carry
+            carry = w[:, k] >> np.uint64(32)
+            w[:, k] &= _WORD_MASK
+        words[neg] = w
+    return words.astype(np.uint32)
+
+def create_cfg_words(in_tiles, pktSize=-1) :
+    '''
+    Encodes a config packet for every tile into one contiguous (N, 53) uint32 array, ready to be
+    copied into a TX buffer.  Also returns a list of (nPkts, pktSize, lastPktSize), one per tile
+    '''
+    n = len(in_tiles)
+    cfg = np.zeros((n, CFG_N_WORDS), dtype=np.uint32)
+    steps = []
+    coords = []
+    pkts = []
+    last = None
+    for t, in_tile in enumerate(in_tiles) :
+        grid = in_tile.grid
+        # The step is exact whatever the grid precision and tile origins are whole steps from
+        #  the grid's corner, so every tiling of a grid (and every panned strip) lands on the
+        #  pixels of the whole grid in one tile
+        corners = (grid.ulX, grid.ulY, grid.lrX, int(grid.sizeX))
+        if corners != last :
+            # Batches are mostly tiles of one grid, convert its corners once
+            last = corners
+            ulX, ulY, lrX, den = _common_ratio(grid.ulX, grid.ulY, grid.lrX)
+            h_step = _ratio_to_fixed256(lrX - ulX, den * int(grid.sizeX))
+            ulX = _ratio_to_fixed256(ulX, den)
+            ulY = _ratio_to_fixed256(ulY, den)
+        # Square pixel grid so just re-use h for v_step
+        steps += [ulX + h_step * int(in_tile.limits[0]), ulY - h_step * int(in_tile.limits[1]), h_step]
+        coords += [grid.cX, grid.cY]
+        pkt_size, n_pkts, last_pkt_size = pkt_sizes(int(in_tile.sizeX*in_tile.sizeY), pktSize)
+        cfg[t, 0] = 0x1 if grid.mandelbrot_mode == True else 0x0
+        cfg[t, 1] = int(in_tile.sizeX)
+        cfg[t, 2] = int(in_tile.sizeY)
+        cfg[t, 51] = int(grid.max_iterations)
+        cfg[t, 52] = pkt_size
+        pkts.append((n_pkts, pkt_size, last_pkt_size))
+    b = b''.join([(f & _MASK256).to_bytes(32, 'little') for f in steps])
+    steps = np.frombuffer(b, dtype='<u4').reshape(n, 3, 8)
+    cfg[:, 3:11] = steps[:, 0]
+    cfg[:, 11:19] = steps[:, 1]
+    cfg[:, 19:27] = steps[:, 2]
+    cfg[:, 27:35] = steps[:, 2]
+    cfg[:, 35:51] = fixed256_words(coords).reshape(n, 16)
+    return cfg, pkts
@@ -32,10 +32,15 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import threading
+from collections import OrderedDict
 import numpy as np
-from juliabrot import JuliabrotTile, JuliabrotGrid
+from functools import lru_cache
+from juliabrot import JuliabrotTile, JuliabrotGrid, JuliabrotData
+import juliabrot_trace as jtrace
 from cv2 import cvtColor, COLOR_HSV2RGB, COLOR_HSV2BGR, COLOR_RGB2HSV
 
+@jtrace.traced()
 def rgb_iter_max(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors = None) :
     if in_colors == None :
         in_colors = []
@@ -60,90 +65,221 @@ def rgb_iter_max(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors = None) :
     rgb[data[:,:] <= (max_iter/grad_factor-1), 2] = pix_mod2 * pix[data[:,:] <= (max_iter/grad_factor-1)]
     return rgb
 
-def color_log(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors = None) :
-    if in_colors == None :
-        in_colors = []
-        in_colors.append("#000000")
-    color = np.empty(shape=(1, 1, 3), dtype=np.float32)
-    max_iter = in_tile.grid.max_iterations
-    data = in_tile.data.iterations
-    mandel_rgb = int(in_colors[0][1::],16)
-    hsv = np.empty(shape=(data.shape[0], data.shape[1], 3), dtype=np.float32)
-    hsv[:,:,0] = h * 360
-    hsv[:,:,1] = s
-    l_data = np.log10(1+(data[:,:]%modulo))
-    l_max = np.max(l_data)
-    hsv[:,:,2] = l_data[:,:] * v / l_max
-    color[0,0,2] = (mandel_rgb & 0xff) / 255
-    color[0,0,1] = ((mandel_rgb >> 8) & 0xff) / 255
-    color[0,0,0] = ((mandel_rgb >> 16) & 0xff) / 255
-    color_hsv = cvtColor(color, COLOR_RGB2HSV)
-    hsv[data[:,:] == max_iter, :] = color_hsv
-    rgb = (cvtColor(hsv, COLOR_HSV2RGB) * 255).astype(np.uint8)
-    return rgb
+# Palettes are built once per set of parameters as a small LUT: entry r holds the color of
+#  the counts with count % modulo == r, the extra last entry is the max_iterations (set) color.
+#  Coloring a frame is then one take() into a uint8 RGB image.
+_FULL_LUT_MAX = 1 << 20
+# Unrolled (full) LUTs are up to 3 MiB each, they get their own LRU bounded by bytes
+FULL_LUT_CACHE_BYTES = 16 << 20
+_full_luts = OrderedDict()
+_full_luts_bytes = 0
+_full_luts_lock = threading.Lock()
 
-def color_rainbow(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None) :
-    if in_colors == None :
-        in_colors = []
-        in_colors.append("#000000")
-    rgb = int(in_colors[0][1::],16)
+def _mandel_hsv(m_color) :
+    rgb = int(m_color[1::],16)
     mandel_rgb = np.empty(shape=(1,1,3), dtype=np.float32)
     mandel_rgb[0,0,2] = (rgb & 0xff) / 255
     mandel_rgb[0,0,1] = ((rgb >> 8) & 0xff) / 255
     mandel_rgb[0,0,0] = ((rgb >> 16) & 0xff) / 255
-    mandel_hsv = cvtColor(mandel_rgb, COLOR_RGB2HSV)
-    data = in_tile.data.iterations
-    max_iter = int(in_tile.grid.max_iterations)
-    color_hsv = np.empty(shape=(data.shape[0], data.shape[1], 3), dtype=np.float32)
+    return cvtColor(mandel_rgb, COLOR_RGB2HSV)
+
+def _hsv_to_lut(color_hsv, m_color) :
+    # color_hsv is (1, modulo, 3), the set color is appended as the last entry
+    lut_hsv = np.empty(shape=(1, color_hsv.shape[1] + 1, 3), dtype=np.float32)
+    lut_hsv[:,:-1,:] = color_hsv
+    lut_hsv[0,-1,:] = _mandel_hsv(m_color)
+    lut = (cvtColor(lut_hsv, COLOR_HSV2RGB) * 255).astype(np.uint8)[0]
+    lut.flags.writeable = False
+    return lut
+
+def _lut_rainbow(h, s, v, modulo, max_iter, m_color, top) :
+    r = np.arange(modulo, dtype=np.uint32)
+    color_hsv = np.empty(shape=(1, modulo, 3), dtype=np.float32)
     inv_mod = 1 / modulo
-    color_hsv[:,:,0] = 360 * ((h + (data[:,:] % modulo) * inv_mod ) % 1.0) # cv2 treats h as 0-360 degrees!
-    color_hsv[:,:,1] = s
-    color_hsv[data[:,:] < max_iter, 2] = v
-    color_hsv[data[:,:] == max_iter, :] = mandel_hsv
-    rgb = (cvtColor(color_hsv, COLOR_HSV2RGB) * 255).astype(np.uint8)
-    return rgb
+    color_hsv[0,:,0] = 360 * ((h + r * inv_mod ) % 1.0) # cv2 treats h as 0-360 degrees!
+    color_hsv[0,:,1] = s
+    color_hsv[0,:,2] = v
+    return _hsv_to_lut(color_hsv, m_color)
 
-def color_rainbow2(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None) :
+def _lut_rainbow2(h, s, v, modulo, max_iter, m_color, top) :
+    r = np.arange(modulo, dtype=np.uint32)
+    color_hsv = np.empty(shape=(1, modulo, 3), dtype=np.float32)
+    inv_mod = 1 / modulo
+    color_hsv[0,:,0] = 360 * ((h + r * inv_mod ) % 1.0)
+    color_hsv[0,:,1] = (.3 + (s + r * inv_mod ) % 1.0)
+    color_hsv[0,color_hsv[0,:,1] > 1.0, 1] = s
+    color_hsv[0,:,2] = v
+    return _hsv_to_lut(color_hsv, m_color)
+
+def _lut_classic(h, s, v, modulo, max_iter, m_color, top) :
+    r = np.arange(modulo, dtype=np.uint32)
+    color_hsv = np.empty(shape=(1, modulo, 3), dtype=np.float32)
+    color_hsv[0,:,0] = 360 * ((h + r * (4/max_iter)) % 1.0)
+    color_hsv[0,:,1] = s
+    color_hsv[0,:,2] = v
+    return _hsv_to_lut(color_hsv, m_color)
+
+def _lut_log(h, s, v, modulo, max_iter, m_color, top) :
+    # Brightness is scaled to the largest count % modulo in the frame (top)
+    r = np.arange(modulo, dtype=np.uint32)
+    color_hsv = np.empty(shape=(1, modulo, 3), dtype=np.float32)
+    color_hsv[0,:,0] = h * 360
+    color_hsv[0,:,1] = s
+    l_data = np.log10(1+r)
+    l_max = np.log10(1+np.uint32(top))
+    color_hsv[0,:,2] = l_data * v / l_max
+    return _hsv_to_lut(color_hsv, m_color)
+
+# Palette name -> LUT builder(h, s, v, modulo, max_iter, m_color, top)
+PALETTES = {
+    'rainbow' : _lut_rainbow,
+    'rainbow2' : _lut_rainbow2,
+    'classic' : _lut_classic,
+    'log' : _lut_log,
+}
+
+def palette_lut(name, h, s, v, modulo, max_iter, m_color="#000000", top=None, full=False) :
+    '''
+    Returns the uint8 RGB LUT of a palette, read only and cached by its parameters.
+    Entry r is the color of the counts with count % modulo == r and the extra last entry is the
+    max_iterations (set) color.  full=True unrolls it to max_iter + 1 entries indexed by the
+    count itself, which saves the modulo pass over the frame.  Full LUTs are kept up to
+    FULL_LUT_CACHE_BYTES in total, least recently used first out
+    '''
+    global _full_luts_bytes
+    if full == False :
+        return _palette_lut(name, h, s, v, modulo, max_iter, m_color, top)
+    key = (name, h, s, v, modulo, max_iter, m_color, top)
+    with _full_luts_lock :
+        full_lut = _full_luts.get(key)
+        if full_lut is not None :
+            _full_luts.move_to_end(key)
+            return full_lut
+    lut = _palette_lut(name, h, s, v, modulo, max_iter, m_color, top)
+    full_lut = lut[np.arange(max_iter + 1) % modulo]
+    full_lut[max_iter] = lut[modulo]
+    full_lut.flags.writeable = False
+    with _full_luts_lock :
+        if key not in _full_luts :
+            _full_luts[key] = full_lut
+            _full_luts_bytes += full_lut.nbytes
+        while _full_luts_bytes > FULL_LUT_CACHE_BYTES and len(_full_luts) > 1 :
+            _full_luts_bytes -= _full_luts.popitem(last=False)[1].nbytes
+    return full_lut
+
+@lru_cache(maxsize=64)
+def _palette_lut(name, h, s, v, modulo, max_iter, m_color, top) :
+    # The modulo sized LUTs are a few KiB, a plain LRU by count is enough
+    return PALETTES[name](h, s, v, int(modulo), int(max_iter), m_color, top)
+
+def apply_lut(data, lut, modulo, max_iter, out=None) :
+    '''
+    Colors iteration counts with a palette_lut() LUT (either layout), out may be a preallocated
+    (rows, cols, 3) uint8 array (or view) to write into
+    '''
+    modulo = int(modulo)
+    max_iter = int(max_iter)
+    if out is None :
+        out = np.empty([data.shape[0], data.shape[1], 3], dtype=np.uint8)
+    if lut.shape[0] == max_iter + 1 :
+        idx = data
+    else :
+        idx = data % modulo
+        idx[data == max_iter] = modulo
+    np.take(lut, idx, axis=0, out=out, mode='clip')
+    return out
+
+@jtrace.traced()
+def color_palette(name, data, max_iter, h=1.0, s=1.0, v=1.0, modulo=255, m_color="#000000", out=None, top=None) :
+    # log needs the largest count % modulo in the frame, pass it in as top if it is known already
+    if name == 'log' and top == None :
+        top = int((data % int(modulo)).max())
+    if name != 'log' :
+        top = None
+    full = int(max_iter) < _FULL_LUT_MAX
+    lut = palette_lut(name, float(h), float(s), float(v), int(modulo), int(max_iter), m_color, top, full)
+    return apply_lut(data, lut, modulo, max_iter, out)
+
+def _palette_color(name, in_tile, h, s, v, modulo, in_colors) :
     if in_colors == None :
         in_colors = []
         in_colors.append("#000000")
-    rgb = int(in_colors[0][1::],16)
-    mandel_rgb = np.empty(shape=(1,1,3), dtype=np.float32)
-    mandel_rgb[0,0,2] = (rgb & 0xff) / 255
-    mandel_rgb[0,0,1] = ((rgb >> 8) & 0xff) / 255
-    mandel_rgb[0,0,0] = ((rgb >> 16) & 0xff) / 255
-    mandel_hsv = cvtColor(mandel_rgb, COLOR_RGB2HSV)
-    data = in_tile.data.iterations
-    max_iter = int(in_tile.grid.max_iterations)
-    color_hsv = np.empty(shape=(data.shape[0], data.shape[1], 3), dtype=np.float32)
-    inv_mod = 1 / modulo
-    color_hsv[:,:,0] = 360 * ((h + (data[:,:] % modulo) * inv_mod ) % 1.0)
-    color_hsv[:,:,1] = (.3 + (s + (data[:,:] % modulo) * inv_mod ) % 1.0)
-    color_hsv[color_hsv[:,:,1] > 1.0, 1] = s
-    color_hsv[data[:,:] < max_iter, 2] = v
-    color_hsv[data[:,:] == max_iter, :] = mandel_hsv
-    rgb = (cvtColor(color_hsv, COLOR_HSV2RGB) * 255).astype(np.uint8)
-    return rgb
+    return color_palette(name, in_tile.data.iterations, in_tile.grid.max_iterations, h, s, v, modulo, in_colors[0])
+
+@jtrace.traced()
+def color_log(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors = None) :
+    return _palette_color('log', in_tile, h, s, v, modulo, in_colors)
+
+@jtrace.traced()
+def color_rainbow(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None) :
+    return _palette_color('rainbow', in_tile, h, s, v, modulo, in_colors)
+
+@jtrace.traced()
+def color_rainbow2(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None) :
+    return _palette_color('rainbow2', in_tile, h, s, v, modulo, in_colors)
 
+@jtrace.traced()
 def color_classic(in_tile, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None) :
+    return _palette_color('classic', in_tile, h, s, v, modulo, in_colors)
+
+# Color functions that are backed by a palette LUT
+_LUT_FUNCS = {
+    color_rainbow : 'rainbow',
+    color_rainbow2 : 'rainbow2',
+    color_classic : 'classic',
+    color_log : 'log',
+}
+
+class _Band :
+    # Stand-in tile for a band of rows, for color functions that take a tile
+    def __init__(self, grid, iterations) :
+        self.grid = grid
+        self.data = JuliabrotData()
+        self.data.iterations = iterations
+
+@jtrace.traced()
+def color_bands(in_tile, color_func=color_rainbow, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None, out=None, band_rows=256, filename=None, top=None) :
+    '''
+    Colors a tile band_rows rows at a time straight into a uint8 (sizeY, sizeX, 3) output, so the
+    working memory is a band no matter how large the image.  out may be a preallocated array or
+    view, if it is None and filename is given the output is created as a memory mapped .npy file
+    (np.load(filename, mmap_mode='r') reads it back).  color_func is one of the color functions
+    of this module and gives the same colors as calling it on the whole tile.  For color_log,
+    top is the largest count % modulo of the whole frame when the tile is only part of it
+    '''
     if in_colors == None :
         in_colors = []
         in_colors.append("#000000")
-    rgb = int(in_colors[0][1::],16)
-    mandel_rgb = np.empty(shape=(1,1,3), dtype=np.float32)
-    mandel_rgb[0,0,2] = (rgb & 0xff) / 255
-    mandel_rgb[0,0,1] = ((rgb >> 8) & 0xff) / 255
-    mandel_rgb[0,0,0] = ((rgb >> 16) & 0xff) / 255
-    mandel_hsv = cvtColor(mandel_rgb, COLOR_RGB2HSV)
     data = in_tile.data.iterations
-    max_iter = in_tile.grid.max_iterations
-    color_hsv = np.empty(shape=(data.shape[0], data.shape[1], 3), dtype=np.float32)
-    color_hsv[:,:,0] = 360 * ((h + (data[:,:] % modulo) * (4/max_iter)) % 1.0)
-    color_hsv[:,:,1] = s
-    color_hsv[data[:,:] < max_iter, 2] = v
-    color_hsv[data[:,:] == max_iter,:] = mandel_hsv
-    rgb = (cvtColor(color_hsv, COLOR_HSV2RGB) * 255).astype(np.uint8)
-    return rgb
+    rows, cols = int(in_tile.sizeY), int(in_tile.sizeX)
+    data = data.reshape(rows, cols)
+    max_iter = int(in_tile.grid.max_iterations)
+    modulo = int(modulo)
+    if out is None :
+        if filename != None :
+            out = np.lib.format.open_memmap(filename, mode='w+', dtype=np.uint8, shape=(rows, cols, 3))
+        else :
+            out = np.empty([rows, cols, 3], dtype=np.uint8)
+    lut = None
+    if color_func in _LUT_FUNCS :
+        name = _LUT_FUNCS[color_func]
+        if name != 'log' :
+            top = None
+        elif top == None :
+            # log is normalized to the whole frame, find its largest residue first
+            top = 0
+            for r in range(0, rows, band_rows) :
+                top = max(top, int((data[r:r+band_rows] % modulo).max()))
+        full = max_iter < _FULL_LUT_MAX
+        lut = palette_lut(name, float(h), float(s), float(v), modulo, max_iter, in_colors[0], top, full)
+    for r in range(0, rows, band_rows) :
+        if lut is None :
+            out[r:r+band_rows] = color_func(_Band(in_tile.grid, data[r:r+band_rows]), h, s, v, modulo, in_colors)
+        else :
+            apply_lut(data[r:r+band_rows], lut, modulo, max_iter, out[r:r+band_rows])
+    if isinstance(out, np.memmap) :
+        out.flush()
+    return out
 
 # TBD - not working
 '''
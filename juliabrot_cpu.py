@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import numpy as np
+from fractions import Fraction
+from juliabrot import JuliabrotData, update_progress, to_exact, to_longdouble
+
+def tile_axes(settings, limits, sizeX, sizeY, dtype=np.float64) :
+    '''
+    Returns the real (X) and imaginary (Y) coordinates of a tile's columns and rows.
+    Each coordinate is evaluated exactly from the grid corners and rounded once, so a pixel gets
+    the same value no matter which tile or sub-tile it is computed in
+    '''
+    h_step = (to_exact(settings.lrX) - to_exact(settings.ulX)) / int(settings.sizeX)
+    x0 = to_exact(settings.ulX) + h_step * int(limits[0])
+    y0 = to_exact(settings.ulY) - h_step * int(limits[1])
+    d = x0.denominator * h_step.denominator
+    xa = x0.numerator * h_step.denominator
+    ya = y0.numerator * h_step.denominator
+    b = h_step.numerator * x0.denominator
+    bd = h_step.numerator * y0.denominator
+    d_y = y0.denominator * h_step.denominator
+    if np.dtype(dtype) == np.dtype(np.longdouble) and np.finfo(np.longdouble).nmant > 52 :
+        xs = [to_longdouble(Fraction(xa + b * k, d)) for k in range(int(sizeX))]
+        ys = [to_longdouble(Fraction(ya - bd * k, d_y)) for k in range(int(sizeY))]
+    else :
+        xs = [(xa + b * k) / d for k in range(int(sizeX))]
+        ys = [(ya - bd * k) / d_y for k in range(int(sizeY))]
+    return np.array(xs, dtype=dtype), np.array(ys, dtype=dtype)
+
+class JuliabrotCpu :
+    '''
+    Software compute engine, a drop-in for Juliabrot.compute on hosts without the PL.
+    A whole tile is iterated at once with NumPy, pixels that escape are dropped from the working
+    set so only the points still in play cost anything.  dtype selects float64 or np.longdouble.
+    Interior points are the expensive ones, two shortcuts end them early with max_iterations:
+    interior_check tests the main cardioid and period-2 bulb analytically (Mandelbrot only), and
+    periodicity_tol > -1 compares z against a saved orbit point whose save interval doubles
+    (Brent), a point that comes back within the tolerance is periodic.  The default tolerance 0.0
+    only catches orbits that repeat exactly, so results stay identical to brute force.
+    With keep_state, compute() leaves the z of the points still running at max_iterations in
+    JuliabrotData.z, computing the same tile again with a higher max_iterations only continues
+    those points (a lower one just clamps the counts).  It is off by default: the state is
+    several times the size of the iterations on views that are mostly interior
+    '''
+    def __init__(self, dtype=np.float64, interior_check=True, periodicity_tol=0.0, keep_state=False) :
+        self.dtype = np.dtype(dtype)
+        self.interior_check = interior_check
+        self.periodicity_tol = periodicity_tol
+        self.keep_state = keep_state
+
+    def compute(self, in_tile, in_progress_report=False) :
+        assert in_tile.sizeX > 0 and in_tile.sizeY > 0
+        key = self._view_key(in_tile)
+        max_iter = int(in_tile.grid.max_iterations)
+        if in_tile.data != None and in_tile.data.z != None and in_tile.data.z['key'] == key :
+            return self._resume(in_tile, max_iter, in_progress_report)
+        in_tile.free_data()
+        data = JuliabrotData()
+        data.iterations = np.empty((int(in_tile.sizeY), int(in_tile.sizeX)), dtype=np.uint32)
+        state = {} if self.keep_state == True else None
+        xs, ys = tile_axes(in_tile.grid, in_tile.limits, in_tile.sizeX, in_tile.sizeY, self.dtype)
+        self.compute_points(in_tile.grid, np.tile(xs, len(ys)), np.repeat(ys, len(xs)), data.iterations.reshape(-1), in_progress_report, state)
+        if state != None :
+            state['key'] = key
+            state['max_iter'] = max_iter
+            data.z = state
+        in_tile.data = data
+        return in_tile
+
+    def _view_key(self, in_tile) :
+        # Everything but max_iterations that decides the counts of a tile
+        settings = in_tile.grid
+        corners = tuple(str(to_exact(getattr(settings, name))) for name in ('ulX', 'ulY', 'lrX', 'cX', 'cY'))
+        return (int(settings.sizeX), tuple(int(l) for l in in_tile.limits), bool(settings.mandelbrot_mode),
+                str(self.dtype), self.periodicity_tol) + corners
+
+    def _resume(self, in_tile, max_iter, progress_report=False) :
+        data = in_tile.data
+        state = data.z
+        old_max = state['max_iter']
+        if max_iter == old_max :
+            return in_tile
+        out = np.array(data.iterations, dtype=np.uint32).reshape(-1)
+        if max_iter < old_max :
+            # A count is the first escape, anything at or past the new limit becomes the limit
+            np.minimum(out, max_iter, out=out)
+            new_state = None
+        else :
+            # Points proven periodic (or inside the cardioid/bulb) never escape
+            out[out == old_max] = max_iter
+            new_state = {}
+            sub = np.empty(state['idx'].size, dtype=np.uint32)
+            self._iterate(state['cr'], state['ci'], state['zr'], state['zi'], max_iter, sub, progress_report, old_max, new_state)
+            out[state['idx']] = sub
+            new_state['idx'] = state['idx'][new_state['idx']]
+            new_state['key'] = state['key']
+            new_state['max_iter'] = max_iter
+        in_tile.free_data()
+        data = JuliabrotData()
+        data.iterations = out.reshape(int(in_tile.sizeY), int(in_tile.sizeX))
+        data.z = new_state
+        in_tile.data = data
+        return in_tile
+
+    def compute_into(self, settings, limits, out, progress_report=False) :
+        '''
+        Fills out (a sizeY x sizeX uint32 array, it may be a view) with the iteration counts of the
+        rectangle whose upper-left grid pixel is limits[0], limits[1]
+        '''
+        sizeY, sizeX = out.shape
+        xs, ys = tile_axes(settings, limits, sizeX, sizeY, self.dtype)
+        contiguous = out.flags['C_CONTIGUOUS']
+        flat = out.reshape(-1) if contiguous else np.empty(sizeX * sizeY, dtype=np.uint32)
+        self.compute_points(settings, np.tile(xs, sizeY), np.repeat(ys, sizeX), flat, progress_report)
+        if not contiguous :
+            out[:, :] = flat.reshape(sizeY, sizeX)
+        return out
+
+    def compute_points(self, settings, xs, ys, out, progress_report=False, state=None) :
+        '''
+        Fills the flat uint32 array out with the iteration counts of the points xs + i*ys,
+        e.g. an arbitrary set of pixels picked from tile_axes.  A state dict gets the indices,
+        c and z of the points still running at max_iterations
+        '''
+        n_pix = len(xs)
+        max_iter = int(settings.max_iterations)
+        if settings.mandelbrot_mode == True and self.interior_check == True :
+            inside = self._in_cardioid_or_bulb(np.asarray(xs, dtype=self.dtype), np.asarray(ys, dtype=self.dtype))
+            if inside.any() :
+                out[inside] = max_iter
+                rest = ~inside
+                sub = np.empty(np.count_nonzero(rest), dtype=np.uint32)
+                self._iterate(np.array(xs, dtype=self.dtype)[rest], np.array(ys, dtype=self.dtype)[rest],
+                              np.zeros(sub.size, dtype=self.dtype), np.zeros(sub.size, dtype=self.dtype),
+                              max_iter, sub, progress_report, 0, state)
+                out[rest] = sub
+                if state != None :
+                    state['idx'] = np.nonzero(rest)[0][state['idx']]
+                return out
+        if settings.mandelbrot_mode == True :
+            cr = np.array(xs, dtype=self.dtype)
+            ci = np.array(ys, dtype=self.dtype)
+            zr = np.zeros(n_pix, dtype=self.dtype)
+            zi = np.zeros(n_pix, dtype=self.dtype)
+        else :
+            zr = np.array(xs, dtype=self.dtype)
+            zi = np.array(ys, dtype=self.dtype)
+            cr = np.full(n_pix, self._scalar(settings.cX), dtype=self.dtype)
+            ci = np.full(n_pix, self._scalar(settings.cY), dtype=self.dtype)
+        self._iterate(cr, ci, zr, zi, max_iter, out, progress_report, 0, state)
+        return out
+
+    def _in_cardioid_or_bulb(self, cr, ci) :
+        # Main cardioid: q(q + x - 1/4) <= y^2/4 with q = (x - 1/4)^2 + y^2, bulb: (x + 1)^2 + y^2 <= 1/16
+        ci2 = ci * ci
+        xq = cr - 0.25
+        q = xq * xq + ci2
+        xb = cr + 1.0
+        return (q * (q + xq) <= 0.25 * ci2) | (xb * xb + ci2 <= 0.0625)
+
+    def _scalar(self, x) :
+        if self.dtype == np.dtype(np.longdouble) :
+            return to_longdouble(to_exact(x))
+        return self.dtype.type(float(to_exact(x)))
+
+    def _iterate(self, cr, ci, zr, zi, max_iter, out, progress_report=False, k0=0, state=None) :
+        '''
+        Escape time for every point: the index n of the first z_n with |z_n|^2 > 4, or max_iter.
+        The working arrays are compacted whenever points escape.  z is z_k0 (0 for a fresh
+        start), state gets the points still running at the end (indices into out, c and z)
+        '''
+        out[:] = max_iter
+        idx = np.arange(out.size)
+        n_total = out.size
+        zr2 = zr * zr
+        zi2 = zi * zi
+        mag = np.empty_like(zr)
+        check = self.periodicity_tol >= 0
+        if check == True :
+            sr = zr.copy()
+            si = zi.copy()
+            next_save = 8
+            while next_save <= k0 :
+                next_save *= 2
+        # Nothing to iterate (e.g. resuming a tile where every point is settled)
+        n_end = max_iter if out.size > 0 else k0
+        for k in range(k0, n_end) :
+            np.add(zr2, zi2, out=mag)
+            esc = mag > 4.0
+            if esc.any() :
+                out[idx[esc]] = k
+                keep = ~esc
+                idx = idx[keep]
+                if idx.size == 0 :
+                    break
+                zr = zr[keep]
+                zi = zi[keep]
+                cr = cr[keep]
+                ci = ci[keep]
+                zr2 = zr2[keep]
+                zi2 = zi2[keep]
+                mag = mag[keep]
+                if check == True :
+                    sr = sr[keep]
+                    si = si[keep]
+                if progress_report == True :
+                    update_progress(1.0 - idx.size / n_total)
+            # z = z^2 + c, reusing the squares from the escape test
+            zi *= zr
+            zi += zi
+            zi += ci
+            np.subtract(zr2, zi2, out=zr)
+            zr += cr
+            np.multiply(zr, zr, out=zr2)
+            np.multiply(zi, zi, out=zi2)
+            # Saves are at powers of 2 so comparing every 8th step still meets k + 1 - j = 8 * period
+            if check == True and ((k + 1) & 7) == 0 :
+                # z_k+1 back at a saved z_j: the orbit cycles and will never escape
+                if self.periodicity_tol == 0 :
+                    cyc = zr == sr
+                else :
+                    cyc = np.abs(zr - sr) <= self.periodicity_tol
+                # Imaginary parts only need a look once some real part matched
+                if cyc.any() :
+                    if self.periodicity_tol == 0 :
+                        cyc &= zi == si
+                    else :
+                        cyc &= np.abs(zi - si) <= self.periodicity_tol
+                if cyc.any() :
+                    keep = ~cyc
+                    idx = idx[keep]
+                    if idx.size == 0 :
+                        break
+                    zr = zr[keep]
+                    zi = zi[keep]
+                    cr = cr[keep]
+                    ci = ci[keep]
+                    zr2 = zr2[keep]
+                    zi2 = zi2[keep]
+                    mag = mag[keep]
+                    sr = sr[keep]
+                    si = si[keep]
+                if k + 1 == next_save :
+                    sr[:] = zr
+                    si[:] = zi
+                    next_save *= 2
+        if state != None :
+            if idx.size == 0 :
+                zr = zr[:0]
+                zi = zi[:0]
+                cr = cr[:0]
+                ci = ci[:0]
+            state['idx'] = idx
+            state['zr'] = zr
+            state['zi'] = zi
+            state['cr'] = cr
+            state['ci'] = ci
+        if progress_report == True :
+            update_progress(1)
+        return out
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import math
+import time
+import queue
+import threading
+import numpy as np
+import juliabrot_cfg
+from axidma import SimpleDmaDriver
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot import JuliabrotGridSettings
+
+"""
+Software stand-in for the juliabrot overlay, so Juliabrot and the DMA driver can run on a host
+without a board:
+
+    jb = Juliabrot(64, overlay=EmuOverlay(nk=6))
+
+EmuOverlay has the same members Juliabrot uses: juliabrot and juliabrot_colorize (register
+maps), config_dma and iter_dma (SimpleDmaDriver with NumPy buffers and emulated channels).
+Config packets sent to config_dma are decoded by a PL thread that computes each tile and
+streams its iterations back through iter_dma in pktSize packets, in config order.
+"""
+
+def fixed256_value(words) :
+    '''
+    Signed Q3.253 integer of the 8 little endian words of an ap_fixed<256,3>
+    '''
+    x = int.from_bytes(np.asarray(words, dtype='<u4').tobytes(), 'little')
+    if x >= 1 << 255 :
+        x -= 1 << 256
+    return x
+
+def decode_cfg(words) :
+    '''
+    Fields of one 53 word config packet (see juliabrot_cfg), coordinates as Q3.253 integers
+    '''
+    w = np.asarray(words, dtype=np.uint32)
+    assert len(w) == juliabrot_cfg.CFG_N_WORDS, 'Config packets are 53 words'
+    return {'mandelbrot' : int(w[0]) == 1, 'xSetMax' : int(w[1]), 'ySetMax' : int(w[2]),
+            'ulX' : fixed256_value(w[3:11]), 'ulY' : fixed256_value(w[11:19]),
+            'h_step' : fixed256_value(w[19:27]), 'v_step' : fixed256_value(w[27:35]),
+            'cX' : fixed256_value(w[35:43]), 'cY' : fixed256_value(w[43:51]),
+            'maxIter' : int(w[51]), 'pktSize' : int(w[52])}
+
+class _Register :
+    def __init__(self, address) :
+        self.address = address
+
+class _RegisterMap :
+    def __init__(self, names) :
+        for i, name in enumerate(names) :
+            setattr(self, name, _Register(0x10 + 8 * i))
+
+class EmuIP :
+    '''
+    AXI-Lite register block, read()/write() by register_map address
+    '''
+    def __init__(self, names) :
+        self.register_map = _RegisterMap(names)
+        self._regs = {}
+        for name in names :
+            self._regs[getattr(self.register_map, name).address] = 0
+
+    def read(self, address) :
+        return self._regs[address]
+
+    def write(self, address, value) :
+        self._regs[address] = int(value)
+
+    def _set(self, name, value) :
+        self._regs[getattr(self.register_map, name).address] = int(value)
+
+class _EmuChannel :
+    '''
+    DMA channel, transfer(buf) then wait().  A send hands the buffer to the PL, a receive
+    arms the buffer and wait() fills it with the next packet the PL streams out
+    '''
+    def __init__(self, pl, direction) :
+        self._pl = pl
+        self._direction = direction
+        self._armed = []
+
+    def transfer(self, buf) :
+        if self._direction == 'send' :
+            self._pl.configure(np.array(buf, dtype=np.uint32))
+        else :
+            self._armed.append(buf)
+
+    def wait(self) :
+        if self._direction == 'send' :
+            return
+        assert len(self._armed) > 0, 'wait() without a transfer()'
+        buf = self._armed.pop(0)
+        pkt, ready = self._pl.out.get()
+        if isinstance(pkt, BaseException) :
+            raise pkt
+        delay = ready - time.perf_counter()
+        if delay > 0 :
+            time.sleep(delay)
+        assert len(pkt) <= len(buf), 'Packet larger than the receive buffer'
+        buf[0:len(pkt)] = pkt
+
+class EmuDmaDriver(SimpleDmaDriver) :
+    '''
+    SimpleDmaDriver on emulated channels, CMA buffers are plain NumPy arrays
+    '''
+    def __init__(self, pl) :
+        self.sendchannel = _EmuChannel(pl, 'send')
+        self.recvchannel = _EmuChannel(pl, 'recv')
+        self.txbuf = []
+        self.rxbuf = []
+        self.rxring = None
+
+    def make_cma_buf(self, shape, data_type) :
+        return np.zeros(shape, dtype=data_type)
+
+    def del_cma_buf(self, cma_buf) :
+        pass
+
+class EmuPL :
+    '''
+    The compute kernels.  Configs queue up and are computed one tile at a time on a thread,
+    packets go out in order.  kernel='fixed' iterates in two's complement fixed point with
+    frac_bits fractional bits: the Q3.253 inputs are truncated (floor, like AP_TRN) to frac_bits
+    and so is every product.  kernel='float64' iterates the inputs rounded to doubles, which is
+    much faster when only the host side is of interest.  Each packet is released no earlier
+    than latency seconds plus its share of the tile at pixel_rate pixels/s after the tile starts
+    '''
+    def __init__(self, nk=6, frac_bits=60, kernel='fixed', latency=0.0, pixel_rate=None, x_max=16384, y_max=16384) :
+        assert kernel == 'fixed' or kernel == 'float64', 'kernel must be fixed or float64'
+        assert 0 < frac_bits <= juliabrot_cfg.FIXED_FRAC_BITS, 'frac_bits must be 1 to 253'
+        self.nk = nk
+        self.frac_bits = frac_bits
+        self.kernel = kernel
+        self.latency = latency
+        self.pixel_rate = pixel_rate
+        self.regs = EmuIP(['xMaxOut', 'yMaxOut', 'nRowOut', 'nColOut', 'nkOut'])
+        self.regs._set('xMaxOut', x_max)
+        self.regs._set('yMaxOut', y_max)
+        self.regs._set('nkOut', nk)
+        self.out = queue.Queue()
+        self._configs = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, words) :
+        assert len(words) % juliabrot_cfg.CFG_N_WORDS == 0, 'Config stream is not whole 53 word packets'
+        for p in range(0, len(words), juliabrot_cfg.CFG_N_WORDS) :
+            cfg = decode_cfg(words[p:p+juliabrot_cfg.CFG_N_WORDS])
+            assert cfg['xSetMax'] % self.nk == 0, 'xSetMax must be a multiple of nkOut'
+            assert 0 < cfg['xSetMax'] <= self.regs._regs[self.regs.register_map.xMaxOut.address], 'xSetMax out of range'
+            assert 0 < cfg['ySetMax'] <= self.regs._regs[self.regs.register_map.yMaxOut.address], 'ySetMax out of range'
+            self._configs.put(cfg)
+        with self._lock :
+            if self._thread == None :
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self) :
+        while True :
+            cfg = self._configs.get()
+            start = time.perf_counter()
+            try :
+                it = self.compute(cfg).reshape(-1)
+            except BaseException as e :
+                self.out.put((e, 0))
+                continue
+            n = cfg['pktSize']
+            for offset in range(0, len(it), n) :
+                pkt = it[offset:offset+n]
+                ready = start + self.latency
+                if self.pixel_rate != None :
+                    ready += (offset + len(pkt)) / self.pixel_rate
+                self.out.put((pkt, ready))
+
+    def compute(self, cfg) :
+        '''
+        (ySetMax, xSetMax) uint32 iterations of a decoded config, in the order they stream out
+        '''
+        sizeX = cfg['xSetMax']
+        sizeY = cfg['ySetMax']
+        F = juliabrot_cfg.FIXED_FRAC_BITS
+        xs = [cfg['ulX'] + cfg['h_step'] * k for k in range(sizeX)]
+        ys = [cfg['ulY'] - cfg['v_step'] * k for k in range(sizeY)]
+        out = np.empty((sizeY, sizeX), dtype=np.uint32)
+        if self.kernel == 'float64' :
+            settings = JuliabrotGridSettings()
+            settings.max_iterations = cfg['maxIter']
+            settings.mandelbrot_mode = cfg['mandelbrot']
+            settings.cX = math.ldexp(float(cfg['cX']), -F)
+            settings.cY = math.ldexp(float(cfg['cY']), -F)
+            xs = np.array([math.ldexp(float(x), -F) for x in xs])
+            ys = np.array([math.ldexp(float(y), -F) for y in ys])
+            engine = JuliabrotCpu(keep_state=False)
+        else :
+            shift = F - self.frac_bits
+            xs = np.array([x >> shift for x in xs], dtype=object)
+            ys = np.array([y >> shift for y in ys], dtype=object)
+        self.regs._set('nColOut', sizeX)
+        if self.kernel == 'float64' :
+            # The whole tile in one go, per row would repeat the NumPy step overhead sizeY times
+            self.regs._set('nRowOut', sizeY)
+            engine.compute_points(settings, np.tile(xs, sizeY), np.repeat(ys, sizeX), out.reshape(-1))
+        else :
+            for row in range(sizeY) :
+                # Progress registers count down like the PL's
+                self.regs._set('nRowOut', sizeY - row)
+                out[row] = self._iterate_fixed(cfg, xs, ys[row])
+        self.regs._set('nRowOut', 0)
+        self.regs._set('nColOut', 0)
+        return out
+
+    def _iterate_fixed(self, cfg, xs, y) :
+        F = self.frac_bits
+        shift = juliabrot_cfg.FIXED_FRAC_BITS - F
+        max_iter = cfg['maxIter']
+        n = len(xs)
+        out = np.full(n, max_iter, dtype=np.uint32)
+        if cfg['mandelbrot'] == True :
+            cr = xs.copy()
+            ci = np.full(n, y, dtype=object)
+            zr = np.zeros(n, dtype=object)
+            zi = np.zeros(n, dtype=object)
+        else :
+            zr = xs.copy()
+            zi = np.full(n, y, dtype=object)
+            cr = np.full(n, cfg['cX'] >> shift, dtype=object)
+            ci = np.full(n, cfg['cY'] >> shift, dtype=object)
+        idx = np.arange(n)
+        four = 4 << F
+        for k in range(max_iter) :
+            zr2 = (zr * zr) >> F
+            zi2 = (zi * zi) >> F
+            esc = (zr2 + zi2) > four
+            if esc.any() :
+                out[idx[esc]] = k
+                keep = ~esc
+                idx = idx[keep]
+                if idx.size == 0 :
+                    break
+                zr = zr[keep]
+                zi = zi[keep]
+                cr = cr[keep]
+                ci = ci[keep]
+                zr2 = zr2[keep]
+                zi2 = zi2[keep]
+            zi = ((zr * zi) >> (F - 1)) + ci
+            zr = zr2 - zi2 + cr
+        return out
+
+class EmuOverlay :
+    '''
+    Stand-in for the loaded pynq Overlay, pass it to Juliabrot(..., overlay=EmuOverlay()).
+    nk is the number of kernels (nkOut, tile widths must be a multiple of it), the other
+    arguments go to EmuPL
+    '''
+    def __init__(self, nk=6, frac_bits=60, kernel='fixed', latency=0.0, pixel_rate=None, x_max=16384, y_max=16384) :
+        self.pl = EmuPL(nk, frac_bits, kernel, latency, pixel_rate, x_max, y_max)
+        self.juliabrot = self.pl.regs
+        self.juliabrot_colorize = EmuIP(['inStreamEnables', 'inMaxIter', 'inMode'])
+        self.config_dma = EmuDmaDriver(self.pl)
+        self.iter_dma = EmuDmaDriver(self.pl)
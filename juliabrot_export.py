@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import struct
+import zlib
+import numpy as np
+from juliabrot import JuliabrotGrid, JuliabrotTile, update_progress, compute_aligned
+import juliabrot_coloring as jcolor
+
+class PngStreamWriter :
+    '''
+    Writes an 8-bit RGB PNG row by row, only the rows not yet written are held in memory.
+    Rows are given in order with write_rows(), or as tiles in any x order with write_tile(),
+    rows are compressed out as soon as every column of them has arrived
+    '''
+    def __init__(self, filename, width, height, compress_level=6, idat_size=1 << 16) :
+        self.width = int(width)
+        self.height = int(height)
+        self.next_row = 0
+        self._idat_size = idat_size
+        self._pending = {}
+        self._filled = np.zeros(self.height, dtype=np.int64)
+        self._z = zlib.compressobj(compress_level)
+        self._buf = b''
+        self._f = open(filename, 'wb')
+        self._f.write(b'\x89PNG\r\n\x1a\n')
+        # 8 bits per channel, color type 2 (RGB), no interlace
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *args) :
+        self.close()
+
+    def _chunk(self, tag, payload) :
+        self._f.write(struct.pack('>I', len(payload)))
+        self._f.write(tag)
+        self._f.write(payload)
+        self._f.write(struct.pack('>I', zlib.crc32(payload, zlib.crc32(tag)) & 0xffffffff))
+
+    def write_rows(self, rgb) :
+        '''
+        Appends a (rows, width, 3) uint8 band below the rows already written
+        '''
+        assert rgb.shape[1] == self.width and rgb.shape[2] == 3, 'Band width does not match image'
+        assert self.next_row + rgb.shape[0] <= self.height, 'More rows than the image height'
+        # Every scanline starts with its filter type, 0 = none
+        rows = np.zeros((rgb.shape[0], self.width * 3 + 1), dtype=np.uint8)
+        rows[:, 1:] = rgb.reshape(rgb.shape[0], self.width * 3)
+        self._buf += self._z.compress(rows.tobytes())
+        if len(self._buf) >= self._idat_size :
+            self._chunk(b'IDAT', self._buf)
+            self._buf = b''
+        self.next_row += rgb.shape[0]
+
+    def write_tile(self, rgb, x, y) :
+        '''
+        Places a (rows, cols, 3) uint8 tile with its upper-left pixel at x, y.  Tiles may arrive in
+        any order along a row band, but rows above the last flushed row cannot be written again
+        '''
+        assert y >= self.next_row, 'Rows already written to the file'
+        for i in range(rgb.shape[0]) :
+            r = y + i
+            if r not in self._pending :
+                self._pending[r] = np.zeros((self.width, 3), dtype=np.uint8)
+            self._pending[r][x:x+rgb.shape[1]] = rgb[i]
+            self._filled[r] += rgb.shape[1]
+        while self.next_row in self._pending and self._filled[self.next_row] >= self.width :
+            self.write_rows(self._pending.pop(self.next_row)[np.newaxis])
+
+    def close(self) :
+        if self._f == None :
+            return
+        if self.next_row != self.height :
+            print("Warn: PNG closed with " + str(self.height - self.next_row) + " rows missing")
+        self._buf += self._z.flush()
+        self._chunk(b'IDAT', self._buf)
+        self._chunk(b'IEND', b'')
+        self._f.close()
+        self._f = None
+
+def render_png(engine, in_grid, filename, color_func=jcolor.color_rainbow, h=1.0, s=1.0, v=1.0, modulo=255, in_colors=None, band_rows=256, in_progress_report=False, top=None) :
+    '''
+    Computes a grid as full width bands of band_rows rows with engine (Juliabrot or a software
+    engine), colors each band and streams it into a PNG, so only one band of iterations and
+    pixels is ever in memory.  color_log is normalized to the whole image like on screen: pass
+    its largest count % modulo as top if it is known, otherwise the bands are computed twice,
+    once to find it
+    '''
+    settings = in_grid.settings
+    width = int(settings.sizeX)
+    height = int(settings.sizeY)
+    scratch = JuliabrotGrid(settings)
+    bands = [(0, r, width - 1, min(r + band_rows, height) - 1) for r in range(0, height, band_rows)]
+    if color_func == jcolor.color_log and top == None :
+        top = 0
+        for limits in bands :
+            scratch.tile_list = []
+            tile = compute_aligned(engine, JuliabrotTile(scratch, limits))
+            top = max(top, int((np.asarray(tile.data.iterations) % int(modulo)).max()))
+            tile.free_data()
+    with PngStreamWriter(filename, width, height) as png :
+        for limits in bands :
+            scratch.tile_list = []
+            # The PL computes the band padded on a copy of the settings, in_grid keeps its size
+            tile = compute_aligned(engine, JuliabrotTile(scratch, limits))
+            png.write_rows(jcolor.color_bands(tile, color_func, h, s, v, modulo, in_colors, top=top))
+            tile.free_data()
+            if in_progress_report == True :
+                update_progress(png.next_row / height)
+    scratch.tile_list = []
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from juliabrot import JuliabrotTile
+
+class ViewSnapshot :
+    '''
+    Compact record of a rendered view: the settings that decide the image, the tile limits and
+    each tile's RenderCache key.  The iterations themselves stay in the cache, a view whose
+    tiles were evicted from it since comes back without data
+    '''
+    __slots__ = ('sizeX', 'sizeY', 'max_iterations', 'ulX', 'ulY', 'lrX', 'lrY', 'cX', 'cY',
+                 'mandelbrot_mode', 'precision', 'limits', 'keys', 'cache')
+    _settings = ('sizeX', 'sizeY', 'max_iterations', 'ulX', 'ulY', 'lrX', 'lrY', 'cX', 'cY',
+                 'mandelbrot_mode', 'precision')
+
+    def __init__(self, in_grid, cache=None) :
+        settings = in_grid.settings
+        # Coordinates are immutable scalars (longdouble or Fraction), no copies needed
+        for name in self._settings :
+            setattr(self, name, getattr(settings, name))
+        self.limits = [tuple(int(l) for l in tile.limits) for tile in in_grid.tile_list]
+        self.cache = cache
+        self.keys = None
+        if cache != None :
+            self.keys = [cache.key(tile) for tile in in_grid.tile_list]
+
+    def same_view(self, in_grid) :
+        settings = in_grid.settings
+        return all(getattr(self, name) == getattr(settings, name) for name in self._settings)
+
+    def restore(self, in_grid) :
+        '''
+        Puts the view back into in_grid, returns True when the iterations came back too from the
+        cache (otherwise the tiles are left without data and need computing)
+        '''
+        settings = in_grid.settings
+        for name in self._settings :
+            setattr(settings, name, getattr(self, name))
+        if [tuple(int(l) for l in tile.limits) for tile in in_grid.tile_list] != self.limits :
+            for tile in in_grid.tile_list :
+                tile.free_data()
+            in_grid.tile_list = []
+            for limits in self.limits :
+                JuliabrotTile(in_grid, limits)
+        restored = self.keys != None
+        for i, tile in enumerate(in_grid.tile_list) :
+            tile.free_data()
+            if restored == True :
+                restored = self.cache.get(tile, self.keys[i])
+        if restored == False :
+            for tile in in_grid.tile_list :
+                tile.free_data()
+        return restored
+
+class ViewHistory :
+    '''
+    Bounded undo/redo stack of ViewSnapshots, at most max_len views are kept.  The iterations
+    of a view are looked up in cache (a RenderCache the views were drawn through), so they
+    share its memory bound instead of keeping copies of their own
+    '''
+    def __init__(self, cache=None, max_len=100) :
+        self.cache = cache
+        self.max_len = max_len
+        self.snapshots = []
+        self.pos = -1
+
+    def push(self, in_grid) :
+        if self.pos >= 0 and self.snapshots[self.pos].same_view(in_grid) :
+            # Same view redrawn, just refresh its keys
+            self.snapshots[self.pos] = ViewSnapshot(in_grid, self.cache)
+        else :
+            # A new view ends the redo branch
+            del self.snapshots[self.pos+1:]
+            self.snapshots.append(ViewSnapshot(in_grid, self.cache))
+            if len(self.snapshots) > self.max_len :
+                del self.snapshots[0]
+            self.pos = len(self.snapshots) - 1
+
+    def can_undo(self) :
+        return self.pos > 0
+
+    def can_redo(self) :
+        return self.pos < len(self.snapshots) - 1
+
+    def undo(self) :
+        if not self.can_undo() :
+            return None
+        self.pos -= 1
+        return self.snapshots[self.pos]
+
+    def redo(self) :
+        if not self.can_redo() :
+            return None
+        self.pos += 1
+        return self.snapshots[self.pos]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import numpy as np
+from juliabrot import JuliabrotData, JuliabrotGrid, JuliabrotTile, to_exact, compute_aligned
+
+def pan_grid(engine, in_grid, dx, dy) :
+    '''
+    Moves a grid's view by dx pixels right and dy pixels down (negative for left/up) and updates
+    its iterations.  When the grid is a single computed tile and the moved corners land exactly
+    on the old pixel lattice, the old iterations are shifted and only the newly exposed strips
+    are computed as sub-tiles; otherwise every tile is computed again.  The PL config encoder
+    computes the step exactly from the corners, so the strips land on the same pixels a full
+    compute of the moved view would.
+    Returns True when the pan was incremental
+    '''
+    settings = in_grid.settings
+    sizeX = int(settings.sizeX)
+    sizeY = int(settings.sizeY)
+    h = (to_exact(settings.lrX) - to_exact(settings.ulX)) / sizeX
+    moved = {
+        'ulX' : to_exact(settings.ulX) + dx * h,
+        'lrX' : to_exact(settings.lrX) + dx * h,
+        'ulY' : to_exact(settings.ulY) - dy * h,
+        'lrY' : to_exact(settings.lrY) - dy * h,
+    }
+    aligned = True
+    for name, value in moved.items() :
+        setattr(settings, name, settings.coord(value))
+        # A rounded corner would put the new pixels between the old ones
+        aligned = aligned and to_exact(getattr(settings, name)) == value
+    tiles = in_grid.tile_list
+    reuse = (aligned == True and len(tiles) == 1 and tiles[0].data != None
+             and int(tiles[0].sizeX) == sizeX and int(tiles[0].sizeY) == sizeY
+             and abs(dx) < sizeX and abs(dy) < sizeY)
+    if reuse == False :
+        for tile in tiles :
+            compute_aligned(engine, tile)
+        return False
+    tile = tiles[0]
+    old = np.asarray(tile.data.iterations).reshape(sizeY, sizeX)
+    new = np.empty((sizeY, sizeX), dtype=np.uint32)
+    # New pixel (r, c) is old pixel (r + dy, c + dx)
+    new[max(0, -dy):sizeY - max(0, dy), max(0, -dx):sizeX - max(0, dx)] = \
+        old[max(0, dy):sizeY - max(0, -dy), max(0, dx):sizeX - max(0, -dx)]
+    # Exposed columns over the full height, then exposed rows over the rest
+    strips = []
+    if dx > 0 :
+        strips.append([sizeX - dx, 0, sizeX - 1, sizeY - 1])
+    elif dx < 0 :
+        strips.append([0, 0, -dx - 1, sizeY - 1])
+    if dy > 0 :
+        strips.append([0, sizeY - dy, sizeX - 1, sizeY - 1])
+    elif dy < 0 :
+        strips.append([0, 0, sizeX - 1, -dy - 1])
+    scratch = JuliabrotGrid(settings)
+    for limits in strips :
+        scratch.tile_list = []
+        # The PL computes the strip padded on a copy of the settings, in_grid keeps its size
+        strip = compute_aligned(engine, JuliabrotTile(scratch, limits))
+        new[limits[1]:limits[3]+1, limits[0]:limits[2]+1] = np.asarray(strip.data.iterations).reshape(int(strip.sizeY), int(strip.sizeX))
+        strip.free_data()
+    scratch.tile_list = []
+    tile.free_data()
+    data = JuliabrotData()
+    data.iterations = new
+    tile.data = data
+    return True
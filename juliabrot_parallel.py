@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import numpy as np
+from multiprocessing import get_context, shared_memory
+from juliabrot import JuliabrotData, update_progress
+from juliabrot_cpu import JuliabrotCpu
+
+class _Segment(shared_memory.SharedMemory) :
+    '''
+    Shared memory of one tile's iterations.  numpy views of it can outlive close(), a close
+    that finds them still exported leaves the mapping to them and it goes with the last one
+    '''
+    def close(self) :
+        try :
+            super().close()
+        except BufferError :
+            if getattr(self, '_fd', -1) >= 0 :
+                os.close(self._fd)
+                self._fd = -1
+
+def _compute_rect(job) :
+    # Runs in a pool worker: attach to the parent's iteration array and fill one rectangle of it
+    shm_name, shape, settings, limits, rect, dtype = job
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try :
+        out = np.ndarray(shape, dtype=np.uint32, buffer=shm.buf)
+        y0, y1, x0, x1 = rect
+        JuliabrotCpu(dtype).compute_into(settings, limits, out[y0:y1, x0:x1])
+        del out
+    finally :
+        shm.close()
+    return (y1 - y0) * (x1 - x0)
+
+class JuliabrotParallel :
+    '''
+    Multi-process software engine with the same compute interface as Juliabrot.
+    A tile is cut into row bands (split='rows') or square tiles (split='tiles') that are handed to a
+    process pool, every worker writes straight into one shared-memory iteration array.
+    Cut into more pieces than there are processes, so bands full of interior points do not
+    leave the other cores idle at the end
+    '''
+    def __init__(self, n_procs=None, split='rows', chunk=None, dtype=np.float64, start_method=None) :
+        assert split == 'rows' or split == 'tiles', 'split must be rows or tiles'
+        self.n_procs = int(n_procs) if n_procs != None else os.cpu_count()
+        self.split = split
+        self.chunk = chunk
+        self.dtype = np.dtype(dtype)
+        self._ctx = get_context(start_method)
+        self._pool = None
+
+    def close(self) :
+        if self._pool != None :
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _rects(self, sizeX, sizeY) :
+        rects = []
+        if self.split == 'rows' :
+            rows = self.chunk if self.chunk != None else max(1, sizeY // (self.n_procs * 8))
+            for y in range(0, sizeY, rows) :
+                rects.append((y, min(y + rows, sizeY), 0, sizeX))
+        else :
+            side = self.chunk if self.chunk != None else max(16, int(np.sqrt(sizeX * sizeY / (self.n_procs * 8))))
+            for y in range(0, sizeY, side) :
+                for x in range(0, sizeX, side) :
+                    rects.append((y, min(y + side, sizeY), x, min(x + side, sizeX)))
+        return rects
+
+    def compute(self, in_tile, in_progress_report=False) :
+        assert in_tile.sizeX > 0 and in_tile.sizeY > 0
+        in_tile.free_data()
+        sizeX = int(in_tile.sizeX)
+        sizeY = int(in_tile.sizeY)
+        shape = (sizeY, sizeX)
+        shm = _Segment(create=True, size=sizeX * sizeY * 4)
+        try :
+            # Start the pool after the first segment exists so workers share the parent's resource tracker
+            if self._pool == None :
+                self._pool = self._ctx.Pool(self.n_procs)
+            jobs = []
+            for rect in self._rects(sizeX, sizeY) :
+                y0, y1, x0, x1 = rect
+                limits = (in_tile.limits[0] + x0, in_tile.limits[1] + y0, in_tile.limits[0] + x1 - 1, in_tile.limits[1] + y1 - 1)
+                jobs.append((shm.name, shape, in_tile.grid, limits, rect, self.dtype))
+            n_done = 0
+            for n_pix in self._pool.imap_unordered(_compute_rect, jobs) :
+                n_done += n_pix
+                if in_progress_report == True :
+                    update_progress(n_done / (sizeX * sizeY))
+        except :
+            shm.close()
+            raise
+        finally :
+            # The workers are done with the name, the parent keeps its mapping
+            shm.unlink()
+        # The tile's data owns the segment and closes it in free(), as with a CMA buffer.
+        # frombuffer keeps it exported while any view of the iterations is alive
+        data = JuliabrotData()
+        data.iterations = np.frombuffer(shm.buf, dtype=np.uint32).reshape(shape)
+        data.set_shared_mem(shm)
+        in_tile.data = data
+        return in_tile
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import numpy as np
+from fractions import Fraction
+from juliabrot import JuliabrotData, update_progress, to_exact
+
+class JuliabrotPerturb :
+    '''
+    Deep zoom software engine (perturbation theory), same compute interface as Juliabrot.
+    One reference orbit Z_n is iterated at the tile center in big integer fixed point, every
+    pixel then only iterates its float64 offset from that orbit:
+
+        Mandelbrot: d_n+1 = 2 Z_n d_n + d_n^2 + dc        Julia: d_n+1 = 2 Z_n d_n + d_n^2
+
+    When |Z_n + d_n| < |d_n| (the pixel orbit passes closer to 0 than to the reference, which is
+    where precision loss "glitches" come from) or the reference orbit has run out, the pixel is
+    rebased: d becomes Z_n + d - Z_0 and it restarts at Z_0.  Offsets are plain doubles, so the
+    zoom depth is limited by the double exponent (pixel steps down to about 1e-300).
+    After compute, stats holds the reference length and rebase count
+    '''
+    def __init__(self, guard_bits=64) :
+        self.guard_bits = guard_bits
+        self.stats = {}
+        # (key, (Zr, Zi)) of the last tile
+        self._reference = None
+
+    def compute(self, in_tile, in_progress_report=False) :
+        assert in_tile.sizeX > 0 and in_tile.sizeY > 0
+        in_tile.free_data()
+        data = JuliabrotData()
+        data.iterations = np.empty((int(in_tile.sizeY), int(in_tile.sizeX)), dtype=np.uint32)
+        self.compute_into(in_tile.grid, in_tile.limits, data.iterations, in_progress_report)
+        in_tile.data = data
+        return in_tile
+
+    def compute_into(self, settings, limits, out, progress_report=False) :
+        sizeY, sizeX = out.shape
+        rows = np.repeat(np.arange(sizeY), sizeX)
+        cols = np.tile(np.arange(sizeX), sizeY)
+        flat = out.reshape(-1) if out.flags['C_CONTIGUOUS'] else np.empty(sizeX * sizeY, dtype=np.uint32)
+        self.compute_pixels(settings, limits, (sizeX, sizeY), rows, cols, flat, progress_report)
+        if not out.flags['C_CONTIGUOUS'] :
+            out[:, :] = flat.reshape(sizeY, sizeX)
+        return out
+
+    def compute_pixels(self, settings, limits, size, rows, cols, out, progress_report=False) :
+        '''
+        Iterations of the tile local pixels (rows[i], cols[i]) of a tile of size (sizeX, sizeY)
+        into out.  The reference orbit of the tile is kept, so a caller computing a tile a few
+        pixels at a time (JuliabrotMarianiSilver) iterates it once
+        '''
+        sizeX, sizeY = size
+        max_iter = int(settings.max_iterations)
+        h_step = (to_exact(settings.lrX) - to_exact(settings.ulX)) / int(settings.sizeX)
+        # Reference point at the tile center, on the pixel grid
+        rc = sizeX // 2
+        rr = sizeY // 2
+        key = (settings._gen_hash(), tuple(int(l) for l in limits), rc, rr)
+        if self._reference == None or self._reference[0] != key :
+            ref_x = to_exact(settings.ulX) + h_step * (int(limits[0]) + rc)
+            ref_y = to_exact(settings.ulY) - h_step * (int(limits[1]) + rr)
+            if settings.mandelbrot_mode == True :
+                orbit = self._reference_orbit(Fraction(0), Fraction(0), ref_x, ref_y, max_iter, h_step)
+            else :
+                orbit = self._reference_orbit(ref_x, ref_y, to_exact(settings.cX), to_exact(settings.cY), max_iter, h_step)
+            self._reference = (key, orbit)
+        Zr, Zi = self._reference[1]
+        # Pixel offsets from the reference, exact integers times one rounded step
+        h = float(h_step)
+        dx = (np.asarray(cols, dtype=np.float64) - rc) * h
+        dy = -(np.asarray(rows, dtype=np.float64) - rr) * h
+        if settings.mandelbrot_mode == True :
+            dcr = dx
+            dci = dy
+            dr = np.zeros(dx.size)
+            di = np.zeros(dx.size)
+        else :
+            dcr = np.zeros(dx.size)
+            dci = np.zeros(dx.size)
+            dr = dx
+            di = dy
+        n_rebase = self._iterate(Zr, Zi, dr, di, dcr, dci, max_iter, out, progress_report)
+        self.stats = {'reference_length' : len(Zr), 'rebases' : n_rebase}
+        return out
+
+    def _reference_orbit(self, z0r, z0i, cr, ci, max_iter, h_step) :
+        '''
+        Z_0..Z_n of the reference point in fixed point with enough bits to resolve h_step,
+        stops after the first |Z_n| > 2 (kept, pixels may still use it) or at max_iter
+        '''
+        bits = self.guard_bits
+        if h_step != 0 :
+            bits += max(0, h_step.denominator.bit_length() - h_step.numerator.bit_length())
+        one = 1 << bits
+        four = 4 << (2 * bits)
+        zr = int(z0r * one)
+        zi = int(z0i * one)
+        cr = int(cr * one)
+        ci = int(ci * one)
+        Zr = [zr]
+        Zi = [zi]
+        for n in range(max_iter) :
+            zr2 = zr * zr
+            zi2 = zi * zi
+            if zr2 + zi2 > four :
+                break
+            zi = ((zr * zi) >> (bits - 1)) + ci
+            zr = ((zr2 - zi2) >> bits) + cr
+            Zr.append(zr)
+            Zi.append(zi)
+        return np.array([float(Fraction(z, one)) for z in Zr]), np.array([float(Fraction(z, one)) for z in Zi])
+
+    def _iterate(self, Zr, Zi, dr, di, dcr, dci, max_iter, out, progress_report=False) :
+        out[:] = max_iter
+        n_ref = len(Zr)
+        idx = np.arange(out.size)
+        n_total = out.size
+        m = np.zeros(out.size, dtype=np.int64)
+        n_rebase = 0
+        for k in range(max_iter) :
+            zmr = Zr[m]
+            zmi = Zi[m]
+            zr = zmr + dr
+            zi = zmi + di
+            mag = zr * zr + zi * zi
+            esc = mag > 4.0
+            if esc.any() :
+                out[idx[esc]] = k
+                keep = ~esc
+                idx = idx[keep]
+                if idx.size == 0 :
+                    break
+                dr = dr[keep]
+                di = di[keep]
+                dcr = dcr[keep]
+                dci = dci[keep]
+                m = m[keep]
+                zmr = zmr[keep]
+                zmi = zmi[keep]
+                zr = zr[keep]
+                zi = zi[keep]
+                mag = mag[keep]
+                if progress_report == True :
+                    update_progress(1.0 - idx.size / n_total)
+            # Glitch / end of reference: restart these pixels against Z_0
+            rebase = (mag < dr * dr + di * di) | (m == n_ref - 1)
+            if rebase.any() :
+                n_rebase += int(np.count_nonzero(rebase))
+                dr[rebase] = zr[rebase] - Zr[0]
+                di[rebase] = zi[rebase] - Zi[0]
+                m[rebase] = 0
+                zmr[rebase] = Zr[0]
+                zmi[rebase] = Zi[0]
+            # d = 2 Z d + d^2 + dc
+            t = 2.0 * (zmr * dr - zmi * di) + dr * dr - di * di + dcr
+            di = 2.0 * (zmr * di + zmi * dr) + 2.0 * dr * di + dci
+            dr = t
+            m += 1
+        if progress_report == True :
+            update_progress(1)
+        return n_rebase
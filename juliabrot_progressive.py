@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import copy
+import numpy as np
+from juliabrot import JuliabrotData, JuliabrotGrid, update_progress, compute_aligned
+from juliabrot_cpu import tile_axes
+
+class JuliabrotProgressive :
+    '''
+    Progressive rendering: a tile is computed in passes on coarse lattices of the grid (every
+    8th, 4th, 2nd pixel ... then all), each pass gives a full size preview where every pixel
+    takes the value of its lattice point above/left, so a first image comes from 1/64 of the work.
+    With a software engine (compute_points) every pass only computes the lattice points not
+    done yet, coordinates are exact so the final image is the same as a single compute.  Other
+    engines (the PL) compute each coarse pass as a smaller grid with the same pixel spacing
+    '''
+    def __init__(self, engine, strides=(8, 4, 2, 1)) :
+        self.engine = engine
+        self.strides = strides
+
+    def compute(self, in_tile, in_progress_report=False) :
+        for stride, preview in self.passes(in_tile) :
+            if in_progress_report == True :
+                update_progress(1 / stride ** 2)
+        return in_tile
+
+    def passes(self, in_tile) :
+        '''
+        Generator of (stride, preview) for each pass, preview is a (sizeY, sizeX) uint32 array.
+        After the last pass (stride 1) in_tile.data holds the full result
+        '''
+        sizeX = int(in_tile.sizeX)
+        sizeY = int(in_tile.sizeY)
+        x0 = int(in_tile.limits[0])
+        y0 = int(in_tile.limits[1])
+        strides = [s for s in self.strides if s == 1 or (s <= sizeX and s <= sizeY)]
+        if hasattr(self.engine, 'compute_points') :
+            xs, ys = tile_axes(in_tile.grid, in_tile.limits, sizeX, sizeY, self.engine.dtype)
+            out = np.zeros((sizeY, sizeX), dtype=np.uint32)
+            known = np.zeros((sizeY, sizeX), dtype=bool)
+        for s in strides :
+            # Lattice points are the grid pixels at multiples of s
+            rows = np.arange((-y0) % s, sizeY, s)
+            cols = np.arange((-x0) % s, sizeX, s)
+            if hasattr(self.engine, 'compute_points') :
+                need = np.zeros_like(known)
+                need[np.ix_(rows, cols)] = True
+                need &= ~known
+                r, c = np.nonzero(need)
+                vals = np.empty(r.size, dtype=np.uint32)
+                self.engine.compute_points(in_tile.grid, xs[c], ys[r], vals)
+                out[r, c] = vals
+                known |= need
+                lattice = out
+            elif s == 1 :
+                # The PL computes the tile padded on a copy of the settings, its grid keeps its size
+                compute_aligned(self.engine, in_tile)
+                yield s, np.asarray(in_tile.data.iterations).reshape(int(in_tile.sizeY), int(in_tile.sizeX))
+                continue
+            else :
+                lattice = np.zeros((sizeY, sizeX), dtype=np.uint32)
+                lattice[np.ix_(rows, cols)] = self._coarse(in_tile, s, rows, cols)
+            if s == 1 :
+                in_tile.free_data()
+                data = JuliabrotData()
+                data.iterations = out
+                in_tile.data = data
+                yield s, out
+            else :
+                # Every pixel takes its lattice point above/left (the first one at the edges)
+                ri = np.maximum(((np.arange(sizeY) + y0) // s) * s - y0, rows[0])
+                ci = np.maximum(((np.arange(sizeX) + x0) // s) * s - x0, cols[0])
+                yield s, lattice[np.ix_(ri, ci)]
+
+    def _coarse(self, in_tile, s, rows, cols) :
+        '''
+        Iterations at tile rows/cols (grid multiples of s) from a grid s times coarser with the
+        same corner
+        '''
+        settings = in_tile.grid
+        h = settings.h_step()
+        coarse = copy.copy(settings)
+        coarse.sizeX = -(-int(settings.sizeX) // s)
+        coarse.sizeY = -(-int(settings.sizeY) // s)
+        coarse.lrX = settings.coord(settings.ulX + h * s * coarse.sizeX)
+        coarse.lrY = settings.coord(settings.ulY - h * s * coarse.sizeY)
+        tile = compute_aligned(self.engine, JuliabrotGrid(coarse).tile_list[0])
+        it = np.asarray(tile.data.iterations).reshape(int(tile.sizeY), int(tile.sizeX))
+        result = it[np.ix_((rows + int(in_tile.limits[1])) // s, (cols + int(in_tile.limits[0])) // s)].copy()
+        tile.free_data()
+        return result
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import copy
+import math
+import numpy as np
+from juliabrot import JuliabrotData, update_progress, to_exact
+from juliabrot_cpu import tile_axes
+
+def _ring(P, pred, tolerance) :
+    # Pixels of P on the edge of the tile or next to a pixel that is not in P with a close prediction
+    ring = np.zeros_like(P)
+    ring[0, :] = True
+    ring[-1, :] = True
+    ring[:, 0] = True
+    ring[:, -1] = True
+    same = P[1:, :] & P[:-1, :] & (np.abs(pred[1:, :] - pred[:-1, :]) <= tolerance)
+    ring[1:, :] |= ~same
+    ring[:-1, :] |= ~same
+    same = P[:, 1:] & P[:, :-1] & (np.abs(pred[:, 1:] - pred[:, :-1]) <= tolerance)
+    ring[:, 1:] |= ~same
+    ring[:, :-1] |= ~same
+    return ring & P
+
+def _grow(mask) :
+    # 4-neighbours of mask
+    g = np.zeros_like(mask)
+    g[1:, :] |= mask[:-1, :]
+    g[:-1, :] |= mask[1:, :]
+    g[:, 1:] |= mask[:, :-1]
+    g[:, :-1] |= mask[:, 1:]
+    return g
+
+def _window(a, m, fn) :
+    # fn (np.maximum or np.minimum) over every (2m+1) x (2m+1) window, one axis at a time
+    r = a[:, 0:a.shape[1]-2*m]
+    for d in range(1, 2 * m + 1) :
+        r = fn(r, a[:, d:a.shape[1]-2*m+d])
+    c = r[0:a.shape[0]-2*m]
+    for d in range(1, 2 * m + 1) :
+        c = fn(c, r[d:a.shape[0]-2*m+d])
+    return c
+
+class JuliabrotFrameReuse :
+    '''
+    Frame to frame reuse for zoom animations, wraps a software engine (compute_points).
+    Every pixel of a new frame is looked up in the previous frame's iterations, a pixel is
+    predicted when the counts around its source pixel (margin pixels each way) are all within
+    tolerance of each other, the prediction is the previous frame resampled bilinearly.
+    Pixels off the previous frame or not predicted are computed.  The predicted regions are
+    then checked from their edges inwards: the ring of each region is computed, where a
+    ring pixel is off its prediction by more than tolerance the computing moves further in, until
+    every region is bounded by computed pixels that agree with it.  With tolerance 0 that is
+    the Mariani-Silver argument, exact for the max_iterations interior of the Mandelbrot set
+    (interior_only limits prediction to it).  A tolerance above 0 also reuses the smooth
+    escape bands, which is where the savings are on boundary dense deep zooms, at the price of
+    counts that can be off by about tolerance.
+    verify computes that fraction of the predicted pixels at random (they keep the computed
+    counts), stats['error_bound'] is a 95% upper bound of the fraction of frame pixels that are
+    off by more than tolerance, from the mismatches found in that sample.
+    The first frame, frames with a different Julia point, and engines without compute_points
+    (the PL) are computed whole
+    '''
+    def __init__(self, engine, margin=1, tolerance=0, interior_only=False, verify=0.01, seed=0) :
+        self.engine = engine
+        self.margin = int(margin)
+        self.tolerance = int(tolerance)
+        self.interior_only = interior_only
+        self.verify = verify
+        self._rng = np.random.default_rng(seed)
+        self._prev = None
+        self.stats = {}
+
+    def reset(self) :
+        self._prev = None
+
+    def compute(self, in_tile, in_progress_report=False) :
+        sizeX = int(in_tile.sizeX)
+        sizeY = int(in_tile.sizeY)
+        pred = None
+        if hasattr(self.engine, 'compute_points') :
+            pred = self._predict(in_tile)
+        if pred is None :
+            tile = self.engine.compute(in_tile, in_progress_report)
+            self.stats = {'computed' : sizeX * sizeY, 'predicted' : 0, 'sampled' : 0, 'mismatches' : 0,
+                          'error_bound' : 0.0, 'rounds' : 1}
+            self._remember(tile)
+            return tile
+        in_tile.free_data()
+        settings = in_tile.grid
+        xs, ys = tile_axes(settings, in_tile.limits, sizeX, sizeY, self.engine.dtype)
+        out = np.zeros((sizeY, sizeX), dtype=np.uint32)
+        P = pred >= 0
+        ring = _ring(P, pred, self.tolerance)
+        P &= ~ring
+        # Every compute_points call runs as many steps as its slowest point, so the pixels that
+        #  are not predicted, the first rings and the verify sample all go in one call
+        sample = np.zeros_like(P)
+        n_sampled = 0
+        if self.verify > 0 and P.any() :
+            rows, cols = np.nonzero(P)
+            n_sampled = min(rows.size, max(1, int(math.ceil(self.verify * rows.size))))
+            pick = self._rng.choice(rows.size, n_sampled, replace=False)
+            sample[rows[pick], cols[pick]] = True
+            P &= ~sample
+        n_computed = self._points(settings, xs, ys, ~P, out)
+        off = np.abs(out - pred) > self.tolerance
+        n_bad = int(np.count_nonzero(sample & off))
+        n_rounds = 1
+        # Where a ring pixel is off its prediction, compute further in, twice as deep each round
+        fail = ring & off & _grow(P)
+        depth = 1
+        while fail.any() :
+            n_rounds += 1
+            band = fail
+            for i in range(depth) :
+                band = band | _grow(band)
+            band &= P
+            n_computed += self._points(settings, xs, ys, band, out)
+            P &= ~band
+            fail = band & (np.abs(out - pred) > self.tolerance) & _grow(P)
+            depth *= 2
+            if in_progress_report == True :
+                update_progress(1 - np.count_nonzero(P) / P.size)
+        out[P] = pred[P]
+        n_predicted = int(np.count_nonzero(P))
+        data = JuliabrotData()
+        data.iterations = out
+        in_tile.data = data
+        self.stats = {'computed' : n_computed, 'predicted' : n_predicted, 'sampled' : n_sampled,
+                      'mismatches' : n_bad, 'rounds' : n_rounds,
+                      'error_bound' : self._upper_bound(n_bad, n_sampled) * n_predicted / out.size}
+        self._remember(in_tile)
+        return in_tile
+
+    def _points(self, settings, xs, ys, mask, out) :
+        rows, cols = np.nonzero(mask)
+        vals = np.empty(rows.size, dtype=np.uint32)
+        self.engine.compute_points(settings, xs[cols], ys[rows], vals)
+        out[rows, cols] = vals
+        return rows.size
+
+    def _upper_bound(self, m, n) :
+        '''
+        Wilson 95% upper bound of a rate seen m times in n samples
+        '''
+        if n == 0 :
+            return 1.0
+        z = 1.96
+        p = m / n
+        c = p + z * z / (2 * n)
+        r = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        return min(1.0, (c + r) / (1 + z * z / n))
+
+    def _remember(self, in_tile) :
+        # The iterations stay referenced here after the caller frees the tile
+        it = np.asarray(in_tile.data.iterations).reshape(int(in_tile.sizeY), int(in_tile.sizeX))
+        self._prev = (copy.copy(in_tile.grid), tuple(int(l) for l in in_tile.limits), it)
+
+    def _predict(self, in_tile) :
+        '''
+        Predicted count of every tile pixel from the previous frame, -1 where there is none
+        '''
+        if self._prev == None :
+            return None
+        ps, plim, prev = self._prev
+        s = in_tile.grid
+        if bool(ps.mandelbrot_mode) != bool(s.mandelbrot_mode) :
+            return None
+        if s.mandelbrot_mode != True and (to_exact(ps.cX) != to_exact(s.cX) or to_exact(ps.cY) != to_exact(s.cY)) :
+            return None
+        hp = (to_exact(ps.lrX) - to_exact(ps.ulX)) / int(ps.sizeX)
+        h = (to_exact(s.lrX) - to_exact(s.ulX)) / int(s.sizeX)
+        scale = float(h / hp)
+        ox = float((to_exact(s.ulX) - to_exact(ps.ulX)) / hp) - plim[0]
+        oy = float((to_exact(ps.ulY) - to_exact(s.ulY)) / hp) - plim[1]
+        fx = ox + scale * (np.arange(int(in_tile.sizeX)) + int(in_tile.limits[0]))
+        fy = oy + scale * (np.arange(int(in_tile.sizeY)) + int(in_tile.limits[1]))
+        ix = np.rint(fx).astype(np.int64)
+        iy = np.rint(fy).astype(np.int64)
+        m = self.margin
+        H, W = prev.shape
+        if H <= 2 * m or W <= 2 * m :
+            return None
+        # Spread of the counts in each neighbourhood, indexed by its center - m
+        uniform = (_window(prev, m, np.maximum) - _window(prev, m, np.minimum)) <= self.tolerance
+        okx = (ix >= m) & (ix < W - m)
+        oky = (iy >= m) & (iy < H - m)
+        cx = np.clip(ix - m, 0, W - 2 * m - 1)
+        cy = np.clip(iy - m, 0, H - 2 * m - 1)
+        ok = uniform[np.ix_(cy, cx)] & oky[:, np.newaxis] & okx[np.newaxis, :]
+        # The 4 bilinear neighbours are inside the window of the nearest pixel
+        x0 = np.clip(np.floor(fx).astype(np.int64), 0, W - 2)
+        y0 = np.clip(np.floor(fy).astype(np.int64), 0, H - 2)
+        wx = np.clip(fx - x0, 0, 1)[np.newaxis, :]
+        wy = np.clip(fy - y0, 0, 1)[:, np.newaxis]
+        p = prev.astype(np.float64)
+        pred = ((1 - wy) * ((1 - wx) * p[np.ix_(y0, x0)] + wx * p[np.ix_(y0, x0 + 1)])
+                + wy * ((1 - wx) * p[np.ix_(y0 + 1, x0)] + wx * p[np.ix_(y0 + 1, x0 + 1)]))
+        pred = np.rint(pred).astype(np.int64)
+        # Counts at the old max_iterations are the interior, anything above a new max clamps
+        old_max = int(ps.max_iterations)
+        new_max = int(s.max_iterations)
+        pred[pred == old_max] = new_max
+        np.minimum(pred, new_max, out=pred)
+        if self.interior_only == True :
+            ok &= pred == new_max
+        pred[~ok] = -1
+        return pred
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import json
+import numpy as np
+from juliabrot import JuliabrotData, JuliabrotGrid, JuliabrotTile, JuliabrotGridSettings, update_progress, aligned_tile
+
+class JuliabrotStore :
+    '''
+    On disk iteration store for a grid, a directory with:
+        iterations.npy - (sizeY, sizeX) uint32, opened as a memory map
+        settings.json  - the grid settings in the same format as the catalog files
+        index.json     - settings crc, the limits of the grid's tiles and of those already computed
+    compute() writes each finished tile into the map and records it in the index, a render that
+    gets interrupted picks up from the finished tiles when run again.  Finished tiles have their
+    data pointed at their part of the map, so coloring/exporting reads it lazily.
+    Opening a store whose settings (crc) no longer match the grid starts it over
+    '''
+    def __init__(self, path, in_grid=None) :
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        index = self._read_index()
+        if in_grid == None :
+            # Re-open an existing store with its saved settings and tiles
+            in_grid = JuliabrotGrid(JuliabrotGridSettings(), self._file('settings.json'))
+            in_grid.tile_list = []
+            for limits in index["tiles"] :
+                JuliabrotTile(in_grid, limits)
+        self.grid = in_grid
+        settings = in_grid.settings
+        self.crc = settings._gen_crc()
+        shape = (int(settings.sizeY), int(settings.sizeX))
+        if index != None and index["crc"] == self.crc and os.path.exists(self._file('iterations.npy')) :
+            self.done = [tuple(l) for l in index["done"]]
+            self.iterations = np.load(self._file('iterations.npy'), mmap_mode='r+')
+            assert self.iterations.shape == shape, 'Stored iterations do not match grid size'
+        else :
+            self.done = []
+            self.iterations = np.lib.format.open_memmap(self._file('iterations.npy'), mode='w+', dtype=np.uint32, shape=shape)
+            settings._to_json(0, 0, settings.color_mode, "", settings.hue, settings.val, settings.sat, settings.modulo, settings.m_color)
+            with open(self._file('settings.json'), "w") as write_file :
+                json.dump(settings._pre_json_save, write_file)
+            self._write_index()
+
+    def _file(self, name) :
+        return os.path.join(self.path, name)
+
+    def _read_index(self) :
+        if not os.path.exists(self._file('index.json')) :
+            return None
+        with open(self._file('index.json'), "r") as read_file :
+            return json.load(read_file)
+
+    def _write_index(self) :
+        # Write then rename so an interrupted write never leaves a broken index
+        tmp = self._file('index.json.tmp')
+        with open(tmp, "w") as write_file :
+            tiles = [[int(l) for l in tile.limits] for tile in self.grid.tile_list]
+            json.dump({"crc" : self.crc, "tiles" : tiles, "done" : [list(l) for l in self.done]}, write_file)
+        os.replace(tmp, self._file('index.json'))
+
+    def view(self, limits) :
+        '''
+        The memory mapped (rows, cols) part of the grid covered by limits
+        '''
+        return self.iterations[limits[1]:limits[3]+1, limits[0]:limits[2]+1]
+
+    def is_done(self, in_tile) :
+        return tuple(int(l) for l in in_tile.limits) in self.done
+
+    def is_complete(self) :
+        return all(self.is_done(tile) for tile in self.grid.tile_list)
+
+    def attach(self, in_tile) :
+        '''
+        Points a finished tile's data at the map
+        '''
+        in_tile.free_data()
+        data = JuliabrotData()
+        data.iterations = self.view(in_tile.limits)
+        in_tile.data = data
+        return in_tile
+
+    def store(self, in_tile, iterations=None) :
+        '''
+        Writes a computed tile into the map, marks it done and re-points its data at the map.
+        iterations defaults to the tile's own, columns past the tile (or the map) are cut off
+        '''
+        # A tile the PL padded reaches past the map, record the part that is in it
+        limits = (int(in_tile.limits[0]), int(in_tile.limits[1]),
+                  min(int(in_tile.limits[2]), self.iterations.shape[1] - 1), int(in_tile.limits[3]))
+        rows = limits[3] - limits[1] + 1
+        cols = limits[2] - limits[0] + 1
+        if iterations is None :
+            iterations = in_tile.data.iterations
+        # The PL returns flat (possibly column padded) data
+        it = np.asarray(iterations).reshape(rows, -1)
+        self.view(limits)[:, :] = it[:, :cols]
+        self.iterations.flush()
+        if limits not in self.done :
+            self.done.append(limits)
+            self._write_index()
+        return self.attach(in_tile)
+
+    def compute(self, engine, in_progress_report=False) :
+        '''
+        Computes every tile of the grid that is not in the store yet with engine (Juliabrot or a
+        software engine), returns the number of tiles computed
+        '''
+        tiles = self.grid.tile_list
+        n = 0
+        for i, tile in enumerate(tiles) :
+            if self.is_done(tile) :
+                self.attach(tile)
+            else :
+                work = aligned_tile(engine, tile)
+                engine.compute(work)
+                self.store(tile, work.data.iterations)
+                if work is not tile :
+                    work.free_data()
+                n += 1
+            if in_progress_report == True :
+                update_progress((i + 1) / len(tiles))
+        return n
+
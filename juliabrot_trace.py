@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+""" BSD 3-Clause License
+
+Copyright (c) 2020, Fred Kellerman
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+3. Neither the name of the copyright holder nor the names of its
+   contributors may be used to endorse or promote products derived from
+   this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import json
+import math
+import time
+import threading
+import functools
+import numpy as np
+
+# Off by default, every hook below is then a call and a test of this flag
+enabled = False
+
+now = time.perf_counter
+
+_lock = threading.Lock()
+_events = []
+# Per stage [count, total, min, max, bin counts], a fixed size whatever the number of spans
+_stats = {}
+_counters = {}
+_max_events = 1 << 20
+_dropped = 0
+_t0 = 0.0
+
+# Span durations are binned on log spaced bins from 1us to 100s as they are recorded, shorter
+#  and longer ones go to the end bins.  histograms() can regroup them by any divisor of this
+_BINS_PER_DECADE = 20
+_LOG_MIN = -6
+_N_BINS = 8 * _BINS_PER_DECADE
+
+class _NullSpan :
+    __slots__ = ()
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *args) :
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span :
+    __slots__ = ('name', 'cat', 'args', 't')
+
+    def __init__(self, name, cat, args) :
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self) :
+        self.t = now()
+        return self
+
+    def __exit__(self, *args) :
+        _record(self.name, self.cat, self.t, now(), self.args)
+        return False
+
+def _record(name, cat, t_start, t_end, args) :
+    global _dropped
+    dur = t_end - t_start
+    b = int((math.log10(dur) - _LOG_MIN) * _BINS_PER_DECADE) if dur > 0 else 0
+    b = min(max(b, 0), _N_BINS - 1)
+    with _lock :
+        st = _stats.get(name)
+        if st == None :
+            _stats[name] = [1, dur, dur, dur, np.zeros(_N_BINS, dtype=np.int64)]
+            st = _stats[name]
+        else :
+            st[0] += 1
+            st[1] += dur
+            st[2] = min(st[2], dur)
+            st[3] = max(st[3], dur)
+        st[4][b] += 1
+        if len(_events) < _max_events :
+            event = {'name' : name, 'cat' : cat, 'ph' : 'X', 'ts' : (t_start - _t0) * 1e6, 'dur' : dur * 1e6,
+                     'pid' : os.getpid(), 'tid' : threading.get_ident()}
+            if args :
+                event['args'] = args
+            _events.append(event)
+        else :
+            _dropped += 1
+
+def span(name, cat='juliabrot', **args) :
+    '''
+    Context manager timing a named stage, a no-op unless tracing is enabled
+    '''
+    if enabled == False :
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+def complete(name, t_start, cat='juliabrot', **args) :
+    '''
+    Records a span from t_start (a now() taken earlier) to now, for stages that are not a block
+    of code, e.g. the wait for the next packet of a DMA stream
+    '''
+    if enabled == True :
+        _record(name, cat, t_start, now(), args)
+
+def count(name, value=1) :
+    '''
+    Adds value to a named counter, exported as a counter track of its running total
+    '''
+    if enabled == False :
+        return
+    with _lock :
+        _counters[name] = _counters.get(name, 0) + value
+        if len(_events) < _max_events :
+            _events.append({'name' : name, 'ph' : 'C', 'ts' : (now() - _t0) * 1e6, 'pid' : os.getpid(),
+                            'args' : {name : _counters[name]}})
+
+def traced(name=None, cat='juliabrot') :
+    '''
+    Decorator, every call of the function is a span (named after the function by default)
+    '''
+    def wrap(func) :
+        label = name if name != None else func.__name__
+        @functools.wraps(func)
+        def call(*args, **kwargs) :
+            if enabled == False :
+                return func(*args, **kwargs)
+            with _Span(label, cat, None) :
+                return func(*args, **kwargs)
+        return call
+    return wrap
+
+def enable(max_events=1 << 20) :
+    '''
+    Starts tracing from a clean slate, at most max_events events are kept for the trace file
+    (the histograms still see every span)
+    '''
+    global enabled, _max_events
+    reset()
+    _max_events = max_events
+    enabled = True
+
+def disable() :
+    global enabled
+    enabled = False
+
+def reset() :
+    global _dropped, _t0
+    with _lock :
+        del _events[:]
+        _stats.clear()
+        _counters.clear()
+        _dropped = 0
+        _t0 = now()
+
+def counters() :
+    with _lock :
+        return dict(_counters)
+
+def save_chrome_trace(filename) :
+    '''
+    Writes the events in Chrome trace event format, open it in chrome://tracing or Perfetto
+    '''
+    with _lock :
+        trace = {'traceEvents' : list(_events), 'displayTimeUnit' : 'ms',
+                 'otherData' : {'dropped_events' : _dropped, 'counters' : dict(_counters)}}
+    with open(filename, 'w') as write_file :
+        json.dump(trace, write_file)
+
+def _percentile(counts, edges, lo, hi, q) :
+    # Log interpolated within the bin holding the q quantile, clamped to the seen min and max
+    n = counts.sum()
+    cum = np.cumsum(counts)
+    target = q / 100.0 * n
+    b = int(np.searchsorted(cum, target))
+    b = min(b, counts.size - 1)
+    below = cum[b] - counts[b]
+    frac = (target - below) / counts[b] if counts[b] > 0 else 0.0
+    x = edges[b] * (edges[b + 1] / edges[b]) ** frac
+    return float(min(max(x, lo), hi))
+
+def histograms(bins_per_decade=4) :
+    '''
+    Per stage duration statistics and a histogram on log spaced bins from 1us to 100s.
+    Returns name -> dict of count, total/mean/percentiles/max in seconds, bin edges and counts.
+    Percentiles are estimated from the recorded bins (1/20 decade), bins_per_decade must divide 20
+    '''
+    assert _BINS_PER_DECADE % bins_per_decade == 0, 'bins_per_decade must divide ' + str(_BINS_PER_DECADE)
+    group = _BINS_PER_DECADE // bins_per_decade
+    fine_edges = 10.0 ** (_LOG_MIN + np.arange(_N_BINS + 1) / _BINS_PER_DECADE)
+    edges = fine_edges[::group]
+    with _lock :
+        stats = {name : (st[0], st[1], st[2], st[3], st[4].copy()) for name, st in _stats.items()}
+    result = {}
+    for name, (n, total, lo, hi, fine) in stats.items() :
+        p50, p90, p99 = [_percentile(fine, fine_edges, lo, hi, q) for q in (50, 90, 99)]
+        result[name] = {'count' : int(n), 'total_s' : float(total), 'mean_s' : float(total / n),
+                        'p50_s' : p50, 'p90_s' : p90, 'p99_s' : p99, 'max_s' : float(hi),
+                        'edges_s' : edges.tolist(), 'counts' : fine.reshape(-1, group).sum(axis=1).tolist()}
+    return result
+
+def report() :
+    '''
+    Prints a table of the stages by total time, with each one's share of the traced wall time
+    '''
+    wall = now() - _t0
+    h = histograms()
+    print("{0:24s} {1:>8s} {2:>10s} {3:>7s} {4:>10s} {5:>10s} {6:>10s}".format(
+          'stage', 'count', 'total ms', 'wall %', 'p50 us', 'p99 us', 'max us'))
+    for name in sorted(h, key=lambda n : -h[n]['total_s']) :
+        s = h[name]
+        print("{0:24s} {1:8d} {2:10.2f} {3:7.1f} {4:10.1f} {5:10.1f} {6:10.1f}".format(
+              name, s['count'], s['total_s'] * 1e3, 100 * s['total_s'] / wall if wall > 0 else 0,
+              s['p50_s'] * 1e6, s['p99_s'] * 1e6, s['max_s'] * 1e6))
+    for name, value in counters().items() :
+        print("{0:24s} {1}".format(name, value))
@@ -34,11 +34,17 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import numpy as np
 import os
+import asyncio
 from ipycanvas import Canvas, MultiCanvas, hold_canvas
 from ipywidgets import interact, Button, ColorPicker, FloatLogSlider, IntSlider, FloatSlider, link, AppLayout, HBox, VBox, Dropdown
-from juliabrot import JuliabrotGrid, JuliabrotTile, Juliabrot, JuliabrotGridSettings
+from juliabrot import JuliabrotGrid, JuliabrotTile, Juliabrot, JuliabrotGridSettings, JuliabrotData
 from cv2 import imwrite
 import juliabrot_coloring as jcolor
+import juliabrot_trace as jtrace
+from juliabrot_cache import RenderCache
+from juliabrot_history import ViewHistory
+from juliabrot_progressive import JuliabrotProgressive
+from juliabrot_pan import pan_grid
 import copy
 #from fxpmath import Fxp
 
@@ -47,10 +53,22 @@ import copy
 #########################################################
 
 juliabrot = None
+# Undo, revisited presets and thumbnails come back from here instead of the PL
+render_cache = RenderCache()
 background_layer = 0
 drawing_layer = 1
 interaction_layer = 2
-jgrid_history = []
+view_history = ViewHistory(render_cache)
+# Set True to show coarse previews (1/8, 1/4, 1/2 resolution) while a view computes
+progressive = False
+# Palette control events closer together than this (seconds) are drawn once, with the last state
+recolor_delay = 0.05
+_recolor_handle = None
+# id(tile) -> [data, color key, rgb, histogram values], so unchanged tiles are not colored or sent again
+_tile_colors = {}
+# color_list values that are palette LUTs
+_lut_modes = {1 : 'rainbow', 2 : 'classic', 3 : 'log', 5 : 'rainbow2'}
+_restoring_view = False
 status_offset = 25
 catalog_path = './catalog/'
 remote_host = None
@@ -77,17 +95,17 @@ def display_info(in_canvases, in_grid) :
     in_canvases[drawing_layer].clear()
     y_spacing = 30
     y_pos = y_spacing
-    in_canvases[drawing_layer].fill_text('ul X: ' + str(in_grid.settings.ulX), in_canvases[drawing_layer].width/2.2+10, y_pos)
+    in_canvases[drawing_layer].fill_text('ul X: ' + in_grid.settings.coord_str(in_grid.settings.ulX), in_canvases[drawing_layer].width/2.2+10, y_pos)
     y_pos += y_spacing 
-    in_canvases[drawing_layer].fill_text('ul Y: ' + str(in_grid.settings.ulY), in_canvases[drawing_layer].width/2.2+10, y_pos)
+    in_canvases[drawing_layer].fill_text('ul Y: ' + in_grid.settings.coord_str(in_grid.settings.ulY), in_canvases[drawing_layer].width/2.2+10, y_pos)
     y_pos += y_spacing 
-    in_canvases[drawing_layer].fill_text('lr X: ' + str(in_grid.settings.lrX), in_canvases[drawing_layer].width/2.2+10, y_pos)
+    in_canvases[drawing_layer].fill_text('lr X: ' + in_grid.settings.coord_str(in_grid.settings.lrX), in_canvases[drawing_layer].width/2.2+10, y_pos)
     y_pos += y_spacing 
-    in_canvases[drawing_layer].fill_text('lr Y: ' + str(in_grid.settings.lrY), in_canvases[drawing_layer].width/2.2+10, y_pos)
+    in_canvases[drawing_layer].fill_text('lr Y: ' + in_grid.settings.coord_str(in_grid.settings.lrY), in_canvases[drawing_layer].width/2.2+10, y_pos)
     y_pos += y_spacing 
-    in_canvases[drawing_layer].fill_text('cX: ' + str(in_grid.settings.cX), in_canvases[drawing_layer].width/2.2+10, y_pos)
+    in_canvases[drawing_layer].fill_text('cX: ' + in_grid.settings.coord_str(in_grid.settings.cX), in_canvases[drawing_layer].width/2.2+10, y_pos)
     y_pos += y_spacing 
-    in_canvases[drawing_layer].fill_text('cY: ' + str(in_grid.settings.cY), in_canvases[drawing_layer].width/2.2+10, y_pos)
+    in_canvases[drawing_layer].fill_text('cY: ' + in_grid.settings.coord_str(in_grid.settings.cY), in_canvases[drawing_layer].width/2.2+10, y_pos)
     y_pos += y_spacing
     in_canvases[drawing_layer].fill_text('sizeX: ' + str(int(in_grid.settings.sizeX)), in_canvases[drawing_layer].width/2.2+10, y_pos)
     y_pos += y_spacing
@@ -121,24 +139,99 @@ def show_canvas(in_canvases, in_tiles, in_offset=(0,0)) :
     in_canvases[interaction_layer].clear()
     canvases[interaction_layer].fill_style = save_style
     for in_tile in in_tiles :
-        rgb = color_data(in_tile, color_it)
-    in_canvases[background_layer].put_image_data(rgb, in_offset[0] + in_tile.limits[0], in_offset[1] + in_tile.limits[1])
+        rgb, changed = tile_rgb(in_tile, color_it)
+        if changed == True :
+            with jtrace.span('put_image_data') :
+                in_canvases[background_layer].put_image_data(rgb, in_offset[0] + in_tile.limits[0], in_offset[1] + in_tile.limits[1])
+    if in_tiles is jgrid.tile_list :
+        # Forget tiles that are no longer in the view
+        ids = set(id(tile) for tile in in_tiles)
+        for tile_id in [i for i in _tile_colors if i not in ids] :
+            del _tile_colors[tile_id]
+
+def tile_rgb(in_tile, color_mode) :
+    '''
+    Colors a tile, returns (rgb, changed).  The last colors of each tile are kept, a tile whose
+    data and color settings are the same as last time is not colored again (changed is False).
+    For palette modes the tile's count histogram is kept too, so Log mode never has to scan the
+    frame for its brightness scale when only the palette changes
+    '''
+    choice = color_list.value
+    sat_val = sat_slider.value if color_mode == True else 0
+    max_iter = int(in_tile.grid.max_iterations)
+    key = (choice, hue_slider.value, sat_val, val_slider.value, modulo_slider.value, picker1.value, max_iter, in_tile.sizeX, in_tile.sizeY)
+    entry = _tile_colors.get(id(in_tile))
+    same_data = entry != None and entry[0] is in_tile.data
+    if same_data == True and entry[1] == key :
+        return entry[2], False
+    if choice not in _lut_modes :
+        rgb = color_data(in_tile, color_mode)
+        _tile_colors[id(in_tile)] = [in_tile.data, key, rgb, None]
+        return rgb, True
+    name = _lut_modes[choice]
+    data = np.asarray(in_tile.data.iterations).reshape(int(in_tile.sizeY), int(in_tile.sizeX))
+    values = entry[3] if same_data == True else None
+    top = None
+    if name == 'log' :
+        if values is None :
+            # Counts present in the tile, a histogram when it is small enough
+            if max_iter < (1 << 20) :
+                values = np.flatnonzero(np.bincount(data.reshape(-1), minlength=max_iter + 1))
+            else :
+                values = np.unique(data)
+        top = int((values % int(modulo_slider.value)).max())
+    out = entry[2] if entry != None and entry[2].shape == (data.shape[0], data.shape[1], 3) else None
+    rgb = jcolor.color_palette(name, data, max_iter, hue_slider.value, sat_val, val_slider.value, modulo_slider.value, picker1.value, out, top)
+    _tile_colors[id(in_tile)] = [in_tile.data, key, rgb, values]
+    return rgb, True
+
+def request_recolor() :
+    '''
+    Redraws the colors of the current view, bursts of palette events collapse into one redraw
+    '''
+    global _recolor_handle
+    try :
+        loop = asyncio.get_running_loop()
+    except RuntimeError :
+        # Not called from the kernel's event loop (e.g. a script), draw right away
+        show_canvas(canvases, jgrid.tile_list)
+        return
+    if _recolor_handle != None :
+        _recolor_handle.cancel()
+    _recolor_handle = loop.call_later(recolor_delay, _recolor)
+
+def _recolor() :
+    global _recolor_handle
+    _recolor_handle = None
+    show_canvas(canvases, jgrid.tile_list)
 
-def draw_fractal(in_canvases, in_tiles, in_progress_report = False) :
+def draw_fractal(in_canvases, in_tiles, in_progress_report = False, in_record = True) :
     save_style = canvases[interaction_layer].fill_style
     canvases[interaction_layer].fill_style = '#aa4400'
     in_canvases[interaction_layer].clear()
     in_canvases[interaction_layer].fill_text('Status: Computing', in_canvases[drawing_layer].width/2+10, in_canvases[drawing_layer].height-status_offset)
     for in_tile in in_tiles :
-        juliabrot.compute(in_tile, in_progress_report)
+        if progressive == True :
+            draw_progressive(in_canvases, in_tile)
+        else :
+            render_cache.compute(juliabrot, in_tile, in_progress_report)
     in_canvases[interaction_layer].clear()
     canvases[interaction_layer].fill_style = save_style
     show_canvas(in_canvases, in_tiles)
-
-    jgrid_history.append(copy.deepcopy(jgrid)) # Have to deep copy to retain the member settings
-    # But we can free up the history data, since it will get recalculated again anyways
-    for tile in jgrid_history[-1].tile_list :
-        tile.data = None
+    if in_record == True :
+        view_history.push(jgrid)
+
+def draw_progressive(in_canvases, in_tile) :
+    key = render_cache.key(in_tile)
+    if render_cache.get(in_tile, key) == True :
+        return
+    for stride, preview in JuliabrotProgressive(juliabrot).passes(in_tile) :
+        if stride > 1 :
+            data = JuliabrotData()
+            data.iterations = preview
+            in_tile.data = data
+            show_canvas(in_canvases, [in_tile])
+    render_cache.put(in_tile, key)
 
 def draw_line(in_canvas, in_start, in_end) :
     in_canvas.begin_path()
@@ -148,7 +241,8 @@ def draw_line(in_canvas, in_start, in_end) :
     in_canvas.close_path()
 
 def _to_fixed(x) :
-    return x #Fxp(x, True, _FXP_N_WORD, _FXP_N_FRAC)
+    # Keep coordinates in the grid's precision (longdouble or exact)
+    return jgrid.settings.coord(x) #Fxp(x, True, _FXP_N_WORD, _FXP_N_FRAC)
 
 #########################################################
 #  Mouse events section
@@ -166,16 +260,16 @@ def on_mouse_down(x, y) :
 
             if abs(ulx_select - x) <= 2 :
                 # Double click in same spot sets Julia values
-                h_step = (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-                jgrid.settings.cX = _to_fixed(jgrid.settings.ulX + h_step * x)
-                jgrid.settings.cY = _to_fixed(jgrid.settings.ulY - h_step * y)
+                h_step = jgrid.settings.h_step()
+                jgrid.settings.cX = _to_fixed(jgrid.settings.ulX + h_step * _to_fixed(x))
+                jgrid.settings.cY = _to_fixed(jgrid.settings.ulY - h_step * _to_fixed(y))
                 display_info(canvases, jgrid)
                 if jgrid.settings.mandelbrot_mode == False :
                     draw_fractal(canvases, jgrid.tile_list)
             else :
                 lrx_select = int(x)
                 lry_select = int(uly_select + (x - ulx_select) * np.longdouble(jgrid.settings.sizeY) / jgrid.settings.sizeX)
-                h_step = (jgrid.settings.lrX - jgrid.settings.ulX) * (np.longdouble(1.0) / jgrid.settings.sizeX)
+                h_step = jgrid.settings.h_step()
                 jgrid.settings.ulX = _to_fixed(jgrid.settings.ulX + h_step * ulx_select)
                 jgrid.settings.ulY = _to_fixed(jgrid.settings.ulY - h_step * uly_select)
                 jgrid.settings.lrX = _to_fixed(jgrid.settings.ulX + h_step * (lrx_select - ulx_select))
@@ -212,28 +306,29 @@ def on_mouse_move(x, y) :
 #########################################################
 
 def bdown_button_handler(x) :
-    global jgrid
     bump_pixels = bump_ud_slider.value
-    if bump_pixels > 0 :
-        vstep = bump_pixels * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    else :
-        vstep = jgrid.settings.sizeY * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    jgrid.settings.lrY = _to_fixed(jgrid.settings.lrY + vstep)
-    jgrid.settings.ulY = _to_fixed(jgrid.settings.ulY + vstep)
-    display_info(canvases, jgrid)
-    draw_fractal(canvases, jgrid.tile_list)
+    if bump_pixels == 0 :
+        bump_pixels = int(jgrid.settings.sizeY)
+    pan_view(0, -bump_pixels)
 
 def bup_button_handler(x) :
-    global jgrid
     bump_pixels = bump_ud_slider.value
-    if bump_pixels > 0 :
-        vstep = bump_pixels * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    else :
-        vstep = jgrid.settings.sizeY * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    jgrid.settings.lrY = _to_fixed(jgrid.settings.lrY - vstep)
-    jgrid.settings.ulY = _to_fixed(jgrid.settings.ulY - vstep)
+    if bump_pixels == 0 :
+        bump_pixels = int(jgrid.settings.sizeY)
+    pan_view(0, bump_pixels)
+
+def pan_view(dx, dy) :
+    # Shift the view by whole pixels, only the newly exposed strips get computed.  That needs the
+    #  moved corners to land on the old pixel lattice, which longdouble corners rarely do, so the
+    #  view is carried on in exact precision (its longdouble corners convert without rounding)
+    if jgrid.settings.precision != 'exact' :
+        jgrid.settings.set_precision('exact')
+    pan_grid(juliabrot, jgrid, dx, dy)
+    for tile in jgrid.tile_list :
+        render_cache.put(tile)
     display_info(canvases, jgrid)
-    draw_fractal(canvases, jgrid.tile_list)
+    show_canvas(canvases, jgrid.tile_list)
+    view_history.push(jgrid)
 
 def save_button_handler(x) :
     canvases[interaction_layer].fill_style = '#00aa00'
@@ -271,7 +366,7 @@ def save_png(filename, x_width=120) :
     x = int(x_width)
     y = int(grid.tile_list[0].sizeY * scale)
     grid.set_size(x, y)
-    tile = juliabrot.compute(grid.tile_list[0])
+    tile = render_cache.compute(juliabrot, grid.tile_list[0])
     tmp = color_data(tile, color_it)
     rgb = np.empty(shape=(y,x,3), dtype=np.uint8)
     rgb[:,:,0] = tmp[:,:,2]
@@ -280,41 +375,40 @@ def save_png(filename, x_width=120) :
     imwrite(filename, rgb)
     
 def bright_button_handler(x) :
-    global jgrid
     bump_pixels = bump_lr_slider.value
-    if bump_pixels > 0 :
-        hstep = bump_pixels * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    else :
-        hstep = jgrid.settings.sizeX * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    jgrid.settings.lrX = _to_fixed(jgrid.settings.lrX - hstep)
-    jgrid.settings.ulX = _to_fixed(jgrid.settings.ulX - hstep)
-    display_info(canvases, jgrid)
-    draw_fractal(canvases, jgrid.tile_list)
+    if bump_pixels == 0 :
+        bump_pixels = int(jgrid.settings.sizeX)
+    pan_view(-bump_pixels, 0)
 
 def bleft_button_handler(x) :
-    global jgrid
     bump_pixels = bump_lr_slider.value
-    if bump_pixels > 0 :
-        hstep = bump_pixels * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    else :
-        hstep = jgrid.settings.sizeX * (jgrid.settings.lrX - jgrid.settings.ulX) / jgrid.settings.sizeX
-    jgrid.settings.lrX = _to_fixed(jgrid.settings.lrX + hstep)
-    jgrid.settings.ulX = _to_fixed(jgrid.settings.ulX + hstep)
-    display_info(canvases, jgrid)
-    draw_fractal(canvases, jgrid.tile_list)
+    if bump_pixels == 0 :
+        bump_pixels = int(jgrid.settings.sizeX)
+    pan_view(bump_pixels, 0)
     
+def show_view(snapshot) :
+    global _restoring_view
+    has_data = snapshot.restore(jgrid)
+    if iter_slider.value != jgrid.settings.max_iterations :
+        # Only sync the slider, its handler would draw and record a new view
+        _restoring_view = True
+        iter_slider.value = jgrid.settings.max_iterations
+        _restoring_view = False
+    display_info(canvases, jgrid)
+    if has_data == True :
+        show_canvas(canvases, jgrid.tile_list)
+    else :
+        draw_fractal(canvases, jgrid.tile_list, in_record=False)
+
 def undo_button_handler(x) :
-    global jgrid, preview_data, iter_slider
-    if len(jgrid_history) > 1 :
-        jgrid_history.pop()  # Throw away where we're currently at
-        jgrid = jgrid_history.pop()
-        s1_val = jgrid.settings.max_iterations
-        if iter_slider.value != s1_val :
-            # The change will force a draw_fractal
-            iter_slider.value = s1_val
-        else :
-            display_info(canvases, jgrid)
-            draw_fractal(canvases, jgrid.tile_list)
+    snapshot = view_history.undo()
+    if snapshot != None :
+        show_view(snapshot)
+
+def redo_button_handler(x) :
+    snapshot = view_history.redo()
+    if snapshot != None :
+        show_view(snapshot)
 
 def juliabrot_button_handler(x) :
     global jgrid
@@ -337,11 +431,11 @@ def zoom_button_handler(x) :
             jgrid.settings.lrX = start_lrX
             jgrid.settings.lrY = start_lrY
         else :
-            zoom_value = np.longdouble(1.0) / zoom_slider.value
-            center_X = (jgrid.settings.ulX + jgrid.settings.lrX) * .5
-            center_Y = (jgrid.settings.ulY + jgrid.settings.lrY) * .5
-            x_span = zoom_value * (jgrid.settings.lrX - jgrid.settings.ulX) * .5
-            y_span = zoom_value * (jgrid.settings.lrY - jgrid.settings.ulY) * .5
+            zoom_value = _to_fixed(1) / _to_fixed(zoom_slider.value)
+            center_X = (jgrid.settings.ulX + jgrid.settings.lrX) / 2
+            center_Y = (jgrid.settings.ulY + jgrid.settings.lrY) / 2
+            x_span = zoom_value * (jgrid.settings.lrX - jgrid.settings.ulX) / 2
+            y_span = zoom_value * (jgrid.settings.lrY - jgrid.settings.ulY) / 2
             ulx = center_X - x_span
             uly = center_Y - y_span
             lrx = center_X + x_span
@@ -360,16 +454,21 @@ def zoom_button_handler(x) :
 
 def iter_slider_handler(x) :
     global jgrid
+    if _restoring_view == True :
+        return
     jgrid.settings.max_iterations = int(iter_slider.value)
+    if hasattr(juliabrot, 'keep_state') :
+        # A software engine keeps its running points from here on, so further raises resume them
+        juliabrot.keep_state = True
     display_info(canvases, jgrid)
     draw_fractal(canvases, jgrid.tile_list)
 
 def color_select_handler(x) :
-    show_canvas(canvases, jgrid.tile_list)
+    request_recolor()
     
     
 def color_picker1_handler(x) :
-    show_canvas(canvases, jgrid.tile_list)
+    request_recolor()
 
 def color_picker2_handler(x) :
     show_canvas(canvases, jgrid.tile_list)
@@ -378,16 +477,16 @@ def color_picker3_handler(x) :
     show_canvas(canvases, jgrid.tile_list)
 
 def hue_slider_handler(x) :
-    show_canvas(canvases, jgrid.tile_list)
+    request_recolor()
 
 def sat_slider_handler(x) :
-    show_canvas(canvases, jgrid.tile_list)
+    request_recolor()
 
 def val_slider_handler(x) :
-    show_canvas(canvases, jgrid.tile_list)
+    request_recolor()
 
 def modulo_slider_handler(x) :
-    show_canvas(canvases, jgrid.tile_list)
+    request_recolor()
 
 #########################################################
 #  Setup of GUI
@@ -475,6 +574,8 @@ def draw_roaming_ui() :
     juliabrot_button.on_click(juliabrot_button_handler)
     undo_button = Button(description='Undo', disabled=False, button_style='', tooltip='Click to revert to last view', icon='')
     undo_button.on_click(undo_button_handler)
+    redo_button = Button(description='Redo', disabled=False, button_style='', tooltip='Click to go forward to the view before undo', icon='')
+    redo_button.on_click(redo_button_handler)
     bleft_button = Button(description='Bump L', disabled=False, button_style='', tooltip='Click to nudge left num bump LR pixels', icon='')
     bleft_button.on_click(bleft_button_handler)
     bright_button = Button(description='Bump R', disabled=False, button_style='', tooltip='Click to nudge right num bump LR pixels', icon='')
@@ -493,4 +594,4 @@ def draw_roaming_ui() :
     color_list.observe(color_select_handler, names='value')
     draw_fractal(canvases, jgrid.tile_list)
     display_info(canvases, jgrid)
-    return AppLayout(center=canvases, header=HBox((iter_slider, bump_ud_slider, bump_lr_slider, zoom_slider)), right_sidebar=VBox((picker1, color_list, hue_slider, sat_slider, val_slider, modulo_slider)), footer=HBox((bleft_button, bright_button, bup_button, bdown_button, color_it_button, juliabrot_button, reset_button, undo_button, save_button)))
+    return AppLayout(center=canvases, header=HBox((iter_slider, bump_ud_slider, bump_lr_slider, zoom_slider)), right_sidebar=VBox((picker1, color_list, hue_slider, sat_slider, val_slider, modulo_slider)), footer=HBox((bleft_button, bright_button, bup_button, bdown_button, color_it_button, juliabrot_button, reset_button, undo_button, redo_button, save_button)))
@@ -0,0 +1,21 @@
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from juliabrot import JuliabrotGridSettings
+
+
+def make_settings(ul=(-2.5, 1.0), lr=(1.0, -1.0), size=(452, 100), max_iterations=300, precision='longdouble') :
+    '''Mandelbrot settings for the tests, exact precision keeps the coordinates as rationals'''
+    s = JuliabrotGridSettings()
+    s.sizeX, s.sizeY = size
+    s.max_iterations = max_iterations
+    s.mandelbrot_mode = True
+    s.ulX, s.ulY, s.lrX, s.lrY = map(np.longdouble, ul + lr)
+    s.cX = s.cY = np.longdouble(0)
+    if precision == 'exact' :
+        s.set_precision('exact')
+    return s
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from conftest import make_settings
+from juliabrot import Juliabrot, JuliabrotGrid
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_perturb import JuliabrotPerturb
+from juliabrot_emu import EmuOverlay
+from juliabrot_adaptive import JuliabrotMarianiSilver
+
+
+def _tile() :
+    return JuliabrotGrid(make_settings(size=(240, 138), max_iterations=300)).tile_list[0]
+
+
+@pytest.mark.parametrize('nk', [4, 6, 8])
+def test_pl_never_computes_more_than_the_frame(nk) :
+    ref = JuliabrotCpu().compute(_tile()).data.iterations
+    ms = JuliabrotMarianiSilver(Juliabrot(64, overlay=EmuOverlay(nk=nk, kernel='float64')))
+    tile = ms.compute(_tile())
+    assert np.array_equal(tile.data.iterations, ref)
+    assert ms.stats['computed'] + ms.stats['skipped'] == 240 * 138
+    assert ms.stats['skipped'] > 0
+
+
+def test_perturb_uses_one_reference_orbit(monkeypatch) :
+    engine = JuliabrotPerturb()
+    orbits = []
+    reference_orbit = engine._reference_orbit
+    monkeypatch.setattr(engine, '_reference_orbit', lambda *args : orbits.append(1) or reference_orbit(*args))
+    ms = JuliabrotMarianiSilver(engine)
+    tile = ms.compute(_tile())
+    assert len(orbits) == 1
+    assert np.array_equal(tile.data.iterations, JuliabrotPerturb().compute(_tile()).data.iterations)
+    assert ms.stats['computed'] + ms.stats['skipped'] == 240 * 138
@@ -0,0 +1,18 @@
+import numpy as np
+
+from conftest import make_settings
+from juliabrot import Juliabrot
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_emu import EmuOverlay
+from juliabrot_animate import JuliabrotAnimation
+
+
+def test_unaligned_frames_on_pl_match_cpu(tmp_path) :
+    '''250 columns are not a multiple of 6, PL frames are padded and cropped back'''
+    anim = JuliabrotAnimation([(0, make_settings(ul=(-2.5, 1.0), lr=(1.0, -1.0), size=(250, 100), max_iterations=100)),
+                               (3, make_settings(ul=(-1.0, 0.2), lr=(-0.5, 0.0), size=(250, 100), max_iterations=200))])
+    pl = str(tmp_path / 'pl.rgb')
+    cpu = str(tmp_path / 'cpu.rgb')
+    assert anim.render(Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64')), pl, fmt='raw')['rendered'] == 4
+    anim.render(JuliabrotCpu(), cpu, fmt='raw')
+    assert np.array_equal(np.fromfile(pl, dtype=np.uint8), np.fromfile(cpu, dtype=np.uint8))
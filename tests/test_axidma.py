@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from axidma import DmaRxRing
+
+
+class FakeChannel :
+    '''Stands in for a pynq.lib.dma receive channel, a transfer lands on wait()'''
+    def __init__(self, packets) :
+        self.packets = list(packets)
+        self.log = []
+        self._armed = None
+
+    def transfer(self, buf) :
+        assert self._armed is None, 'a simple mode channel runs one transfer at a time'
+        self._armed = buf
+        self.log.append(('transfer', id(buf)))
+
+    def wait(self) :
+        pkt = self.packets.pop(0)
+        self._armed[:len(pkt)] = pkt
+        self._armed = None
+        self.log.append(('wait', None))
+
+
+class FakeBuffers :
+    def __init__(self) :
+        self.live = 0
+
+    def make_cma_buf(self, shape, data_type) :
+        self.live += 1
+        return np.zeros(shape, dtype=data_type)
+
+    def del_cma_buf(self, cma_buf) :
+        self.live -= 1
+
+
+@pytest.mark.parametrize('n_bufs', [2, 3])
+@pytest.mark.parametrize('n_pkts, last', [(1, 0), (5, 0), (4, 7)])
+def test_ring_arms_next_transfer_before_yielding(n_bufs, n_pkts, last) :
+    pkt_size = 16
+    packets = [np.arange(pkt_size, dtype=np.uint32) + 100 * i for i in range(n_pkts)]
+    if last > 0 :
+        packets.append(np.arange(last, dtype=np.uint32) + 100 * n_pkts)
+    channel = FakeChannel(packets)
+    factory = FakeBuffers()
+    ring = DmaRxRing(channel, factory, n_bufs)
+    ring.resize((pkt_size,), np.uint32)
+    assert factory.live == n_bufs
+
+    received = []
+    for i, pkt in enumerate(ring.stream(n_pkts, pkt_size, last)) :
+        # Packet i is in hand, the transfer of packet i+1 must already be running
+        n_transfers = sum(1 for op, _ in channel.log if op == 'transfer')
+        assert n_transfers == min(i + 2, len(packets))
+        received.append(np.array(pkt))
+    assert len(received) == len(packets)
+    for got, sent in zip(received, packets) :
+        assert np.array_equal(got, sent)
+    # Buffers are used round robin
+    bufs = [b for op, b in channel.log if op == 'transfer']
+    assert bufs == [id(ring.bufs[i % n_bufs]) for i in range(len(packets))]
+
+    ring.resize((pkt_size,), np.uint32)
+    assert factory.live == n_bufs
+    ring.free()
+    assert factory.live == 0
@@ -0,0 +1,35 @@
+import os
+import numpy as np
+
+from conftest import ROOT
+from juliabrot import Juliabrot, JuliabrotGrid, JuliabrotGridSettings
+from juliabrot_emu import EmuOverlay
+from juliabrot_cache import RenderCache
+
+PRESET = 'catalog/juliabrot_0x50cb5253_07_09_2020-21_07_42.json'
+
+
+def _preset() :
+    settings = JuliabrotGridSettings()
+    settings.load_json(os.path.join(ROOT, PRESET))
+    settings.max_iterations = 500
+    return settings
+
+
+def test_revisit_unaligned_preset_on_pl(tmp_path) :
+    '''The 452 wide preset is padded by the PL (nk=6), a revisit on a fresh grid must hit'''
+    engine = Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64'))
+    cache = RenderCache(disk_path=str(tmp_path))
+
+    first = JuliabrotGrid(_preset())
+    tile = cache.compute(engine, first.tile_list[0])
+    assert int(first.settings.sizeX) == 452
+    assert [int(l) for l in tile.limits] == [0, 0, 451, 299]
+    assert tile.data.iterations.shape == (300, 452)
+    computed = tile.data.iterations.copy()
+
+    for c in (cache, RenderCache(disk_path=str(tmp_path))) :
+        again = JuliabrotGrid(_preset())
+        assert c.get(again.tile_list[0]) == True
+        assert [int(l) for l in again.tile_list[0].limits] == [0, 0, 451, 299]
+        assert np.array_equal(again.tile_list[0].data.iterations, computed)
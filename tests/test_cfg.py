@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from fractions import Fraction
+
+from conftest import make_settings
+from juliabrot import JuliabrotGrid, JuliabrotTile
+import juliabrot_cfg
+
+
+# The per value encoder juliabrot_cfg replaced, kept as the reference
+def _to_fixed256(x) :
+    if isinstance(x, Fraction) :
+        return juliabrot_cfg.fraction_to_fixed256(x)
+    i = int(x)
+    f = x - i
+    if i > 3 :
+        i = 3
+    elif i < -3 :
+        i = -3
+    x = i + f
+    return int(np.longdouble(x) * (2.0 ** 253))
+
+def _fixed256_to_int32_oct(x) :
+    h = int(x).to_bytes(32, byteorder='big', signed=True).hex()
+    return [int(h[k:k + 8], base=16) for k in range(56, -8, -8)]
+
+def _reference_words(values) :
+    return np.array([_fixed256_to_int32_oct(_to_fixed256(v)) for v in values], dtype=np.uint32)
+
+
+def _values(n, seed=0) :
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(-4.5, 4.5, n).astype(np.longdouble)
+    # Tiny steps, exact zeros and values on the clamp edges
+    x[:n // 4] *= np.longdouble(2.0) ** -rng.integers(1, 200, n // 4)
+    x[n // 4:n // 4 + 4] = [0, 3, -3, np.longdouble(-0.0)]
+    return list(x)
+
+
+@pytest.mark.parametrize('n', [1, 6, juliabrot_cfg._N_VECTOR_MIN - 1, juliabrot_cfg._N_VECTOR_MIN, 1000])
+def test_fixed256_words_matches_reference(n) :
+    '''Below _N_VECTOR_MIN values the scalar path runs, from it on the NumPy one'''
+    values = _values(max(n, 8))[:n]
+    assert np.array_equal(juliabrot_cfg.fixed256_words(values), _reference_words(values))
+
+
+def test_fixed256_words_fractions() :
+    values = [Fraction(1, 3), Fraction(-7, 768), Fraction(22, 7), Fraction(-5, 1), np.longdouble(0.25)]
+    assert np.array_equal(juliabrot_cfg.fixed256_words(values), _reference_words(values))
+
+
+@pytest.mark.parametrize('precision', ['longdouble', 'exact'])
+def test_cfg_words_fields(precision) :
+    settings = make_settings(ul=(-2.0, 1.2), lr=(1.0, -0.5), size=(384, 216), max_iterations=777, precision=precision)
+    settings.cX = settings.coord(np.longdouble(-0.8))
+    settings.cY = settings.coord(np.longdouble(0.156))
+    grid = JuliabrotGrid(settings)
+    grid.tile_list = []
+    tiles = [JuliabrotTile(grid, (0, 0, 383, 215)), JuliabrotTile(grid, (12, 40, 99, 59))]
+    cfg, pkts = juliabrot_cfg.create_cfg_words(tiles)
+    assert cfg.shape == (2, juliabrot_cfg.CFG_N_WORDS)
+
+    h = (Fraction(1) - Fraction(-2)) / 384
+    q_h = juliabrot_cfg.fraction_to_fixed256(h)
+    for t, tile in enumerate(tiles) :
+        w = cfg[t]
+        assert list(w[0:3]) == [1, int(tile.sizeX), int(tile.sizeY)]
+        assert w[51] == 777
+        assert w[52] == pkts[t][1]
+        # Exact step, origins whole steps from the grid corner
+        x0 = juliabrot_cfg.fraction_to_fixed256(Fraction(-2)) + q_h * int(tile.limits[0])
+        y0 = juliabrot_cfg.fraction_to_fixed256(Fraction(*np.longdouble(1.2).as_integer_ratio())) - q_h * int(tile.limits[1])
+        assert np.array_equal(w[3:35].reshape(4, 8), _reference_words([x0 / Fraction(2 ** 253), y0 / Fraction(2 ** 253), h, h]))
+        assert np.array_equal(w[35:51].reshape(2, 8), _reference_words([settings.cX, settings.cY]))
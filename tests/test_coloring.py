@@ -0,0 +1,28 @@
+import numpy as np
+
+from conftest import make_settings
+from juliabrot import JuliabrotGrid
+from juliabrot_cpu import JuliabrotCpu
+import juliabrot_coloring as jcolor
+
+
+def test_full_luts_bounded_by_bytes(monkeypatch) :
+    monkeypatch.setattr(jcolor, 'FULL_LUT_CACHE_BYTES', 1 << 20)
+    first = jcolor.palette_lut('rainbow', 1.0, 1.0, 1.0, 255, 100000, '#000000', None, True)
+    assert jcolor.palette_lut('rainbow', 1.0, 1.0, 1.0, 255, 100000, '#000000', None, True) is first
+    for max_iter in range(100001, 100020) :
+        lut = jcolor.palette_lut('rainbow', 1.0, 1.0, 1.0, 255, max_iter, '#000000', None, True)
+        assert lut.shape == (max_iter + 1, 3)
+    assert jcolor._full_luts_bytes <= 1 << 20
+    assert jcolor._full_luts_bytes == sum(l.nbytes for l in jcolor._full_luts.values())
+    # Same colors as the modulo sized LUT
+    small = jcolor.palette_lut('rainbow', 1.0, 1.0, 1.0, 255, 100000)
+    assert np.array_equal(first[:-1], small[np.arange(100000) % 255])
+    assert np.array_equal(first[-1], small[255])
+
+
+def test_color_bands_matches_whole_tile() :
+    tile = JuliabrotCpu().compute(JuliabrotGrid(make_settings(size=(100, 60))).tile_list[0])
+    gray = lambda t, h, s, v, modulo, colors : np.repeat((t.data.iterations % 256).astype(np.uint8)[:, :, None], 3, axis=2)
+    for func in (jcolor.color_rainbow, jcolor.color_log, gray) :
+        assert np.array_equal(jcolor.color_bands(tile, func, band_rows=7), func(tile, 1.0, 1.0, 1.0, 255, None))
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+
+from conftest import ROOT, make_settings
+from juliabrot import JuliabrotGrid
+from juliabrot_cpu import JuliabrotCpu
+import juliabrot_bench
+
+
+def _brute() :
+    return JuliabrotCpu(interior_check=False, periodicity_tol=-1, keep_state=False)
+
+
+SCENES = juliabrot_bench.load_scenes(os.path.join(ROOT, 'catalog'))
+
+
+@pytest.mark.parametrize('scene, preset', SCENES, ids=[name for name, _ in SCENES])
+def test_shortcuts_match_brute_force_on_catalog(scene, preset) :
+    settings = juliabrot_bench.scene_settings(preset, 96, min(int(preset.max_iterations), 3000))
+    fast = JuliabrotCpu(keep_state=False).compute(JuliabrotGrid(settings).tile_list[0])
+    slow = _brute().compute(JuliabrotGrid(settings).tile_list[0])
+    assert np.array_equal(fast.data.iterations, slow.data.iterations)
+
+
+_ITERATE = JuliabrotCpu._iterate
+
+
+def _count_iterated(monkeypatch, engine, settings) :
+    # Points handed to _iterate and points still running when it hits max_iterations
+    counts = [0, 0]
+
+    def counted(self, cr, ci, zr, zi, max_iter, out, progress_report=False, k0=0, state=None) :
+        st = {} if state == None else state
+        _ITERATE(self, cr, ci, zr, zi, max_iter, out, progress_report, k0, st)
+        counts[0] += cr.size
+        counts[1] += st['idx'].size
+
+    monkeypatch.setattr(JuliabrotCpu, '_iterate', counted)
+    engine.compute(JuliabrotGrid(settings).tile_list[0])
+    return counts
+
+
+@pytest.mark.parametrize('max_iter', [1000, 10000])
+def test_shortcuts_skip_interior_work(monkeypatch, max_iter) :
+    '''A view mostly inside the main cardioid, brute force runs every interior point to the limit'''
+    settings = make_settings(ul=(-1.0, 0.45), lr=(0.2, -0.45), size=(120, 90), max_iterations=max_iter)
+    brute = _count_iterated(monkeypatch, _brute(), settings)
+    fast = _count_iterated(monkeypatch, JuliabrotCpu(keep_state=False), settings)
+    assert brute[0] == 120 * 90
+    # The cardioid/bulb test keeps most points out of the loop, periodicity ends almost all the rest
+    assert fast[0] * 5 < brute[0]
+    assert fast[1] * 20 < brute[1]
+
+
+def test_resume_is_opt_in() :
+    settings = make_settings(size=(80, 60), max_iterations=200)
+    tile = JuliabrotGrid(settings).tile_list[0]
+    assert JuliabrotCpu().compute(tile).data.z == None
+
+    engine = JuliabrotCpu(keep_state=True)
+    engine.compute(tile)
+    assert tile.data.z != None
+    settings.max_iterations = 2000
+    engine.compute(tile)
+    fresh = JuliabrotCpu().compute(JuliabrotGrid(make_settings(size=(80, 60), max_iterations=2000)).tile_list[0])
+    assert np.array_equal(tile.data.iterations, fresh.data.iterations)
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from cv2 import imread
+
+from conftest import make_settings
+from juliabrot import Juliabrot, JuliabrotGrid
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_emu import EmuOverlay
+from juliabrot_export import render_png
+import juliabrot_coloring as jcolor
+
+
+@pytest.mark.parametrize('color_func', [jcolor.color_rainbow, jcolor.color_log])
+def test_render_png_unaligned_width_on_pl(tmp_path, color_func) :
+    '''452 columns on the PL (nk=6): the bands are padded but the image is the CPU render's'''
+    grid = JuliabrotGrid(make_settings(size=(452, 100), max_iterations=300))
+    filename = str(tmp_path / 'out.png')
+    render_png(Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64')), grid, filename, color_func, band_rows=32)
+    assert int(grid.settings.sizeX) == 452
+
+    ref = JuliabrotCpu().compute(JuliabrotGrid(make_settings(size=(452, 100), max_iterations=300)).tile_list[0])
+    # cv2 reads BGR
+    assert np.array_equal(imread(filename)[:, :, ::-1], color_func(ref))
@@ -0,0 +1,37 @@
+import numpy as np
+
+from conftest import make_settings
+from juliabrot import JuliabrotGrid
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_cache import RenderCache
+from juliabrot_history import ViewHistory
+
+
+def test_undo_restores_iterations_from_the_cache() :
+    engine = JuliabrotCpu()
+    cache = RenderCache()
+    history = ViewHistory(cache)
+    grid = JuliabrotGrid(make_settings(size=(64, 40), max_iterations=200))
+    cache.compute(engine, grid.tile_list[0])
+    first = grid.tile_list[0].data.iterations.copy()
+    history.push(grid)
+
+    grid.settings.ulX, grid.settings.lrX = grid.settings.coord(-1.5), grid.settings.coord(0.5)
+    grid.tile_list[0].free_data()
+    cache.compute(engine, grid.tile_list[0])
+    history.push(grid)
+    assert len(cache._entries) == 2
+
+    snapshot = history.undo()
+    assert snapshot.restore(grid) == True
+    assert grid.settings.lrX == grid.settings.coord(1.0)
+    assert np.array_equal(grid.tile_list[0].data.iterations, first)
+    # Nothing kept outside the cache
+    assert not hasattr(snapshot, '__dict__')
+    assert len(cache._entries) == 2
+
+    # Evicted from the cache, the view comes back without data
+    cache.clear()
+    assert history.redo().restore(grid) == False
+    assert grid.tile_list[0].data == None
+    assert grid.settings.lrX == grid.settings.coord(0.5)
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+
+from conftest import make_settings
+from juliabrot import Juliabrot, JuliabrotGrid, JuliabrotTile
+from juliabrot_emu import EmuOverlay
+
+
+def _rows(n) :
+    # n tiles of 8 full rows each, every one with its own iterations
+    grid = JuliabrotGrid(make_settings(size=(96, 8 * n), max_iterations=200))
+    return [JuliabrotTile(grid, (0, 8 * i, 95, 8 * i + 7)) for i in range(n)]
+
+
+def _reference(tiles) :
+    engine = Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64'))
+    return [np.array(engine.compute(t).data.iterations) for t in tiles]
+
+
+def test_queue_is_fifo_across_submit_batch_async_and_compute() :
+    tiles = _rows(8)
+    expected = _reference(_rows(8))
+    engine = Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64', latency=0.002), max_in_flight=3)
+
+    async def interleaved() :
+        first = engine.submit(tiles[0])
+        batch = engine.submit_batch(tiles[1:4])
+        # Queued behind the batch while it is still in flight
+        awaited = await engine.compute_async(tiles[4])
+        later = engine.submit(tiles[5])
+        # compute() queues behind everything submitted before it
+        computed = engine.compute(tiles[6])
+        batch_end = engine.submit_batch(tiles[7:])
+        return [first.result()] + [f.result() for f in batch] + [awaited, later.result(), computed] + \
+               [f.result() for f in batch_end]
+
+    got = asyncio.run(interleaved())
+    engine.close()
+    for tile, result, ref in zip(tiles, got, expected) :
+        assert result is tile
+        assert np.array_equal(result.data.iterations, ref)
+
+
+def test_compute_races_submit_from_threads() :
+    tiles = _rows(40)
+    expected = _reference(_rows(40))
+    engine = Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64', latency=0.0005), max_in_flight=2)
+    futures = {}
+
+    def submitter() :
+        for i in range(0, 40, 2) :
+            futures[i] = engine.submit(tiles[i])
+
+    def computer() :
+        for i in range(1, 40, 2) :
+            engine.compute(tiles[i])
+
+    threads = [threading.Thread(target=submitter), threading.Thread(target=computer)]
+    for t in threads :
+        t.start()
+    for t in threads :
+        t.join()
+    engine.wait_all()
+    engine.close()
+    for i in range(40) :
+        assert np.array_equal(tiles[i].data.iterations, expected[i])
+
+
+@pytest.mark.parametrize('pkt_size', [-1, 1000])
+def test_zero_copy_iterations_are_the_cma_buffer(pkt_size) :
+    overlay = EmuOverlay(nk=6, kernel='float64')
+    made = []
+    freed = []
+    make_cma_buf = overlay.iter_dma.make_cma_buf
+
+    def make(shape, data_type) :
+        made.append(make_cma_buf(shape, data_type))
+        return made[-1]
+
+    overlay.iter_dma.make_cma_buf = make
+    overlay.iter_dma.del_cma_buf = freed.append
+    engine = Juliabrot(64, zero_copy=True, overlay=overlay)
+    settings = make_settings(size=(96, 40), max_iterations=200)
+    tile = JuliabrotGrid(settings).tile_list[0]
+    expected = _reference([JuliabrotGrid(settings).tile_list[0]])[0]
+    # 1000 pixels a packet leaves a short last packet
+    engine._config(tile, pkt_size)
+    engine._fetch_iter()
+    assert len(made) == 1
+    assert np.shares_memory(tile.data.iterations, made[0])
+    assert tile.data.iterations.base is made[0]
+    assert np.array_equal(tile.data.iterations, expected)
+    tile.free_data()
+    assert len(freed) == 1 and freed[0] is made[0]
+    assert tile.data == None
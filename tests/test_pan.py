@@ -0,0 +1,71 @@
+import os
+import copy
+import numpy as np
+import pytest
+
+from conftest import ROOT, make_settings
+from juliabrot import Juliabrot, JuliabrotGrid, JuliabrotGridSettings, compute_aligned
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_emu import EmuOverlay
+from juliabrot_pan import pan_grid
+
+
+def _iterations(grid) :
+    settings = grid.settings
+    return np.asarray(grid.tile_list[0].data.iterations).reshape(int(settings.sizeY), int(settings.sizeX))
+
+
+@pytest.mark.parametrize('engine', ['pl', 'cpu'])
+@pytest.mark.parametrize('precision', ['longdouble', 'exact'])
+@pytest.mark.parametrize('dx, dy', [(0, 3), (0, -4), (9, -2), (-13, 11)])
+def test_pan_matches_full_compute(engine, precision, dx, dy) :
+    '''A 3 wide view over 384 columns has a dyadic step, every pan reuses the old pixels'''
+    if engine == 'pl' :
+        engine = Juliabrot(64, overlay=EmuOverlay(nk=4, kernel='float64'))
+    else :
+        engine = JuliabrotCpu()
+    grid = JuliabrotGrid(make_settings(ul=(-2.25, 1.125), lr=(0.75, -0.5625), size=(384, 216),
+                                       max_iterations=1000, precision=precision))
+    engine.compute(grid.tile_list[0])
+    assert pan_grid(engine, grid, dx, dy) == True
+
+    full = JuliabrotGrid(copy.copy(grid.settings))
+    engine.compute(full.tile_list[0])
+    assert np.array_equal(_iterations(grid), _iterations(full))
+
+
+@pytest.mark.parametrize('precision', ['longdouble', 'exact'])
+@pytest.mark.parametrize('dx, dy', [(5, 0), (-7, 3), (0, -2)])
+def test_pan_unaligned_width_on_pl(precision, dx, dy) :
+    '''452 columns are not a multiple of 6, strips are padded by the PL but the grid keeps its size'''
+    engine = Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64'))
+    # 113/64 wide over 452 columns is a step of 1/256
+    settings = make_settings(ul=(-2.0, 0.421875), lr=(-0.234375, -0.421875), size=(452, 216),
+                             max_iterations=500, precision=precision)
+    grid = JuliabrotGrid(settings)
+    compute_aligned(engine, grid.tile_list[0])
+    assert pan_grid(engine, grid, dx, dy) == True
+    assert int(grid.settings.sizeX) == 452
+
+    full = JuliabrotGrid(copy.copy(grid.settings))
+    compute_aligned(engine, full.tile_list[0])
+    assert np.array_equal(_iterations(grid), _iterations(full))
+    ref = JuliabrotCpu().compute(JuliabrotGrid(copy.copy(grid.settings)).tile_list[0])
+    assert np.array_equal(_iterations(grid), ref.data.iterations)
+
+
+def test_pan_catalog_preset_in_exact_precision() :
+    '''What the UI does: a longdouble preset switched to exact pans incrementally'''
+    settings = JuliabrotGridSettings()
+    settings.load_json(os.path.join(ROOT, 'catalog', 'juliabrot_0x50cb5253_07_09_2020-21_07_42.json'))
+    settings.max_iterations = 300
+    settings.sizeX, settings.sizeY = 113, 75
+    settings.set_precision('exact')
+    engine = JuliabrotCpu()
+    grid = JuliabrotGrid(settings)
+    engine.compute(grid.tile_list[0])
+    for dx, dy in [(5, 0), (-3, 0), (0, 4)] :
+        assert pan_grid(engine, grid, dx, dy) == True
+    full = JuliabrotGrid(copy.copy(grid.settings))
+    engine.compute(full.tile_list[0])
+    assert np.array_equal(_iterations(grid), _iterations(full))
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from conftest import make_settings
+from juliabrot import JuliabrotGrid, JuliabrotTile
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_parallel import JuliabrotParallel
+
+
+@pytest.mark.parametrize('split, chunk', [('rows', None), ('rows', 7), ('tiles', None), ('tiles', 23)])
+def test_splits_match_cpu(split, chunk) :
+    settings = make_settings(size=(150, 90), max_iterations=300, precision='exact')
+    grid = JuliabrotGrid(settings)
+    # An inner tile, so the pieces' limits are offset from the grid origin
+    tile = JuliabrotTile(grid, (11, 5, 139, 81))
+    ref = JuliabrotCpu(keep_state=False).compute(JuliabrotTile(JuliabrotGrid(settings), (11, 5, 139, 81)))
+    engine = JuliabrotParallel(n_procs=2, split=split, chunk=chunk)
+    try :
+        engine.compute(tile)
+    finally :
+        engine.close()
+    assert tile.data.iterations.shape == (77, 129)
+    assert np.array_equal(tile.data.iterations, ref.data.iterations.reshape(77, 129))
+
+
+def test_free_releases_shared_memory() :
+    grid = JuliabrotGrid(make_settings(size=(64, 48), max_iterations=100))
+    engine = JuliabrotParallel(n_procs=2)
+    try :
+        tile = engine.compute(grid.tile_list[0])
+        shm = tile.data._shm
+        assert shm != None
+        assert np.shares_memory(tile.data.iterations, np.frombuffer(shm.buf, dtype=np.uint32))
+        # A view handed out elsewhere keeps the mapping alive past free()
+        view = tile.data.iterations[10]
+        expected = view.copy()
+        tile.free_data()
+        assert tile.data == None
+        assert np.array_equal(view, expected)
+        del view
+        tile = engine.compute(grid.tile_list[0])
+        shm = tile.data._shm
+        tile.free_data()
+        assert shm.buf == None
+    finally :
+        engine.close()
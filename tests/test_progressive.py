@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from conftest import make_settings
+from juliabrot import Juliabrot, JuliabrotGrid
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_emu import EmuOverlay
+from juliabrot_cache import RenderCache
+from juliabrot_progressive import JuliabrotProgressive
+
+
+@pytest.mark.parametrize('nk', [4, 6])
+def test_passes_unaligned_width_on_pl(nk) :
+    '''452 columns: not a multiple of 6, and not of 8 for the coarse passes with nk=4'''
+    engine = Juliabrot(64, overlay=EmuOverlay(nk=nk, kernel='float64'))
+    grid = JuliabrotGrid(make_settings(size=(452, 100), max_iterations=300))
+    tile = grid.tile_list[0]
+    ref = JuliabrotCpu().compute(JuliabrotGrid(make_settings(size=(452, 100), max_iterations=300)).tile_list[0]).data.iterations
+    cache = RenderCache()
+    key = cache.key(tile)
+    passes = list(JuliabrotProgressive(engine).passes(tile))
+    assert [s for s, _ in passes] == [8, 4, 2, 1]
+    for s, preview in passes :
+        assert preview.shape == (100, 452)
+        # Lattice points of every pass are final pixels
+        assert np.array_equal(preview[::s, ::s], ref[::s, ::s])
+    assert int(grid.settings.sizeX) == 452
+    assert np.array_equal(passes[-1][1], ref)
+    # Same key as before the compute, as draw_progressive caches it
+    assert cache.key(tile) == key
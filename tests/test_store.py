@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from conftest import make_settings
+from juliabrot import Juliabrot, JuliabrotGrid, JuliabrotTile
+from juliabrot_cpu import JuliabrotCpu
+from juliabrot_emu import EmuOverlay
+from juliabrot_store import JuliabrotStore
+
+
+@pytest.mark.parametrize('precision', ['longdouble', 'exact'])
+def test_store_unaligned_width_on_pl(tmp_path, precision) :
+    '''452 columns are not a multiple of 6, the padded PL tiles must land on the unpadded map'''
+    grid = JuliabrotGrid(make_settings(precision=precision))
+    grid.tile_list = []
+    for r in range(0, 100, 25) :
+        JuliabrotTile(grid, (0, r, 451, r + 24))
+    store = JuliabrotStore(str(tmp_path), grid)
+    store.compute(Juliabrot(64, overlay=EmuOverlay(nk=6, kernel='float64')))
+
+    ref = JuliabrotCpu().compute(JuliabrotGrid(make_settings(precision=precision)).tile_list[0])
+    assert int(grid.settings.sizeX) == 452
+    assert np.array_equal(np.asarray(store.iterations), ref.data.iterations)
+    assert store.done[0] == (0, 0, 451, 24)
+
+    reopened = JuliabrotStore(str(tmp_path))
+    assert reopened.is_complete() == True
+    assert reopened.compute(JuliabrotCpu()) == 0
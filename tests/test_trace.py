@@ -0,0 +1,25 @@
+import numpy as np
+
+import juliabrot_trace as jtrace
+
+
+def test_histograms_are_bounded_and_match_the_spans() :
+    rng = np.random.default_rng(1)
+    durations = 10.0 ** rng.uniform(-5, -2, 20000)
+    jtrace.enable(max_events=0)
+    try :
+        for d in durations :
+            jtrace._record('stage', 'juliabrot', 1.0, 1.0 + d, None)
+        # Fixed size per stage whatever the number of spans
+        assert jtrace._stats['stage'][4].size == jtrace._N_BINS
+        h = jtrace.histograms()['stage']
+    finally :
+        jtrace.disable()
+    assert h['count'] == durations.size
+    assert sum(h['counts']) == durations.size
+    assert len(h['edges_s']) == len(h['counts']) + 1
+    assert np.isclose(h['total_s'], durations.sum())
+    assert np.isclose(h['max_s'], durations.max())
+    # Percentiles within a recorded bin, 1/20 decade (12%) wide
+    for q in (50, 90, 99) :
+        assert abs(np.log10(h['p{0}_s'.format(q)] / np.percentile(durations, q))) < 1.0 / 20